@@ -0,0 +1,226 @@
+"""
+Benchmarks at portfolio sizes
+
+Synthetic portfolios scale up the Dummy_Data patterns (assets, type 1 exposures) and the docstring examples
+(natcat sums insured, liability policies, premium & reserve volumes, MCR premiums & technical provisions) to n rows.
+Each sub-module is timed (best of repeat runs) and its peak memory measured with tracemalloc in a separate run.
+Results are saved to a JSON baseline, and later runs compared against it to catch regressions.
+
+Sizes are the number of input rows: assets, type 1 exposures, sums insured, liability policies, volume measures
+rows or MCR entity-periods. div_within_region & natcat_reinsurance run on the cresta volumes & scenario losses of the sums
+insured, whose size is bounded by the cresta zones & scenarios rather than n.
+
+Usage:
+python -m s2sf_tests.benchmark --sizes 1000 100000 --save benchmark.json
+python -m s2sf_tests.benchmark --sizes 1000 100000 --compare benchmark.json
+python -m s2sf_tests.benchmark --sizes 10000000 --only scr_def_t1 spread
+
+Test data:
+res = run_benchmarks([1000], repeat=1)
+regressions(res, res)
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from solvency2sf.default import DEFAULT_PROBS, scr_def_t1
+from solvency2sf.mcr.mcr import get_factors as get_mcr_factors, mcr_batch
+from solvency2sf.mkt import EQUITY_SHOCK_PARAMS, concentration, equity, spread
+from solvency2sf.scr_nl.cat.manmade.manmade import liab
+from solvency2sf.scr_nl.cat.natcat_eur.natcat_eur import cresta_volumes, div_within_region, get_risk_factors, \
+    get_risk_weights, natcat_reinsurance, scenario_losses, specified_loss
+from solvency2sf.scr_nl.cat.reinsurance import EXAMPLE_COVERS, EXAMPLE_PROGRAMS
+from solvency2sf.scr_nl.premres.premres import get_factors as get_premres_factors, scr_nl_premres_batch
+
+SIZES = [1000, 10000, 100000]
+# Countries of the natcat docstring example, covered by the example reinsurance programs
+NATCAT_COUNTRIES = ['DE', 'CH', 'PL']
+PREMRES_REGIONS = ['EE', 'SE', 'WE']
+
+
+### Synthetic data ###
+
+def assets(n, seed=0) -> pd.DataFrame:
+    """ Bonds & equities with the columns of spread, concentration & equity, ~10 assets per counterparty """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'mv': rng.lognormal(10, 1, n),
+        'cc_step': rng.integers(0, 8, n),
+        'duration': rng.uniform(0, 30, n),
+        'exposure_type': 'bonds',
+        'counterparty': rng.integers(0, max(n // 10, 1), n),
+    })
+
+
+def equities(n, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'mv': rng.lognormal(10, 1, n),
+                         'exposure_type': rng.choice(list(EQUITY_SHOCK_PARAMS), n)})
+
+
+def type1(n, seed=0) -> pd.DataFrame:
+    """ Type 1 exposures as Dummy_Data.type_1: banks (category 3) & reinsurers with collateral (category 1) """
+    rng = np.random.default_rng(seed)
+    category = rng.choice([3, 1], n, p=[0.8, 0.2])
+    balance = rng.lognormal(13, 1.5, n)
+    return pd.DataFrame({
+        'balance': balance,
+        'rating': rng.integers(0, len(DEFAULT_PROBS), n),
+        'category': category,
+        'mitigation': np.where(category == 1, 1.6 * balance, 0.),
+    }, index=pd.Index([f'cpty{i}' for i in range(n)]))
+
+
+def sumsinsured(n, seed=0) -> pd.DataFrame:
+    """ Sums insured by hazard, risk, country & cresta zone as the natcat_eur example, n policies """
+    rng = np.random.default_rng(seed)
+    zones = get_risk_weights().loc[NATCAT_COUNTRIES].index
+    zone = rng.integers(0, len(zones), n)
+    factors = get_risk_factors()
+    return pd.DataFrame({
+        'hazard': rng.choice(factors.index.to_numpy(), n),
+        'risk': rng.choice(factors.columns.to_numpy(), n),
+        'country_isocode': zones.get_level_values('country_isocode')[zone],
+        'riskregion': zones.get_level_values('riskregion')[zone],
+        'suminsured': rng.lognormal(12, 1, n),
+    })
+
+
+def volume_measures(n, seed=0) -> pd.DataFrame:
+    """ Premium & reserve volumes as the premres example, entities of regions x NL lobs to make n rows """
+    rng = np.random.default_rng(seed)
+    lobs = get_premres_factors('NL', 'net').index
+    n_entities = max(n // (len(PREMRES_REGIONS) * len(lobs)), 1)
+    index = pd.MultiIndex.from_product((range(n_entities), PREMRES_REGIONS, lobs),
+                                       names=['entity', 's2region', 's2model'])
+    return pd.DataFrame({'vol_p': rng.uniform(0, 20000, len(index)), 'vol_r': rng.uniform(0, 10000, len(index))},
+                        index=index)
+
+
+def liab_vol(n, seed=0) -> pd.DataFrame:
+    """ Liability policies of the man-made liab example: groups 1-5, the natcat countries, a column each """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'grp_liab': rng.integers(1, 6, n),
+        'country': rng.choice(NATCAT_COUNTRIES, n),
+        'gep': rng.lognormal(8, 1, n),
+        'limit_indem': rng.choice([0., 1e5, 1e6], n),
+    })
+
+
+def mcr_inputs(n, seed=0) -> tuple:
+    """ (nwp, tp_nl_net, scr) for n entity-periods """
+    rng = np.random.default_rng(seed)
+    lobs = get_mcr_factors().index
+    nwp = pd.DataFrame(rng.uniform(0, 1000, (n, len(lobs))), columns=lobs)
+    tp_nl_net = pd.DataFrame(rng.uniform(-100, 20000, (n, len(lobs))), columns=lobs)
+    return nwp, tp_nl_net, pd.Series(rng.uniform(1e4, 1e6, n))
+
+
+### Benchmarks ###
+# name: (setup(n) -> args, function), the setup is not timed
+
+def _natcat_setup(n):
+    return cresta_volumes(sumsinsured(n)),
+
+
+def _reinsurance_setup(n):
+    return scenario_losses(specified_loss(sumsinsured(n))),
+
+
+BENCHMARKS = {
+    'spread': (lambda n: (assets(n),), spread),
+    'concentration': (lambda n: (assets(n),), concentration),
+    'equity': (lambda n: (equities(n), 0.05), equity),
+    'scr_def_t1': (lambda n: (type1(n),), scr_def_t1),
+    'cresta_volumes': (lambda n: (sumsinsured(n),), cresta_volumes),
+    'div_within_region': (_natcat_setup, div_within_region),
+    'natcat_reinsurance': (_reinsurance_setup, natcat_reinsurance),
+    'scr_nl_premres': (lambda n: (volume_measures(n),), scr_nl_premres_batch),
+    'manmade_liab': (lambda n: (liab_vol(n), EXAMPLE_PROGRAMS, EXAMPLE_COVERS), liab),
+    'mcr': (mcr_inputs, lambda nwp, tp_nl_net, scr: mcr_batch(nwp, tp_nl_net, scr=scr)),
+}
+
+
+def measure(func, args, repeat=3) -> dict:
+    """ Best time of repeat runs (seconds) & peak memory allocated during a run (MB) """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_mb': peak / 2 ** 20}
+
+
+def run_benchmarks(sizes=SIZES, names=None, repeat=3, verbose=False) -> dict:
+    """ Returns {'meta': versions, 'results': {name: {size: {'time': seconds, 'peak_mb': MB}}}} """
+    results = {}
+    for name in names or BENCHMARKS:
+        setup, func = BENCHMARKS[name]
+        for n in sizes:
+            res = measure(func, setup(n), repeat)
+            results.setdefault(name, {})[str(n)] = res
+            if verbose:
+                print(f"{name:20} {n:>10} {res['time']:10.4f}s {res['peak_mb']:10.1f}MB")
+    meta = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine()}
+    return {'meta': meta, 'results': results}
+
+
+def regressions(results: dict, baseline: dict, time_tolerance=1.5, memory_tolerance=1.2, min_time=0.01) -> list:
+    """
+    Benchmarks slower or using more memory than the baseline by more than the tolerances (ratios)
+    Times shorter than min_time in both runs are ignored, these are mostly noise.
+    Returns a list of (name, size, measure, baseline value, new value)
+    """
+    found = []
+    for name, by_size in results['results'].items():
+        for size, res in by_size.items():
+            base = baseline['results'].get(name, {}).get(size)
+            if base is None:
+                continue
+            if res['time'] > time_tolerance * base['time'] and max(res['time'], base['time']) >= min_time:
+                found.append((name, size, 'time', base['time'], res['time']))
+            if res['peak_mb'] > memory_tolerance * base['peak_mb']:
+                found.append((name, size, 'peak_mb', base['peak_mb'], res['peak_mb']))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the solvency2sf sub-modules')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run, default all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write the results to this JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare against, exit code 1 on regressions')
+    parser.add_argument('--time-tolerance', type=float, default=1.5)
+    parser.add_argument('--memory-tolerance', type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.only, args.repeat, verbose=True)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+        for name, size, what, base, new in found:
+            print(f'REGRESSION {name} {size} {what}: {base:.4f} -> {new:.4f}')
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
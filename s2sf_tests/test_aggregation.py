@@ -0,0 +1,32 @@
+import unittest
+import numpy as np
+from solvency2sf.aggregation import scr_agg, scr_alloc
+
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        self.scr = np.array([[100., 50., 30., 20., 10.],
+                             [0., 20., 0., 0., 300.],
+                             [10., 10., 10., 10., 10.]])
+
+    def test_batch_matches_single(self):
+        agg = scr_agg(self.scr, 'bscr')
+        alloc = scr_alloc(self.scr, 'bscr')
+        for i, x in enumerate(self.scr):
+            self.assertAlmostEqual(agg[i], scr_agg(x, 'bscr'))
+            np.testing.assert_allclose(alloc[i], scr_alloc(x, 'bscr'))
+        np.testing.assert_allclose(alloc.sum(axis=1), agg)
+
+    def test_single(self):
+        self.assertAlmostEqual(scr_agg(self.scr[0], 'bscr'), 146.4581851587681)
+
+    def test_out(self):
+        agg = np.empty(3)
+        alloc = np.empty((3, 5))
+        self.assertIs(scr_agg(self.scr, 'bscr', out=agg), agg)
+        self.assertIs(scr_alloc(self.scr, 'bscr', out=alloc), alloc)
+        np.testing.assert_allclose(alloc.sum(axis=1), agg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from s2sf_tests.benchmark import sumsinsured
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf import parameters
+from solvency2sf.batch import RESULTS, preload, run_entities
+from solvency2sf.mcr.mcr import mcr_batch
+from solvency2sf.standard_formula import StandardFormula
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        dd = Dummy_Data()
+        equities = pd.DataFrame({'mv': [1000., 500.], 'exposure_type': ['type1', 'type2']})
+        self.inputs = {f'E{i}': {'equities': equities.assign(mv=equities.mv * (1 + i)), 'symmetric_adjustment': 0.05,
+                                 'type1': dd.type_1, 'type2': dd.type_2, 'sumsinsured': sumsinsured(50, seed=i),
+                                 'nwp': pd.Series({'mtpl': 500., 'prop': 500.}),
+                                 'tp_nl_net': pd.Series({'mtpl': 20000., 'prop': 21000.})} for i in range(4)}
+        self.inputs['group'] = {'life': 2000.}
+
+    def test_results(self):
+        res, throughput = run_entities(self.inputs)
+        self.assertEqual(list(res.index), list(self.inputs))
+        self.assertEqual(list(res.columns), RESULTS)
+        bundle = {k: v for k, v in self.inputs['E1'].items() if k not in ['nwp', 'tp_nl_net']}
+        expected = StandardFormula().run(bundle)
+        for name in ['mkt_eq', 'def', 'natcat', 'scr']:
+            self.assertAlmostEqual(res.at['E1', name], expected[name])
+        mcr = mcr_batch(pd.DataFrame([self.inputs['E1']['nwp']]), pd.DataFrame([self.inputs['E1']['tp_nl_net']]),
+                        scr=expected['scr'])
+        self.assertAlmostEqual(res.at['E1', 'mcr_linear'], mcr.mcr_linear.iloc[0])
+        # No MCR inputs:
+        self.assertTrue(np.isnan(res.at['group', 'mcr']))
+        self.assertEqual(res.at['group', 'scr'], 2000.)
+        self.assertEqual(throughput.entities.sum(), len(self.inputs))
+
+    def test_processes(self):
+        expected = run_entities(self.inputs)[0]
+        res, throughput = run_entities(self.inputs, processes=2, chunksize=2)
+        pd.testing.assert_frame_equal(res, expected)
+        self.assertEqual(throughput.entities.sum(), len(self.inputs))
+        self.assertTrue((throughput.entities_per_s > 0).all())
+        self.assertNotIn(os.getpid(), throughput.index)
+
+    def test_spawn(self):
+        inputs = {entity: {k: v for k, v in bundle.items() if k != 'sumsinsured'}
+                  for entity, bundle in self.inputs.items()}
+        expected = run_entities(inputs)[0]
+        res, throughput = run_entities(inputs, processes=2, chunksize=2, start_method='spawn')
+        pd.testing.assert_frame_equal(res, expected)
+        self.assertEqual(throughput.entities.sum(), len(inputs))
+
+    def test_preload(self):
+        parameters.invalidate()
+        preload(self.inputs)
+        loaded = {(key[0], key[1]) for key in parameters.snapshot()}
+        self.assertIn(('scr_nl.cat.natcat_eur.natcat_eur.get_zone_corr', ('flood', 'DE')), loaded)
+        self.assertIn(('aggregation.load_corrmat', ('nl_uw',)), loaded)
+
+    def test_output(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'scr.csv')
+            res = run_entities(self.inputs, output=path)[0]
+            pd.testing.assert_frame_equal(pd.read_csv(path, index_col='entity'), res)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_parquet_output(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'scr.parquet')
+            res = run_entities(self.inputs, output=path)[0]
+            pd.testing.assert_frame_equal(pd.read_parquet(path), res)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+from s2sf_tests.benchmark import BENCHMARKS, regressions, run_benchmarks, type1, volume_measures
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_generators(self):
+        self.assertEqual(len(type1(100)), 100)
+        self.assertEqual(len(volume_measures(360)), 360)
+
+    def test_run_and_compare(self):
+        res = run_benchmarks([100], repeat=1)
+        self.assertEqual(set(res['results']), set(BENCHMARKS))
+        self.assertEqual(regressions(res, res), [])
+        slower = {'results': {'spread': {'100': {'time': 10., 'peak_mb': 0.}}}}
+        found = regressions(slower, res)
+        self.assertEqual([(f[0], f[1], f[2]) for f in found], [('spread', '100', 'time')])
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from s2sf_tests.benchmark import assets, sumsinsured, type1, volume_measures
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf.columnar import category_codes, level_codes, read_input, table_to_frame
+from solvency2sf.default import scr_def_t1
+from solvency2sf.mkt import concentration, equity, spread
+from solvency2sf.scr_nl.cat.manmade.manmade import liab, EXAMPLE_COVERS, EXAMPLE_PROGRAMS
+from solvency2sf.scr_nl.cat.natcat_eur.natcat_eur import cresta_volumes
+from solvency2sf.scr_nl.premres.premres import scr_nl_premres_batch
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class TestCodes(unittest.TestCase):
+    def test_category_codes(self):
+        labels = pd.Index(['a', 'b', 'c'])
+        values = ['c', 'x', None, 'a']
+        expected = [2, -1, -1, 0]
+        np.testing.assert_array_equal(category_codes(labels, values), expected)
+        np.testing.assert_array_equal(category_codes(labels, pd.Series(values, dtype='category')), expected)
+
+    def test_level_codes(self):
+        index = pd.MultiIndex.from_product(([1, 2], ['mtpl', 'prop', 'other']), names=['entity', 's2model'])
+        np.testing.assert_array_equal(level_codes(index, 's2model', pd.Index(['prop', 'mtpl'])), [1, 0, -1] * 2)
+
+    def test_categorical_inputs(self):
+        df = assets(1000)
+        cat = df.astype({'exposure_type': 'category'})
+        self.assertAlmostEqual(spread(cat), spread(df))
+        self.assertAlmostEqual(concentration(cat), concentration(df))
+        si = sumsinsured(1000)
+        pd.testing.assert_frame_equal(cresta_volumes(si.astype({'hazard': 'category', 'country_isocode': 'category'})),
+                                      cresta_volumes(si))
+
+
+@unittest.skipIf(pa is None, 'pyarrow not installed')
+class TestParquet(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name, df, **kwargs):
+        path = os.path.join(self.folder.name, name + '.parquet')
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, **kwargs)
+        return path
+
+    def test_assets(self):
+        df = assets(3000).assign(entity=np.repeat(['E1', 'E2', 'E3'], 1000), other=0.)
+        path = self.write('assets', df, row_group_size=1000)
+        read = read_input('assets', path, entities=['E2'])
+        self.assertListEqual(list(read.columns), ['mv', 'cc_step', 'duration', 'exposure_type', 'counterparty'])
+        self.assertIsInstance(read.exposure_type.dtype, pd.CategoricalDtype)
+        self.assertEqual(len(read), 1000)
+        e2 = df.loc[df.entity == 'E2']
+        self.assertAlmostEqual(spread(read), spread(e2))
+        self.assertAlmostEqual(concentration(read), concentration(e2))
+
+    def test_zero_copy(self):
+        table = pa.Table.from_pandas(assets(1000), preserve_index=False)
+        df = table_to_frame(table, categorical=['exposure_type'])
+        # The numpy array is a view of the Arrow buffer
+        buffer = table.column('mv').chunk(0).buffers()[1]
+        self.assertEqual(df.mv.to_numpy().__array_interface__['data'][0], buffer.address)
+        self.assertIsInstance(df.exposure_type.dtype, pd.CategoricalDtype)
+
+    def test_equity(self):
+        df = pd.DataFrame({'mv': [100., 200., 50.], 'exposure_type': ['type1', 'type2', 'infra_corp'],
+                           'cc_step': 7, 'duration': 0.})
+        read = read_input('assets', self.write('equities', df))
+        self.assertAlmostEqual(equity(read, 0.05)['scr'], equity(df, 0.05)['scr'])
+
+    def test_type1(self):
+        df = type1(500)
+        read = read_input('type1', self.write('type1', df.rename_axis('counterparty').reset_index()))
+        self.assertAlmostEqual(scr_def_t1(read, qrt_output=False)[0], scr_def_t1(df, qrt_output=False)[0])
+        self.assertEqual(read.index.name, 'counterparty')
+
+    def test_sumsinsured(self):
+        df = sumsinsured(5000)
+        read = read_input('sumsinsured', self.write('sumsinsured', df))
+        self.assertIsInstance(read.hazard.dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(cresta_volumes(read), cresta_volumes(df))
+
+    def test_liab_vol(self):
+        df = Dummy_Data().liab_vol.rename_axis(['grp_liab', 'country'])
+        read = read_input('liab_vol', self.write('liab_vol', df.reset_index()))
+        pd.testing.assert_frame_equal(liab(read, EXAMPLE_PROGRAMS, EXAMPLE_COVERS),
+                                      liab(df, EXAMPLE_PROGRAMS, EXAMPLE_COVERS))
+
+    def test_volume_measures(self):
+        df = volume_measures(360 * 4)
+        read = read_input('volume_measures', self.write('vm', df.reset_index()), entities=[1, 3])
+        expected = scr_nl_premres_batch(df).loc[[1, 3]]
+        pd.testing.assert_series_equal(scr_nl_premres_batch(read), expected)
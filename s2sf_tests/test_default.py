@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from solvency2sf.default import scr_def, scr_def_t1, scr_def_t1_batch
+from solvency2sf.counterparty import CounterpartyGroups
+from s2sf_tests.dummy_data import Dummy_Data
+
+
+class TestDefaultType1(unittest.TestCase):
+    def setUp(self):
+        self.dd = Dummy_Data()
+
+    def test_expected(self):
+        type_1 = self.dd.type_1.copy()
+        t1, details = scr_def_t1(type_1)
+        self.assertAlmostEqual(t1, self.dd.scr_def_t1_expected, places=4)
+        self.assertTrue(type_1.equals(self.dd.type_1))
+        self.assertIn('lgd', details.columns)
+        self.assertEqual(scr_def_t1(type_1, qrt_output=False), (t1, None))
+        self.assertAlmostEqual(scr_def(self.dd.type_1, self.dd.type_2)[0], self.dd.scr_def_expected, places=4)
+
+    def test_batch_matches_single(self):
+        scales = {('E1', 0): 1., ('E1', 1): 2., ('E2', 0): 0.5, ('E2', 1): -1.}
+        stacked = pd.concat({k: self.dd.type_1.assign(balance=self.dd.type_1.balance * v) for k, v in scales.items()},
+                            names=['entity', 'scenario'])
+        res = scr_def_t1_batch(stacked, ['entity', 'scenario'])
+        expected = [scr_def_t1(self.dd.type_1.assign(balance=self.dd.type_1.balance * v))[0] for v in scales.values()]
+        np.testing.assert_allclose(res.loc[list(scales)].to_numpy(), expected)
+
+    def test_invalid_rating(self):
+        with self.assertRaises(ValueError):
+            scr_def_t1(self.dd.type_1.assign(rating=7))
+
+
+class TestSingleNames(unittest.TestCase):
+    def setUp(self):
+        self.dd = Dummy_Data()
+        rng = np.random.default_rng(3)
+        n = 2000
+        names = np.array([f'cp{i}' for i in range(n)], dtype=object)
+        # Parents always earlier in the list -> no cycles
+        parent = np.where(rng.random(n) < 0.7, names[(rng.random(n) * np.arange(n)).astype(int)], None)
+        parent[0] = None
+        self.parents = pd.Series(parent, index=names)
+
+    def test_ultimate(self):
+        groups = CounterpartyGroups(pd.Series({'A': None, 'A1': 'A', 'A11': 'A1', 'B': None, 'B1': 'B'}))
+        self.assertEqual(groups.ultimate.to_dict(), {'A': 'A', 'A1': 'A', 'A11': 'A', 'B': 'B', 'B1': 'B'})
+        codes, names = groups.codes(['A11', 'B1', 'C'])
+        self.assertEqual(list(names[codes]), ['A', 'B', 'C'])
+        with self.assertRaises(ValueError):
+            CounterpartyGroups(pd.Series({'A': 'B', 'B': 'A'}))
+
+    def test_incremental_update(self):
+        groups = CounterpartyGroups(self.parents)
+        changes = pd.Series({'cp10': 'cp1500', 'cp700': None, 'cp1999': 'cp3', 'new1': 'cp10', 'new2': None})
+        groups.update(changes)
+        parents = self.parents.copy()
+        parents = pd.concat([parents.drop(changes.index, errors='ignore'), changes])
+        expected = CounterpartyGroups(parents).ultimate
+        pd.testing.assert_series_equal(groups.ultimate.sort_index(), expected.sort_index())
+
+    def test_update_cycle(self):
+        groups = CounterpartyGroups(pd.Series({'A': None, 'A1': 'A', 'B': None}))
+        before = groups.parents, groups.ultimate
+        with self.assertRaises(ValueError):
+            groups.update(pd.Series({'A': 'C', 'C': 'A1'}))
+        # Left as before the update, including the new counterparty:
+        pd.testing.assert_series_equal(groups.parents, before[0])
+        pd.testing.assert_series_equal(groups.ultimate, before[1])
+        self.assertEqual(len(groups.ultimate_code), 3)
+
+    def test_csv_roundtrip(self):
+        groups = CounterpartyGroups(self.parents)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'groups.csv')
+            groups.to_csv(path)
+            loaded = CounterpartyGroups.read_csv(path)
+        pd.testing.assert_series_equal(loaded.ultimate, groups.ultimate)
+        pd.testing.assert_series_equal(loaded.parents, groups.parents)
+
+    def test_single_names(self):
+        # No groups -> same as row by row
+        empty = CounterpartyGroups(pd.Series(dtype=object))
+        self.assertAlmostEqual(scr_def_t1(self.dd.type_1, empty)[0], self.dd.scr_def_t1_expected, places=4)
+        groups = CounterpartyGroups(pd.Series({'Bank A': None, 'Bank B': 'Bank A'}))
+        t1, single = scr_def_t1(self.dd.type_1, groups)
+        self.assertEqual(list(single.index), ['Bank A', 'Bank C', 'Reinsurer A'])
+        self.assertAlmostEqual(single.loc['Bank A', 'prob_def'], (0.042 + 0.012) / 2)
+        self.assertGreater(t1, self.dd.scr_def_t1_expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
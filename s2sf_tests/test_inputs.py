@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from s2sf_tests.benchmark import assets, equities, mcr_inputs, sumsinsured, type1, volume_measures
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf.counterparty import CounterpartyGroups
+from solvency2sf.default import scr_def_t1, scr_def_t1_batch
+from solvency2sf.mcr.mcr import mcr_batch
+from solvency2sf.mkt import concentration, equity, spread
+from solvency2sf.scr_nl.cat.manmade.manmade import liab_gross_losses
+from solvency2sf.scr_nl.cat.natcat_eur.natcat_eur import cresta_volumes
+from solvency2sf.scr_nl.premres.premres import scr_nl_premres_batch
+
+
+def read_only(df: pd.DataFrame) -> pd.DataFrame:
+    """ The same frame built on read-only column arrays """
+    columns = {}
+    for c in df.columns:
+        values = df[c].to_numpy().copy()
+        values.setflags(write=False)
+        columns[c] = pd.Series(values, index=df.index, copy=False)
+    return pd.DataFrame(columns, copy=False)
+
+
+class TestInputs(unittest.TestCase):
+    """ The calculations neither modify their inputs nor need writeable arrays """
+
+    def check(self, func, *frames, **kwargs):
+        inputs = [read_only(df) for df in frames]
+        before = [df.copy(deep=True) for df in inputs]
+        func(*inputs, **kwargs)
+        for df, expected in zip(inputs, before):
+            pd.testing.assert_frame_equal(df, expected)
+
+    def test_market(self):
+        self.check(spread, assets(100))
+        self.check(spread, securities=assets(10).rename(columns={'exposure_type': 'type'}).assign(type='resec'))
+        self.check(concentration, assets(100))
+        self.check(equity, equities(100), symmetric_adjustment=0.05)
+
+    def test_default(self):
+        exposures = type1(100).assign(counterparty=np.arange(100) % 7)
+        self.check(scr_def_t1, exposures)
+        self.check(scr_def_t1, exposures, groups=CounterpartyGroups(pd.Series({3: 2, 2: None})))
+        self.check(scr_def_t1_batch, exposures, by='counterparty')
+
+    def test_non_life(self):
+        self.check(cresta_volumes, sumsinsured(100))
+        self.check(scr_nl_premres_batch, volume_measures(100))
+        self.check(liab_gross_losses, Dummy_Data().liab_vol)
+
+    def test_mcr(self):
+        nwp, tp_nl_net, scr = mcr_inputs(10)
+        self.check(mcr_batch, nwp, tp_nl_net, scr=scr)
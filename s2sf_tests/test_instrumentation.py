@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import numpy as np
+
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf import parameters
+from solvency2sf.aggregation import scr_agg
+from solvency2sf.default import scr_def
+from solvency2sf.instrumentation import Profiler, instrumented, profiling, span
+
+
+@instrumented
+def outer(x):
+    with span('test.inner_block', rows=2):
+        inner(x)
+    return inner(x)
+
+
+@instrumented(name='test.inner')
+def inner(x):
+    return [0] * 100000
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_not_profiling(self):
+        profiler = Profiler()
+        self.assertEqual(len(outer([1, 2, 3])), 100000)
+        self.assertEqual(profiler.spans, [])
+
+    def test_spans(self):
+        with profiling(memory=True) as profiler:
+            outer([1, 2, 3])
+        df = profiler.frame()
+        self.assertEqual(sorted(map(tuple, df.path)), [
+            ('test_instrumentation.outer',),
+            ('test_instrumentation.outer', 'test.inner'),
+            ('test_instrumentation.outer', 'test.inner_block'),
+            ('test_instrumentation.outer', 'test.inner_block', 'test.inner')])
+        summary = profiler.summary()
+        self.assertEqual(summary.at['test.inner', 'calls'], 2)
+        self.assertEqual(summary.at['test.inner', 'rows'], 6)
+        top = df.loc[df.name == 'test_instrumentation.outer'].iloc[0]
+        self.assertAlmostEqual(top.self_time, top.time - df.loc[df.path.map(len) == 2, 'time'].sum())
+        # Two lists of 100000 pointers, one still referenced by the returned value
+        self.assertGreater(summary.at['test.inner', 'peak_mb'], 0.7)
+        self.assertGreater(top.peak, 0.7 * 2 ** 20)
+
+    def test_export(self):
+        with profiling() as profiler:
+            outer([1])
+            thread = threading.Thread(target=inner, args=([1],))
+            thread.start()
+            thread.join()
+        folded = profiler.to_collapsed().splitlines()
+        self.assertIn('test_instrumentation.outer;test.inner_block;test.inner', [line.rsplit(' ', 1)[0]
+                                                                                for line in folded])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'trace.json')
+            profiler.to_chrome_trace(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        self.assertEqual(len(events), len(profiler.spans))
+        self.assertEqual(len({e['tid'] for e in events}), 2)
+
+    def test_calculation(self):
+        dd = Dummy_Data()
+        parameters.invalidate()
+        with profiling() as profiler:
+            scr_def(dd.type_1, dd.type_2)
+            scr_agg(np.ones(5), 'bscr')
+            scr_agg(np.ones(5), 'bscr')
+        summary = profiler.summary()
+        self.assertEqual(summary.at['default.scr_def_t1', 'rows'], 4)
+        # The correlation matrix is read once, then cached
+        self.assertEqual(summary.at['aggregation.load_corrmat', 'calls'], 1)
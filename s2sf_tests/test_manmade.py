@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from s2sf_tests.benchmark import liab_vol
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf.scr_nl.cat.manmade.manmade import liab, liab_batch, liab_div_loss, liab_gross_losses, \
+    liab_group_losses, manmade_liab_reinsurance
+from solvency2sf.scr_nl.cat.reinsurance import EXAMPLE_COVERS, EXAMPLE_PROGRAMS, stack_terms
+
+
+class TestLiab(unittest.TestCase):
+    def setUp(self):
+        self.liab_vol = Dummy_Data().liab_vol.rename_axis(['grp_liab', 'country'])
+        policies = liab_vol(2000)
+        self.policies = policies.assign(country=policies.country.where(policies.index % 50 != 0, 'FR'))
+        self.alternatives = [EXAMPLE_PROGRAMS.assign(xol_xs=EXAMPLE_PROGRAMS.xol_xs * 1e4 * f,
+                                                     xol_limit=EXAMPLE_PROGRAMS.xol_limit * 1e5 * f, qs=qs)
+                             for f in [0.5, 1., 2.] for qs in [0., 0.6]]
+
+    def test_dummy_data(self):
+        res = liab(self.liab_vol, EXAMPLE_PROGRAMS, EXAMPLE_COVERS)
+        self.assertAlmostEqual(res.at['manmade_liab', 'gross_loss'], 1246049.7720396244, places=6)
+        self.assertAlmostEqual(res.at['manmade_liab', 'net_loss'], 440221.42233576527, places=6)
+        pd.testing.assert_frame_equal(liab(self.liab_vol.reset_index(), EXAMPLE_PROGRAMS, EXAMPLE_COVERS), res)
+
+    def test_column_layout(self):
+        gross = liab_gross_losses(self.policies)
+        self.assertEqual(list(gross.columns[:2]), ['grp_liab', 'country'])
+        net = manmade_liab_reinsurance(gross)
+        expected = manmade_liab_reinsurance(liab_gross_losses(self.policies.set_index(['grp_liab', 'country'])))
+        pd.testing.assert_series_equal(net.groupby(level=['country', 'grp_liab']).sum(),
+                                       expected.groupby(level=['country', 'grp_liab']).sum())
+
+    def test_group_losses(self):
+        losses, countries = liab_group_losses(self.policies)
+        self.assertEqual(losses.shape, (5, len(countries) + 1))
+        gross = liab_gross_losses(self.policies)
+        expected = gross.gross_loss.groupby([gross.grp_liab, self.policies.country]).sum()
+        for (group, country), loss in expected.items():
+            self.assertAlmostEqual(losses[group - 1, countries.get_loc(country)], loss, places=6)
+
+    def test_alternatives(self):
+        gross, net = liab_batch(self.policies, self.alternatives[0], EXAMPLE_COVERS, stack_terms(self.alternatives))
+        self.assertEqual(net.shape, (len(self.alternatives),))
+        # Each alternative as the per-row reinsurance of manmade_liab_reinsurance:
+        gross_losses = liab_gross_losses(self.policies.set_index(['grp_liab', 'country']))
+        gl = gross_losses.gross_loss.groupby('grp_liab').sum().reindex(range(1, 6), fill_value=0.)
+        self.assertAlmostEqual(gross, liab_div_loss(gl.to_numpy()), places=4)
+        for programs, n in zip(self.alternatives, net):
+            net_losses = manmade_liab_reinsurance(gross_losses, programs, EXAMPLE_COVERS)
+            nl = net_losses.groupby('grp_liab').sum().reindex(range(1, 6), fill_value=0.)
+            self.assertAlmostEqual(n / liab_div_loss(nl.to_numpy()), 1., places=12)
+        self.assertTrue(np.all(net <= gross))
+
+
+if __name__ == '__main__':
+    unittest.main()
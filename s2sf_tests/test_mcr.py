@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from solvency2sf.mcr.mcr import mcr, mcr_batch
+
+
+class TestMCR(unittest.TestCase):
+    def setUp(self):
+        self.nwp = pd.Series({'mtpl': 500., 'prop': 1000., 'liab': 200.}, name='nwp')
+        self.tp_nl_net = pd.Series({'mtpl': 20000., 'prop': -50., 'liab': 2000.}, name='tp_nl_net')
+        self.tp_l = pd.Series({1: 400., 2: 0., 3: 400., 4: 800.}, name='tp_l')
+        # factors from factors_mcr.csv, negative TP floored
+        self.linear_nl = 20000. * 0.085 + 2000. * 0.103 + 500. * 0.094 + 1000. * 0.075 + 200. * 0.131
+        self.linear_l = 400. * 0.037 + 400. * 0.007 + 800. * 0.021 + 0.0007 * 10000.
+
+    def test_single(self):
+        res, debug = mcr(self.nwp, self.tp_nl_net, self.tp_l, 10000., 2e7)
+        # Floor at 25% of the scr
+        self.assertAlmostEqual(res, 5e6)
+        s28 = debug['mcr']['s28_01_01_05']
+        self.assertAlmostEqual(s28.at['mcr_linear', 'C0070'], self.linear_nl + self.linear_l)
+        self.assertEqual(list(debug['mcr']['s28_01_01_02'].columns), ['tp_nl_net', 'nwp', 'premium_beta', 'tp_alpha'])
+        # No state shared between calls
+        self.assertIsNot(mcr(self.nwp, self.tp_nl_net, self.tp_l, 10000., 2e7)[1], debug)
+
+    def test_batch(self):
+        index = pd.MultiIndex.from_product((['E1', 'E2'], ['2024Q1', '2024Q2']), names=['entity', 'period'])
+        scale = np.array([1., 2., 3., 4.])[:, np.newaxis]
+        nwp = pd.DataFrame(scale * self.nwp.to_numpy(), index=index, columns=self.nwp.index)
+        tp_nl = pd.DataFrame(scale * self.tp_nl_net.to_numpy(), index=index, columns=self.tp_nl_net.index)
+        tp_l = pd.DataFrame([self.tp_l] * 4, index=index)
+        scr = pd.Series([1e7, 2e7, 3e4, 1e8], index=index)
+        res = mcr_batch(nwp, tp_nl, tp_l, 10000., scr)
+        for i, key in enumerate(index):
+            expected = mcr(nwp.loc[key], tp_nl.loc[key], self.tp_l, 10000., scr[key])[0]
+            self.assertAlmostEqual(res.at[key, 'mcr'], expected)
+        np.testing.assert_allclose(res.mcr_linear_nl, scale[:, 0] * self.linear_nl)
+        np.testing.assert_allclose(res.early_warning, 1.75 * res.mcr_linear_nl + 3 * res.mcr_linear_l)
+
+        res, qrt = mcr_batch(nwp, tp_nl, tp_l, 10000., scr, qrt_output=True)
+        self.assertEqual(qrt['s28_01_01_02'].shape, (12, 4))
+        self.assertEqual(qrt['s28_01_01_02'].at[('E2', '2024Q2', 'prop'), 'tp_nl_net'], 0.)
+
+        # A missing scr is an error, a missing car_l is 0:
+        with self.assertRaises(ValueError):
+            mcr_batch(nwp, tp_nl, tp_l, 10000., scr.iloc[:3])
+        car_l = pd.Series(10000., index=index[:3])
+        without = mcr_batch(nwp, tp_nl, tp_l, car_l, scr)
+        self.assertAlmostEqual(res.mcr_linear_l.iloc[3] - without.mcr_linear_l.iloc[3], 10000. * 0.0007)
+
+
+if __name__ == '__main__':
+    unittest.main()
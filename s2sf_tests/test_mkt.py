@@ -1,5 +1,8 @@
 import unittest
-from solvency2sf.mkt import f_up
+import numpy as np
+import pandas as pd
+from solvency2sf.mkt import f_up, spread, spread_details, spread_factors, concentration, concentration_details, gi, \
+    equity, equity_batch
 
 
 class TestFUpFunction(unittest.TestCase):
@@ -7,17 +10,19 @@ class TestFUpFunction(unittest.TestCase):
     def test_f_up_bonds(self):
         cc_step = 3
         duration = 8.5
-        expected_result = 0.68
+        # Article 176: 12.5% + 1.5% * (8.5 - 5)
+        expected_result = 0.1775
 
-        result = f_up(cc_step, duration, type='bonds')
+        result = f_up(cc_step, duration, exposure_type='bonds')
         self.assertAlmostEqual(result, expected_result, places=2)
 
     def test_f_up_ri_no_mcr(self):
         cc_step = 2
         duration = 6.5
-        expected_result = 0.635
+        # Article 176(4), not dependent on cc_step: 37.5% + 4.2% * (6.5 - 5)
+        expected_result = 0.438
 
-        result = f_up(cc_step, duration, type='ri_no_mcr')
+        result = f_up(cc_step, duration, exposure_type='ri_no_mcr')
         self.assertAlmostEqual(result, expected_result, places=2)
 
     def test_f_up_gov_eea(self):
@@ -25,7 +30,7 @@ class TestFUpFunction(unittest.TestCase):
         duration = 10.0
         expected_result = 0.0
 
-        result = f_up(cc_step, duration, type='gov_eea')
+        result = f_up(cc_step, duration, exposure_type='gov_eea')
         self.assertAlmostEqual(result, expected_result, places=2)
 
     def test_f_up_sec_type1(self):
@@ -33,7 +38,7 @@ class TestFUpFunction(unittest.TestCase):
         duration = 7.0
         expected_result = 0.294
 
-        result = f_up(cc_step, duration, type='sec_type1')
+        result = f_up(cc_step, duration, exposure_type='sec_type1')
         self.assertAlmostEqual(result, expected_result, places=2)
 
     def test_f_up_resec(self):
@@ -41,8 +46,104 @@ class TestFUpFunction(unittest.TestCase):
         duration = 12.5
         expected_result = 1.0
 
-        result = f_up(cc_step, duration, type='resec')
+        result = f_up(cc_step, duration, exposure_type='resec')
         self.assertAlmostEqual(result, expected_result, places=2)
 
+class TestSpread(unittest.TestCase):
+    def test_spread_factors_match_f_up(self):
+        cc_step = [0, 3, 7, 2, 1, 5]
+        duration = [2.5, 8.5, 21., 6., 7., 12.5]
+        exposure_type = ['bonds', 'bonds', 'bonds', 'ri_no_mcr', 'sec_type1', 'resec']
+        result = spread_factors(cc_step, duration, exposure_type)
+        expected = [f_up(c, d, exposure_type=t) for c, d, t in zip(cc_step, duration, exposure_type)]
+        np.testing.assert_allclose(result, expected)
+        self.assertAlmostEqual(result[1], 0.1775, places=4)
+
+    def test_spread_factors_unknown_type(self):
+        with self.assertRaises(ValueError):
+            spread_factors([0], [1.], ['equity'])
+
+    def test_spread(self):
+        bonds = pd.DataFrame({'mv': [100., 200.], 'cc_step': [3, 7], 'duration': [8.5, 21.],
+                              'exposure_type': ['bonds', 'bonds']})
+        securities = pd.DataFrame({'mv': [50.], 'cc_step': [1], 'duration': [7.], 'type': ['sec_type1']})
+        result = spread(bonds, securities)
+        expected = 100. * 0.1775 + 200. * (0.355 + 0.005) + 50. * 0.294
+        self.assertAlmostEqual(result, expected, places=6)
+        np.testing.assert_allclose(spread_details(bonds).delta_bof, [17.75, 72.])
+        self.assertListEqual(list(bonds.columns), ['mv', 'cc_step', 'duration', 'exposure_type'])
+
+
+class TestConcentration(unittest.TestCase):
+    def setUp(self):
+        self.asset_list = pd.DataFrame([[10., 1, 2],
+                                        [20., 3, 3],
+                                        [70., 2, 7]], columns=['mv', 'exposure_type', 'cc_step'])
+
+    def test_concentration(self):
+        expected = ((0.07 * 0.21 * 100) ** 2 + (0.185 * 0.27 * 100) ** 2 + (0.685 * 0.73 * 100) ** 2) ** 0.5
+        self.assertAlmostEqual(concentration(self.asset_list), expected, places=6)
+        self.assertListEqual(list(self.asset_list.columns), ['mv', 'exposure_type', 'cc_step'])
+
+    def test_gi(self):
+        self.assertEqual(gi(6, 'ri_mcr'), 0.73)
+        self.assertEqual(gi(2, 'gov_non_eea'), 0.12)
+        self.assertEqual(gi(2, 'other'), 0.21)
+
+    def test_single_name(self):
+        asset_list = self.asset_list.assign(counterparty=['A', 'B', 'B'])
+        details = concentration_details(asset_list)
+        self.assertListEqual(list(details.index), ['A', 'B'])
+        self.assertEqual(details.loc['B', 'mv'], 90.)
+        # Weighted cc step (20 * 3 + 70 * 7) / 90 rounded up
+        self.assertEqual(details.loc['B', 'ct'], 0.015)
+        self.assertEqual(details.loc['B', 'gi'], 0.73)
+
+    def test_single_name_mixed_types(self):
+        asset_list = pd.DataFrame({'mv': [60., 20., 20.], 'exposure_type': ['bonds', 'gov_non_eea', 'bonds'],
+                                   'cc_step': [2, 2, 2], 'counterparty': ['A', 'A', 'B']})
+        details = concentration_details(asset_list)
+        # The excess of A is split 3:1 between the bonds (0.21) & the non EEA government exposure (0.12):
+        self.assertAlmostEqual(details.loc['A', 'gi'], 0.75 * 0.21 + 0.25 * 0.12)
+        self.assertAlmostEqual(details.loc['A', 'Conc'], (0.8 - 0.03) * 100 * (0.75 * 0.21 + 0.25 * 0.12))
+        swapped = concentration_details(asset_list.iloc[[1, 0, 2]])
+        self.assertAlmostEqual(swapped.loc['A', 'Conc'], details.loc['A', 'Conc'])
+
+    def test_missing_counterparty(self):
+        # Rows without counterparty are single names of their own, as without the counterparty column
+        expected = concentration(self.asset_list)
+        for missing in [None, np.nan]:
+            asset_list = self.asset_list.assign(counterparty=['A', missing, missing])
+            details = concentration_details(asset_list)
+            self.assertListEqual(list(details.index), ['A', 1, 2])
+            self.assertAlmostEqual(details.loc[2, 'Conc'], 0.685 * 0.73 * 100)
+            self.assertAlmostEqual(concentration(asset_list), expected)
+
+
+class TestEquity(unittest.TestCase):
+    def setUp(self):
+        self.equities = pd.DataFrame({'mv': [100., 200., 50., 80.],
+                                      'exposure_type': ['type1', 'type2', 'type1', 'strategic_long_term']})
+
+    def test_equity(self):
+        res = equity(self.equities, 0.05)
+        type1 = 150. * (0.39 + 0.05)
+        other = 200. * (0.49 + 0.05) + 80. * 0.22
+        self.assertAlmostEqual(res['type1'], type1)
+        self.assertAlmostEqual(res['other'], other)
+        self.assertAlmostEqual(res['scr'], (type1 ** 2 + 1.5 * type1 * other + other ** 2) ** 0.5)
+        self.assertListEqual(list(self.equities.columns), ['mv', 'exposure_type'])
+
+    def test_batch(self):
+        ladder = [-0.05, 0., 0.05]
+        res = equity_batch(self.equities.assign(exposure_type=self.equities.exposure_type.astype('category')), ladder)
+        for sa in ladder:
+            self.assertAlmostEqual(res.at[sa, 'scr'], equity(self.equities, sa)['scr'])
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            equity(self.equities.assign(exposure_type='type3'), 0.)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from solvency2sf import parameters
+from solvency2sf.scr_nl.cat.natcat_eur import natcat_eur as nc
+from solvency2sf.scr_nl.cat.natcat_eur.bundle import build_bundle, load_bundle
+from solvency2sf.scr_nl.cat.natcat_eur.optimiser import NatcatOptimiser, program_grid
+from solvency2sf.scr_nl.cat.reinsurance import EXAMPLE_PROGRAMS
+
+
+def example_sumsinsured():
+    """ Sums insured from the natcat_eur docstring """
+    hazards = ['windstorm', 'earthquake', 'flood', 'hail']
+    risks = ['fire', 'mat', 'motor']
+    idx = pd.MultiIndex.from_product((hazards, risks, ['DE', 'CH', 'PL'], range(1, 100)),
+                                     names=['hazard', 'risk', 'country_isocode', 'riskregion'])
+    sumsinsured = pd.DataFrame(index=idx).sort_index()
+    sumsinsured.loc[pd.IndexSlice['windstorm', ['fire', 'mat'], 'DE', 1:95], 'suminsured'] = 200
+    sumsinsured.loc[pd.IndexSlice['earthquake', ['fire', 'mat'], 'DE', 1:95], 'suminsured'] = 200
+    sumsinsured.loc[pd.IndexSlice[['flood', 'hail'], :, 'DE'], 'suminsured'] = 200
+    sumsinsured.loc[pd.IndexSlice['windstorm', ['fire', 'mat'], 'CH', 1:26], 'suminsured'] = 100
+    sumsinsured.loc[pd.IndexSlice['earthquake', ['fire', 'mat'], 'CH', 1:26], 'suminsured'] = 100
+    sumsinsured.loc[pd.IndexSlice[['flood', 'hail'], :, 'CH', 1:26], 'suminsured'] = 100
+    sumsinsured.loc[pd.IndexSlice['windstorm', ['fire', 'mat'], 'PL'], 'suminsured'] = 100
+    sumsinsured.loc[pd.IndexSlice['flood', :, 'PL'], 'suminsured'] = 100
+    return sumsinsured.dropna()
+
+
+class TestBundle(unittest.TestCase):
+    def tearDown(self):
+        parameters.invalidate()
+
+    def test_bundle_matches_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle = load_bundle(build_bundle(os.path.join(tmp, 'natcat_params')))
+            parameters.override(nc.get_bundle, None)
+            pd.testing.assert_frame_equal(bundle.get('risk_weights'), nc.get_risk_weights(), check_dtype=False)
+            pd.testing.assert_frame_equal(bundle.get('scenarios'), nc.get_scenarios(), check_dtype=False)
+            pd.testing.assert_frame_equal(bundle.get('specified_loss'), nc.get_sl_factors(), check_dtype=False)
+            pd.testing.assert_frame_equal(bundle.get('corr/windstorm'), nc.get_risks_corr_mat()['windstorm'],
+                                          check_dtype=False)
+            pd.testing.assert_frame_equal(bundle.get('corr_cresta/flood/DE'), nc.get_cresta_corr('flood', 'DE'),
+                                          check_dtype=False)
+            self.assertIsNone(bundle.get('corr_cresta/flood/XX'))
+
+            parameters.override(nc.get_bundle, bundle)
+            corr = nc.get_cresta_corr_mat(['DE', 'CH'])
+            self.assertListEqual(sorted(corr['windstorm']), ['CH', 'DE'])
+            self.assertDictEqual(corr['subsidence'], {})
+
+    def test_build_keeps_cache(self):
+        factors = nc.get_risk_factors() * 2
+        parameters.override(nc.get_risk_factors, factors)
+        with tempfile.TemporaryDirectory() as tmp:
+            build_bundle(os.path.join(tmp, 'natcat_params'))
+        # Overrides of other loaders are not dropped:
+        pd.testing.assert_frame_equal(nc.get_risk_factors(), factors)
+
+        # Nor an override of the bundle itself:
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle = load_bundle(build_bundle(os.path.join(tmp, 'natcat_params')))
+            parameters.override(nc.get_bundle, bundle)
+            build_bundle(os.path.join(tmp, 'other_params'))
+            self.assertIs(nc.get_bundle(), bundle)
+            parameters.override(nc.get_bundle, None)
+            build_bundle(os.path.join(tmp, 'other_params'))
+            self.assertIsNone(nc.get_bundle())
+            # A bundle read from the path rebuilt is reopened:
+            parameters.override(nc.get_bundle, bundle)
+            build_bundle(os.path.join(tmp, 'natcat_params'))
+            self.assertIsNot(nc.get_bundle(), bundle)
+
+
+class TestCrestaVolumes(unittest.TestCase):
+    def test_chunked(self):
+        sumsinsured = example_sumsinsured()
+        expected = nc.cresta_volumes(sumsinsured)
+        flat = sumsinsured.reset_index()
+        chunks = (flat.iloc[i:i + 100] for i in range(0, len(flat), 100))
+        pd.testing.assert_frame_equal(nc.cresta_volumes_chunked(chunks), expected, check_dtype=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sumsinsured.csv')
+            flat.to_csv(path, index=False)
+            pd.testing.assert_frame_equal(nc.cresta_volumes_chunked(path, chunksize=250), expected,
+                                          check_dtype=False)
+
+    def test_chunked_empty(self):
+        expected = nc.cresta_volumes(example_sumsinsured().reset_index().iloc[:0])
+        pd.testing.assert_frame_equal(nc.cresta_volumes_chunked(iter([])), expected, check_dtype=False)
+        self.assertEqual(expected.to_numpy().sum(), 0.)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sumsinsured.csv')
+            pd.DataFrame(columns=nc.SUMSINSURED_COLUMNS).to_csv(path, index=False)
+            pd.testing.assert_frame_equal(nc.cresta_volumes_chunked(path), expected, check_dtype=False)
+
+    def test_missing_keys(self):
+        flat = example_sumsinsured().reset_index()
+        missing = flat.copy()
+        missing['riskregion'] = missing.riskregion.astype(float)
+        missing.loc[0, 'riskregion'] = np.nan
+        missing.loc[1, 'country_isocode'] = None
+        # Rows with a missing key are dropped, not added to another zone:
+        expected = nc.cresta_volumes(flat.iloc[2:])
+        pd.testing.assert_frame_equal(nc.cresta_volumes(missing), expected, check_dtype=False)
+        chunks = (missing.iloc[i:i + 100] for i in range(0, len(missing), 100))
+        pd.testing.assert_frame_equal(nc.cresta_volumes_chunked(chunks), expected, check_dtype=False)
+
+
+class TestDivWithinRegion(unittest.TestCase):
+    def setUp(self):
+        risk_weights = nc.get_risk_weights()
+        self.cv = pd.DataFrame(0., index=risk_weights.index, columns=nc.NATCAT_RISKS)
+        self.cv.loc['DE', 'windstorm'] = np.arange(1., 96.)
+        self.cv.loc[('LU', 1), 'windstorm'] = 50.
+        self.cv.loc[('UK', 3), 'windstorm'] = 10.
+
+    def test_quadratic_form(self):
+        div = nc.div_within_region(self.cv)
+        v = np.arange(1., 96.)
+        corr = nc.get_cresta_corr('windstorm', 'DE').to_numpy()
+        self.assertAlmostEqual(div.loc['DE', 'windstorm'], (v @ corr @ v) ** 0.5)
+        self.assertEqual(div.loc['AT', 'windstorm'], 0.)
+        self.assertEqual(div.loc['DE', 'flood'], 0.)
+
+    def test_zones_without_corr(self):
+        div = nc.div_within_region(self.cv)
+        # Single zone country & UK zones from the GB correlation file:
+        self.assertAlmostEqual(div.loc['LU', 'windstorm'], 50.)
+        self.assertAlmostEqual(div.loc['UK', 'windstorm'], 10.)
+        self.assertEqual(nc.get_zone_corr('windstorm', 'UK').shape, (124, 124))
+
+    def test_corr_stack_cached(self):
+        parameters.invalidate(nc.get_zone_corr_stack)
+        nc.div_within_region(self.cv)
+        cached = [key[1] for key in parameters.snapshot() if key[0].endswith('natcat_eur.get_zone_corr_stack')]
+        self.assertEqual(cached, [(('DE', 'LU', 'UK'),)])
+        stack = nc.get_zone_corr_stack(('DE', 'LU', 'UK'))
+        self.assertEqual(stack.shape, (len(nc.NATCAT_RISKS), 3, 124, 124))
+        np.testing.assert_array_equal(stack[0, 0, :95, :95], nc.get_cresta_corr('windstorm', 'DE').to_numpy())
+
+
+class TestOptimiser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gross = nc.scenario_losses(nc.specified_loss(example_sumsinsured()))
+        cls.optimiser = NatcatOptimiser(scen_loss=cls.gross)
+
+    def diversify(self, scen_loss):
+        cube, events, countries = nc.loss_cube(scen_loss)
+        return pd.DataFrame({haz: np.sqrt(np.einsum('ec,cd,ed->e', cube[h], nc.get_country_corr(haz, tuple(countries)),
+                                                     cube[h]))
+                             for h, haz in enumerate(nc.NATCAT_RISKS)}, index=events)
+
+    def test_matches_pipeline(self):
+        net = nc.natcat_reinsurance(self.gross)
+        expected = nc.natcat_agg(self.diversify(self.gross), self.diversify(net))
+        res = self.optimiser.evaluate(program_grid(EXAMPLE_PROGRAMS))
+        self.assertAlmostEqual(res.loc[0, 'gross_scr'], expected.gross_loss)
+        self.assertAlmostEqual(res.loc[0, 'net_scr'], expected.net_loss)
+
+    def test_diversify_between_countries(self):
+        net = nc.natcat_reinsurance(self.gross)
+        gross_x, net_x = nc.diversify_between_countries(self.gross, net)
+        pd.testing.assert_frame_equal(gross_x, self.diversify(self.gross))
+        pd.testing.assert_frame_equal(net_x, self.diversify(net))
+        pd.testing.assert_frame_equal(nc.diversify_between_countries(net), net_x)
+
+    def test_grid_search(self):
+        candidates = program_grid(EXAMPLE_PROGRAMS, xol_xs={'p1': [0, 10, 20]}, qs={'p1': [0., 0.5], 'p2': [0.8]})
+        self.assertEqual(len(candidates), 6)
+        self.assertListEqual(list(candidates[('p1', 'qs')]), [0., 0.5] * 3)
+        res = self.optimiser.search(candidates)
+        self.assertTrue(res.net_scr.is_monotonic_increasing)
+        pd.testing.assert_frame_equal(self.optimiser.evaluate(candidates, processes=2, chunksize=2),
+                                      self.optimiser.evaluate(candidates))
+
+
+if __name__ == '__main__':
+    unittest.main()
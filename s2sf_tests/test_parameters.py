@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+import numpy as np
+from solvency2sf import parameters
+from solvency2sf.aggregation import load_corrmat
+from solvency2sf.scr_nl.premres.premres import get_factors
+
+
+class TestParameters(unittest.TestCase):
+    def tearDown(self):
+        parameters.invalidate()
+
+    def test_cached_read_only(self):
+        corr = load_corrmat('bscr')
+        self.assertFalse(corr.flags.writeable)
+        with self.assertRaises(ValueError):
+            corr[0, 0] = 2.
+        np.testing.assert_array_equal(corr, load_corrmat(module_name='bscr'))
+
+    def test_pandas_view(self):
+        factors = get_factors()
+        factors['extra'] = 1.
+        self.assertNotIn('extra', get_factors('NL', 'net').columns)
+
+    def test_without_copy_on_write(self):
+        # Older pandas: in-place edits of a shallow copy would reach the cache
+        with mock.patch.object(parameters, '_copy_on_write', return_value=False):
+            factors = get_factors()
+            factors.iloc[0, 0] = -1.
+            self.assertNotEqual(get_factors().iloc[0, 0], -1.)
+
+    def test_override_invalidate(self):
+        parameters.override(load_corrmat, np.eye(5), 'bscr')
+        np.testing.assert_array_equal(load_corrmat('bscr'), np.eye(5))
+        parameters.invalidate(load_corrmat)
+        self.assertEqual(load_corrmat('bscr')[0, 1], 0.25)
+
+    def test_reload(self):
+        load_corrmat('bscr')
+        parameters.override(load_corrmat, np.eye(5), 'bscr')
+        parameters.reload('aggregation.load_corrmat')
+        self.assertEqual(load_corrmat('bscr')[0, 1], 0.25)
+        self.assertIn('aggregation.load_corrmat', parameters.loaders())
+
+    def test_snapshot_restore(self):
+        parameters.invalidate()
+        load_corrmat('bscr')
+        get_factors()
+        cached = parameters.snapshot(exclude=[get_factors])
+        self.assertEqual({key[0] for key in cached}, {'aggregation.load_corrmat'})
+        # Loaders of modules not imported are not cached, nothing to exclude:
+        self.assertEqual(parameters.snapshot(exclude=[get_factors, 'not_imported.get_bundle']), cached)
+        # As in a new process: the restored parameters are used rather than the CSV
+        parameters.invalidate()
+        parameters.restore({key: np.eye(5) for key in cached})
+        np.testing.assert_array_equal(load_corrmat('bscr'), np.eye(5))
+        self.assertFalse(load_corrmat('bscr').flags.writeable)
+
+
+if __name__ == '__main__':
+    unittest.main()
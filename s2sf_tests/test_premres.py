@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from solvency2sf.scr_nl.premres.premres import scr_nl_premres, scr_nl_premres_batch, premres_arrays
+
+
+def example_volumes():
+    index = pd.MultiIndex.from_product((['EE', 'SE', 'WE'], ['ass', 'liab', 'med', 'mod', 'mtpl', 'prop']),
+                                       names=['s2region', 's2model'])
+    vm = pd.DataFrame({'vol_p': [1000, 2000, 4000, 3000, 6000, 20000] * 3,
+                       'vol_r': [2000, 1000, 3000, 5000, 10000, 7000] * 3}, index=index, dtype=float)
+    vm.loc['SE', 'vol_r'] = [0., 0., 0., 0., 0., 7000.]
+    return vm
+
+
+class TestPremRes(unittest.TestCase):
+    def setUp(self):
+        self.vm = example_volumes()
+
+    def test_expected(self):
+        # Same as the module docstring example
+        self.assertAlmostEqual(scr_nl_premres(self.vm), 20447.9098489703, places=6)
+        self.assertAlmostEqual(scr_nl_premres(self.vm, ri_basis='gross'), 23121.783431871067, places=6)
+        scr, pr, sd = scr_nl_premres(self.vm, qrt_output=True)
+        self.assertEqual(list(pr.columns), ['vol_p', 'vol_r', 'tot', 'div_regions', 'voldiv', 'sd_pr', 'sd_resv', 'sd'])
+        self.assertAlmostEqual(pr.loc['mtpl', 'vol_p'], 18000.)
+        self.assertAlmostEqual(scr, 3 * sd * pr.voldiv.sum())
+        self.assertEqual(list(self.vm.columns), ['vol_p', 'vol_r'])
+
+    def test_batch(self):
+        rng = np.random.default_rng(0)
+        stack = {(e, s): self.vm * rng.uniform(0.5, 1.5, self.vm.shape) for e in ['E1', 'E2'] for s in range(3)}
+        batch = pd.concat(stack, names=['entity', 'sensitivity'])
+        res = scr_nl_premres_batch(batch, ['entity', 'sensitivity'], ri_basis=['net', 'gross'])
+        for key, vm in stack.items():
+            self.assertAlmostEqual(res.loc[key, 'net'], scr_nl_premres(vm), places=6)
+            self.assertAlmostEqual(res.loc[key, 'gross'], scr_nl_premres(vm, ri_basis='gross'), places=6)
+
+        scr, pr, sd = scr_nl_premres_batch(batch, ['entity', 'sensitivity'], qrt_output=True)
+        single = scr_nl_premres(stack[('E2', 1)], qrt_output=True)
+        pd.testing.assert_frame_equal(pr.loc[('E2', 1)], single[1], check_names=False)
+        self.assertAlmostEqual(sd.loc[('E2', 1)], single[2])
+
+    def test_arrays(self):
+        volumes = np.zeros((2, 1, 12, 2))
+        volumes[:, 0, 0] = [[1000., 0.], [0., 1000.]]
+        res = premres_arrays(volumes, ri_basis=['net', 'gross'])
+        # mtpl only: 3 * sd * volume
+        np.testing.assert_allclose(res['scr'], [[3 * 80., 3 * 100.], [3 * 90., 3 * 90.]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from solvency2sf.aggregation import scr_agg
+from solvency2sf.mkt import equity, spread
+from solvency2sf.projection import project_scr, distribution, mcr_linear
+from solvency2sf.scr_nl.premres.premres import scr_nl_premres
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.S, self.T = 4, 3
+        S, T = self.S, self.T
+        self.lobs = ['mtpl', 'prop', 'liab']
+        self.cube = {
+            'equity_mv': 1000. * rng.lognormal(0, 0.2, (S, T, 3)),
+            'equity_type': ['type1', 'type2', 'infra_corp'],
+            'symmetric_adjustment': rng.uniform(-0.1, 0.1, (S, T)),
+            'bond_mv': rng.uniform(100, 1000, (S, T, 2)),
+            'bond_cc_step': [1, 4],
+            'bond_duration': rng.uniform(1, 15, (S, T, 2)),
+            'bond_type': ['bonds', 'bonds'],
+            'vol_p': rng.uniform(0, 2000, (S, T, 2, 3)),
+            'vol_r': rng.uniform(0, 4000, (S, T, 2, 3)),
+            'lobs': self.lobs,
+            'nwp': rng.uniform(0, 2000, (S, T, 3)),
+            'tp_nl': rng.uniform(-100, 4000, (S, T, 3)),
+            'mcr_lobs': self.lobs,
+            'own_funds': np.full((S, T), 5e6),
+        }
+
+    def expected_bscr(self, s, t):
+        c = self.cube
+        eq = pd.DataFrame({'mv': c['equity_mv'][s, t], 'exposure_type': c['equity_type']})
+        mkt_eq = equity(eq, c['symmetric_adjustment'][s, t])['scr']
+        bonds = pd.DataFrame({'mv': c['bond_mv'][s, t], 'cc_step': c['bond_cc_step'],
+                              'duration': c['bond_duration'][s, t], 'exposure_type': c['bond_type']})
+        mkt_spread = spread(bonds)
+        mkt = max(scr_agg(np.array([0., mkt_eq, 0., mkt_spread, 0., 0.]), 'mkt_up'),
+                  scr_agg(np.array([0., mkt_eq, 0., mkt_spread, 0., 0.]), 'mkt_down'))
+        index = pd.MultiIndex.from_product((['r1', 'r2'], self.lobs), names=['s2region', 's2model'])
+        vm = pd.DataFrame({'vol_p': c['vol_p'][s, t].ravel(), 'vol_r': c['vol_r'][s, t].ravel()}, index=index)
+        nl = scr_agg(np.array([scr_nl_premres(vm), 0., 0.]), 'nl_uw')
+        return scr_agg(np.array([mkt, 0., 0., 0., nl]), 'bscr')
+
+    def test_matches_modules(self):
+        res = project_scr(self.cube)
+        self.assertEqual(res['scr'].shape, (self.S, self.T))
+        for s in range(self.S):
+            for t in range(self.T):
+                self.assertAlmostEqual(res['bscr'][s, t], self.expected_bscr(s, t), places=6)
+        np.testing.assert_allclose(res['solvency_ratio'], 5e6 / res['scr'])
+        # Here the MCR is the absolute floor:
+        np.testing.assert_allclose(res['mcr'], 4000000)
+
+    def test_mcr_linear(self):
+        tp = pd.Series([20000., -5., 2000.], index=self.lobs)
+        nwp = pd.Series([500., 500., 500.], index=self.lobs)
+        # factors from factors_mcr.csv
+        expected = 20000. * 0.085 + 2000. * 0.103 + 500. * (0.094 + 0.075 + 0.131)
+        self.assertAlmostEqual(float(mcr_linear(nwp.to_numpy(), tp.to_numpy(), self.lobs)), expected)
+
+    def test_processes(self):
+        res = project_scr(self.cube)
+        chunked = project_scr(self.cube, processes=2, chunksize=1)
+        for k, v in res.items():
+            np.testing.assert_allclose(chunked[k], v)
+        dist = distribution(res, 'scr', quantiles=(0.5,))
+        self.assertEqual(list(dist.columns), ['mean', 0.5])
+        self.assertEqual(len(dist), self.T)
+
+    def test_processes_without_scenarios(self):
+        # A single scenario & time step, scalars & per asset arrays only:
+        keys = ['equity_mv', 'equity_type', 'symmetric_adjustment', 'bond_mv', 'bond_cc_step', 'bond_duration',
+                'bond_type', 'own_funds']
+        cube = {k: self.cube[k][0, 0] if np.ndim(self.cube[k]) >= 2 else self.cube[k] for k in keys}
+        cube['life'] = 1000.
+        res = project_scr(cube, processes=2)
+        self.assertEqual(res['scr'].shape, ())
+        for k, v in project_scr(cube).items():
+            np.testing.assert_allclose(res[k], v)
+
+
+if __name__ == '__main__':
+    unittest.main()
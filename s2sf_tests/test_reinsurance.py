@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+import pandas as pd
+from solvency2sf.scr_nl.cat.reinsurance import (net_losses, program_codes, program_terms, reinsure, stack_terms,
+                                                EXAMPLE_PROGRAMS, EXAMPLE_COVERS)
+
+
+class TestReinsurance(unittest.TestCase):
+    def setUp(self):
+        self.gross = np.array([[10., 5., 2.],
+                               [0., 0., 0.]])
+        self.prog_code = program_codes(['DE', 'CH', 'PL'], EXAMPLE_PROGRAMS, EXAMPLE_COVERS)
+
+    def test_net_losses(self):
+        net = net_losses(self.gross, self.prog_code, *program_terms(EXAMPLE_PROGRAMS))
+        # p1: (15 - 5 + 5 / 10 * 0.5) * 0.4 allocated 2:1 to DE & CH, p2: 2 * 0.2
+        np.testing.assert_allclose(net, [[4.1 * 2 / 3, 4.1 / 3, 0.4], [0., 0., 0.]])
+
+    def test_not_covered(self):
+        prog_code = program_codes(['DE', 'FR'], EXAMPLE_PROGRAMS, EXAMPLE_COVERS)
+        np.testing.assert_array_equal(prog_code, [0, -1])
+        net = net_losses(np.array([10., 7.]), prog_code, *program_terms(EXAMPLE_PROGRAMS))
+        self.assertEqual(net[1], 7.)
+
+    def test_alternative_structures(self):
+        xol_xs, xol_limit, reinstatement, qs = program_terms(EXAMPLE_PROGRAMS)
+        retention = xol_xs + np.array([0., 5., 10.])[:, None, None]
+        net = net_losses(self.gross, self.prog_code, retention, xol_limit, reinstatement, qs)
+        self.assertEqual(net.shape, (3, 2, 3))
+        for i in range(3):
+            np.testing.assert_allclose(net[i], net_losses(self.gross, self.prog_code, retention[i, 0],
+                                                          xol_limit, reinstatement, qs))
+
+    def test_stack_terms(self):
+        xol_xs, xol_limit, reinstatement, qs = stack_terms([EXAMPLE_PROGRAMS, EXAMPLE_PROGRAMS.assign(qs=0.),
+                                                            EXAMPLE_PROGRAMS.loc[['p2']]])
+        self.assertEqual(xol_xs.shape, (3, 2))
+        np.testing.assert_array_equal(qs[:, 0], [0.6, 0., 0.])
+        # p1 missing from the last alternative: DE & CH keep their gross loss
+        net = net_losses(self.gross[0], self.prog_code, xol_xs, xol_limit, reinstatement, qs)
+        np.testing.assert_allclose(net[2], [10., 5., 0.4])
+
+    def test_reinsure(self):
+        gross = pd.DataFrame(self.gross, columns=['DE', 'CH', 'PL'])
+        net = reinsure(gross)
+        self.assertAlmostEqual(net.loc[0, 'PL'], 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
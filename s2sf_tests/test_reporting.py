@@ -0,0 +1,88 @@
+import threading
+import unittest
+import numpy as np
+import pandas as pd
+
+from s2sf_tests.dummy_data import Dummy_Data
+from s2sf_tests.test_premres import example_volumes
+from solvency2sf import StandardFormula
+from solvency2sf.default import scr_def_t1_batch
+from solvency2sf.mcr.mcr import mcr_batch
+from solvency2sf.reporting import QRTRecorder, recording
+from solvency2sf.scr_nl.premres.premres import scr_nl_premres, scr_nl_premres_batch
+
+
+class TestReporting(unittest.TestCase):
+    def setUp(self):
+        self.dd = Dummy_Data()
+
+    def test_not_recording(self):
+        recorder = QRTRecorder()
+        with recording(recorder, entity='E1'):
+            pass
+        scr_nl_premres(example_volumes())
+        self.assertEqual(recorder.records, {})
+
+    def test_threads(self):
+        # Concurrent recordings each keep their own recorder & entity
+        barrier = threading.Barrier(2)
+        recorders = {}
+
+        def run(entity, scale):
+            with recording(entity=entity) as recorder:
+                barrier.wait()
+                StandardFormula().run({'type1': self.dd.type_1.assign(balance=self.dd.type_1.balance * scale),
+                                       'type2': self.dd.type_2}, executor='thread', max_workers=2)
+            recorders[entity] = recorder
+
+        threads = [threading.Thread(target=run, args=(f'E{i}', i)) for i in [1, 2]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for entity, recorder in recorders.items():
+            self.assertEqual(recorder.entities(), [entity])
+            # Detail recorded by the node on the StandardFormula thread pool:
+            self.assertIn('s26_02_01_type1', recorder.tables(entity))
+        self.assertGreater(recorders['E2'].table('s26_02_01', 'E2').at['type1', 'scr'],
+                           recorders['E1'].table('s26_02_01', 'E1').at['type1', 'scr'])
+
+    def test_standard_formula(self):
+        with recording(entity='E1') as recorder:
+            res = StandardFormula().run({'type1': self.dd.type_1, 'type2': self.dd.type_2, 'life': 2000.,
+                                         'volume_measures': example_volumes()})
+        s25 = recorder.table('s25_01_01', 'E1')
+        self.assertAlmostEqual(s25.at['scr', 'C0110'], res['scr'])
+        self.assertAlmostEqual(s25.at['default', 'C0110'], res['def'])
+        self.assertAlmostEqual(s25.loc[['market', 'default', 'life', 'health', 'non_life', 'diversification'],
+                                       'C0110'].sum(), res['bscr'])
+        type1 = recorder.table('s26_02_01_type1', 'E1')
+        self.assertEqual(len(type1), 7)
+        self.assertAlmostEqual(recorder.table('s26_02_01', 'E1').at['default', 'scr'], res['def'])
+        premres = recorder.table('s26_05_01_premres', 'E1')
+        # med is a health line of business
+        self.assertAlmostEqual(premres.vol_p.sum(), example_volumes().vol_p.drop('med', level='s2model').sum())
+        self.assertEqual(set(recorder.tables('E1')),
+                         {'s25_01_01', 's26_01_01', 's26_02_01', 's26_02_01_type1', 's26_05_01', 's26_05_01_premres'})
+
+    def test_batch(self):
+        vm = pd.concat({'E1': example_volumes(), 'E2': 2 * example_volumes()}, names=['entity'])
+        index = pd.Index(['E1', 'E2'], name='entity')
+        nwp = pd.DataFrame({'mtpl': [500., 1000.], 'prop': [1000., 0.]}, index=index)
+        with recording() as recorder:
+            scr_nl_premres_batch(vm, ri_basis=['net', 'gross'])
+            mcr_batch(nwp, nwp * 4, scr=pd.Series([1e4, 1e5], index=index))
+            scr_def_t1_batch(pd.concat({'E1': self.dd.type_1, 'E2': self.dd.type_1}, names=['entity']), 'entity')
+        self.assertEqual(recorder.entities('s26_05_01_premres'), ['E1', 'E2'])
+        # Single entity calculation recorded against the same entity gives the same table
+        with recording(entity='E2') as single:
+            scr_nl_premres(2 * example_volumes())
+        pd.testing.assert_frame_equal(recorder.table('s26_05_01_premres', 'E2'),
+                                      single.table('s26_05_01_premres', 'E2'))
+        s28 = recorder.table('s28_01_01_02', 'E2')
+        np.testing.assert_allclose(s28.nwp, [1000., 0.])
+        self.assertAlmostEqual(recorder.table('s28_01_01_05', 'E1').at['scr', 'C0070'], 1e4)
+        self.assertEqual(set(recorder.tables('E1')), {'s26_05_01_premres', 's28_01_01_02', 's28_01_01_05',
+                                                      's26_02_01_type1'})
+        with self.assertRaises(KeyError):
+            recorder.table('s25_01_01', 'E1')
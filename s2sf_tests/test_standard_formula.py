@@ -0,0 +1,106 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from solvency2sf.aggregation import scr_agg
+from solvency2sf.default import scr_def
+from solvency2sf.standard_formula import StandardFormula
+from s2sf_tests.dummy_data import Dummy_Data
+
+
+class TestStandardFormula(unittest.TestCase):
+    def setUp(self):
+        self.dd = Dummy_Data()
+        self.inputs = {
+            'equities': pd.DataFrame({'mv': [1000., 500.], 'exposure_type': ['type1', 'type2']}),
+            'symmetric_adjustment': 0.05,
+            'type1': self.dd.type_1,
+            'type2': self.dd.type_2,
+            'life': 2000.,
+            'nl_cat': 50000.,
+        }
+
+    def test_bscr(self):
+        res = StandardFormula().run(self.inputs)
+        self.assertAlmostEqual(res['def'], self.dd.scr_def_expected, places=4)
+        nl = scr_agg(np.array([0., 50000., 0.]), 'nl_uw')
+        expected = scr_agg(np.array([res['mkt'], scr_def(self.dd.type_1, self.dd.type_2)[0], 2000., 0., nl]), 'bscr')
+        self.assertAlmostEqual(res['bscr'], expected, places=4)
+        self.assertEqual(res['scr'], res['bscr'])
+        # Inputs are not changed by the run:
+        self.assertEqual(list(self.inputs['equities'].columns), ['mv', 'exposure_type'])
+
+    def test_executors(self):
+        expected = StandardFormula().run(self.inputs)['scr']
+        for executor in ['thread', 'process']:
+            sf = StandardFormula()
+            self.assertAlmostEqual(sf.run(self.inputs, executor=executor, max_workers=2)['scr'], expected)
+            self.assertEqual(set(sf.timings), set(sf.nodes).difference(self.inputs))
+
+    def test_graph(self):
+        sf = StandardFormula()
+        levels = sf.order()
+        self.assertEqual(levels[-1], ['scr'])
+        sf.add_node('double_scr', lambda scr: 2 * scr, ['scr'])
+        res = sf.run(self.inputs, executor='thread')
+        self.assertEqual(res['double_scr'], 2 * res['scr'])
+        with self.assertRaises(ValueError):
+            sf.add_node('bscr', lambda x: x, ['double_scr'])
+        self.assertIn('mkt', sf.nodes['bscr'][1])
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        from s2sf_tests.test_natcat import example_sumsinsured
+        from solvency2sf.scr_nl.cat.reinsurance import EXAMPLE_PROGRAMS, EXAMPLE_COVERS
+        self.programs = EXAMPLE_PROGRAMS
+        self.dd = Dummy_Data()
+        self.inputs = {
+            'equities': pd.DataFrame({'mv': [1000., 500.], 'exposure_type': ['type1', 'type2']}),
+            'symmetric_adjustment': 0.05,
+            'type1': self.dd.type_1,
+            'type2': self.dd.type_2,
+            'sumsinsured': example_sumsinsured(),
+            'programs': EXAMPLE_PROGRAMS,
+            'covers': EXAMPLE_COVERS,
+        }
+
+    def test_update_matches_full_run(self):
+        sf = StandardFormula()
+        sf.run(self.inputs)
+        equities = self.inputs['equities'].copy()
+        equities.loc[0, 'mv'] = 2000.
+        res = sf.update({'equities': equities})
+        self.assertEqual(set(sf.timings), {'mkt_eq', 'mkt', 'bscr', 'op', 'scr'})
+        full = StandardFormula().run({**self.inputs, 'equities': equities})
+        self.assertAlmostEqual(res['scr'], full['scr'])
+
+        # Same content -> nothing to do
+        sf.update({'equities': equities.copy()})
+        self.assertEqual(sf.timings, {})
+
+    def test_reinsurance_change_keeps_gross(self):
+        sf = StandardFormula()
+        sf.run(self.inputs)
+        programs = self.programs.copy()
+        programs['qs'] = 0.
+        res = sf.update({'programs': programs}, executor='thread')
+        self.assertNotIn('cresta_volumes', sf.timings)
+        self.assertNotIn('natcat_gross', sf.timings)
+        self.assertIn('natcat_net', sf.timings)
+        full = StandardFormula().run({**self.inputs, 'programs': programs})
+        self.assertAlmostEqual(res['natcat'], full['natcat'])
+        self.assertAlmostEqual(res['scr'], full['scr'])
+
+    def test_unchanged_result_stops(self):
+        sf = StandardFormula()
+        sf.run(self.inputs)
+        # Rating change between two ratings with the same default probability (5 & 6)
+        type1 = self.dd.type_1.copy()
+        type1.loc['Bank A', 'rating'] = 5
+        sf.update({'type1': type1})
+        self.assertEqual(set(sf.timings), {'def'})
+
+
+if __name__ == '__main__':
+    unittest.main()
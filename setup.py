@@ -27,7 +27,8 @@ setuptools.setup(
         "Intended Audience :: Financial and Insurance Industry"
     ],
     packages=setuptools.find_packages(include=['solvency2sf', 'solvency2sf.*']),
-    python_requires='>=3.6',
+    python_requires='>=3.9',
     include_package_data=True,
     install_requires=dependencies,
+    extras_require={'parquet': ['pyarrow']},
 )
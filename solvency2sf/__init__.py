@@ -1,3 +1,4 @@
 from .scr_nl.premres.premres import scr_nl_premres
 from .mkt import equity, spread, concentration
-from .aggregation import scr_agg
\ No newline at end of file
+from .aggregation import scr_agg
+from .standard_formula import StandardFormula
\ No newline at end of file
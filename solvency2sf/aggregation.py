@@ -7,8 +7,11 @@ and aggregates according to Solvency II Standard Formula correlation matrices.
 import os
 import pathlib
 import numpy as np
+from .instrumentation import instrumented
+from .parameters import parameter
 
 
+@parameter
 def load_corrmat(module_name: str) -> np.array:
     fldr = pathlib.Path(__file__).parent.resolve()
     corr = np.genfromtxt(os.path.join(fldr, 'corr_' + module_name + '.csv'), skip_header=1, delimiter=',')
@@ -17,17 +20,24 @@ def load_corrmat(module_name: str) -> np.array:
     return corr
 
 
-def scr_agg(scr_submodules: np.array, module_name: str):
+@instrumented
+def scr_agg(scr_submodules: np.array, module_name: str, out: np.array = None):
     """
     Aggregation of submodules according to selected corr mat
     scr_submodules:
     - array ordered consistently with the corr matrix
     - unused modules should be filled with 0.
+    - 1d for a single calculation, or 2d (n_scenarios x n_modules) to aggregate every scenario at once
     module_name: bscr, h_uw, nl_uw
+    out: optional array of shape (n_scenarios,) to write the result into (2d input only)
     """
     corr = load_corrmat(module_name)
-    scr = (np.matmul(scr_submodules.T, np.matmul(corr, scr_submodules)))**0.5
-    return scr
+    x = np.asarray(scr_submodules, dtype=float)
+    if x.ndim == 1:
+        scr = (np.matmul(x.T, np.matmul(corr, x)))**0.5
+        return scr
+    scr = np.einsum('ij,jk,ik->i', x, corr, x, out=out)
+    return np.sqrt(scr, out=scr)
 
 
 def scr_total(
@@ -38,16 +48,26 @@ def scr_total(
     return bscr + scr_op
 
 
-def scr_alloc(scr_submodules: np.array, module_name: str):
+@instrumented
+def scr_alloc(scr_submodules: np.array, module_name: str, out: np.array = None):
     """
     Euler allocation of SCR to sub-modules
     Allocation of risk modules according to the principles in this paper
     https://www.ivass.it/pubblicazioni-e-statistiche/pubblicazioni/att-sem-conv/2017/conf-131407/On-a-capital-allocation-principle-coherent.pdf
-    """
-
-    aggr = scr_agg(scr_submodules, module_name)
 
+    scr_submodules: 1d, or 2d (n_scenarios x n_modules) to allocate every scenario at once
+    out: optional array of shape (n_scenarios, n_modules) to write the result into (2d input only)
+    """
     corr = load_corrmat(module_name)
-    alloc = np.matmul(scr_submodules.T, corr) * scr_submodules / aggr
+    x = np.asarray(scr_submodules, dtype=float)
+    if x.ndim == 1:
+        aggr = (np.matmul(x.T, np.matmul(corr, x)))**0.5
+        alloc = np.matmul(x.T, corr) * x / aggr
+        return alloc
 
+    # corr is symmetric so x @ corr gives the marginal contributions row by row
+    alloc = np.matmul(x, corr, out=out)
+    aggr = np.sqrt(np.einsum('ij,ij->i', alloc, x))
+    alloc *= x
+    alloc /= aggr[:, np.newaxis]
     return alloc
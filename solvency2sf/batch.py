@@ -0,0 +1,178 @@
+"""
+Group batch runs
+
+The SCR & MCR of many entities (the solo entities and the group) on a process pool:
+- inputs: {entity: {name: value}}, the inputs of StandardFormula.run plus the MCR inputs nwp & tp_nl_net
+  (pd.Series by s2model), tp_l (pd.Series by life group 1-4) and car_l
+- the parameter sets the entities need are read once in the parent (preload) before the workers start.
+  With the fork start method the workers inherit the parameter cache and the input bundle, only the entity names
+  are sent to them. Otherwise the cache is sent once to each worker (see parameters.snapshot) and the inputs with
+  each chunk.
+- entities are sharded into chunks of chunksize, each chunk runs in one worker
+- the MCR of every entity is calculated in one mcr_batch call on the SCR results
+- results: a row per entity of RESULTS, optionally written to one parquet (pip install pyarrow) or csv file
+- throughput: entities, time & entities per second by worker process
+
+Test data:
+from s2sf_tests.dummy_data import Dummy_Data
+import pandas as pd
+dd = Dummy_Data()
+equities = pd.DataFrame({'mv': [1000., 500.], 'exposure_type': ['type1', 'type2']})
+inputs = {f'E{i}': {'equities': equities.assign(mv=equities.mv * (1 + i)), 'symmetric_adjustment': 0.05,
+                    'type1': dd.type_1, 'type2': dd.type_2, 'life': 2000.,
+                    'nwp': pd.Series({'mtpl': 500., 'prop': 500.}),
+                    'tp_nl_net': pd.Series({'mtpl': 20000., 'prop': 21000.})} for i in range(8)}
+res, throughput = run_entities(inputs, processes=2, chunksize=2, output='scr.csv')
+res
+throughput
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from . import parameters
+from .aggregation import load_corrmat
+from .mcr.mcr import TP_LIFE_FACTORS, mcr_batch
+from .standard_formula import StandardFormula
+
+# Results by entity: StandardFormula nodes & inputs, then the MCR
+SCR_RESULTS = ['mkt_eq', 'mkt_spread', 'mkt_conc', 'mkt', 'def', 'nl_pr', 'natcat', 'manmade_liab', 'nl_cat', 'nl',
+               'h_nslt_pr', 'h', 'life', 'bscr', 'op', 'scr']
+RESULTS = SCR_RESULTS + ['mcr_linear', 'mcr']
+# Inputs used for the MCR rather than by StandardFormula
+MCR_INPUTS = ['nwp', 'tp_nl_net', 'tp_l', 'car_l']
+# Correlation matrices of the StandardFormula aggregations
+CORR_MODULES = ['mkt_up', 'mkt_down', 'nl_uw', 'h_uw', 'bscr']
+
+# Input bundle of the current run, inherited by forked workers
+_shared = {'inputs': None}
+
+
+def preload(inputs: dict = None):
+    """
+    Reads the parameter sets used by the entities into the cache
+    - every loader without arguments (or with defaults only), the aggregation correlations
+    - health premium & reserve parameters if an entity has health volume measures
+    - natcat cresta zone correlations of the countries in the sums insured
+    """
+    for loader in parameters.loaders().values():
+        if all(p.default is not p.empty for p in loader.signature.parameters.values()):
+            loader()
+    for module_name in CORR_MODULES:
+        load_corrmat(module_name)
+    bundles = list((inputs or {}).values())
+    if any(bundle.get('health_volume_measures') is not None for bundle in bundles):
+        from .scr_nl.premres.premres import get_corr, get_factors
+        get_factors('H_NSLT', 'net')
+        get_corr('H_NSLT')
+    countries = set()
+    for bundle in bundles:
+        if bundle.get('sumsinsured') is not None:
+            countries.update(pd.unique(bundle['sumsinsured']['country_isocode']))
+    if countries:
+        from .scr_nl.cat.natcat_eur.natcat_eur import NATCAT_RISKS, get_zone_corr
+        for risk in NATCAT_RISKS:
+            for country in sorted(countries):
+                get_zone_corr(risk, country)
+
+
+def run_entity(inputs: dict) -> dict:
+    """ StandardFormula results of one entity, {result: float} for SCR_RESULTS """
+    res = StandardFormula().run({k: v for k, v in inputs.items() if k not in MCR_INPUTS})
+    return {name: float(res.get(name) or 0.) for name in SCR_RESULTS}
+
+
+def _run_chunk(entities: list, inputs: dict = None) -> tuple:
+    """ Runs a chunk of entities in a worker, inputs: None to use the inherited bundle """
+    inputs = _shared['inputs'] if inputs is None else inputs
+    start = time.perf_counter()
+    rows = {entity: run_entity(inputs[entity]) for entity in entities}
+    return rows, os.getpid(), time.perf_counter() - start
+
+
+def _init_worker(cached: dict):
+    parameters.restore(cached)
+
+
+def run_entities(inputs: dict, processes=None, chunksize=1, output=None, start_method=None) -> tuple:
+    """
+    SCR & MCR of every entity
+    inputs: {entity: {name: value}}, see module docstring
+    processes: number of worker processes, None or 1 to run in this process
+    chunksize: entities per task sent to a worker
+    output: path of a .parquet or .csv file to write the results to
+    start_method: multiprocessing start method, defaults to fork where available
+    Returns (results: pd.DataFrame a row per entity, throughput: pd.DataFrame a row per worker process)
+    """
+    entities = list(inputs)
+    preload(inputs)
+    chunks = [entities[i:i + chunksize] for i in range(0, len(entities), chunksize)]
+    if processes is None or processes <= 1:
+        done = [_run_chunk(chunk, inputs) for chunk in chunks]
+    else:
+        done = _run_pool(inputs, chunks, processes, start_method)
+
+    rows = {entity: row for chunk_rows, _, _ in done for entity, row in chunk_rows.items()}
+    res = pd.DataFrame.from_dict(rows, orient='index').reindex(index=entities, columns=RESULTS)
+    res.index.name = 'entity'
+    res[['mcr_linear', 'mcr']] = _mcr(inputs, res['scr'])
+    worker = pd.DataFrame([(pid, len(chunk_rows), elapsed) for chunk_rows, pid, elapsed in done],
+                          columns=['worker', 'entities', 'time'])
+    throughput = worker.groupby('worker').agg(chunks=('time', 'size'), entities=('entities', 'sum'),
+                                              time=('time', 'sum'))
+    throughput['entities_per_s'] = throughput.entities / throughput.time
+    if output is not None:
+        write_results(res, output)
+    return res, throughput
+
+
+def _run_pool(inputs, chunks, processes, start_method) -> list:
+    if start_method is None:
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(start_method)
+    forked = start_method == 'fork'
+    # Forked workers inherit the cache & the inputs, otherwise the cache is sent to each worker once.
+    # The natcat bundle is a memory map, reopened by each worker rather than copied:
+    initargs = () if forked else (parameters.snapshot(exclude=['scr_nl.cat.natcat_eur.natcat_eur.get_bundle']),)
+    _shared['inputs'] = inputs if forked else None
+    try:
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=None if forked else _init_worker,
+                                 initargs=initargs) as pool:
+            futures = [pool.submit(_run_chunk, chunk, None if forked else {e: inputs[e] for e in chunk})
+                       for chunk in chunks]
+            return [future.result() for future in as_completed(futures)]
+    finally:
+        _shared['inputs'] = None
+
+
+def _mcr(inputs: dict, scr: pd.Series) -> pd.DataFrame:
+    """ Linear & final MCR of the entities with nwp or tp_nl_net, NaN for the others """
+    with_mcr = [entity for entity, bundle in inputs.items()
+                if bundle.get('nwp') is not None or bundle.get('tp_nl_net') is not None]
+    res = pd.DataFrame(np.nan, index=scr.index, columns=['mcr_linear', 'mcr'])
+    if not with_mcr:
+        return res
+
+    def frame(name, columns=None):
+        rows = {e: inputs[e].get(name) for e in with_mcr}
+        df = pd.DataFrame.from_dict({e: row for e, row in rows.items() if row is not None}, orient='index')
+        return df.reindex(index=with_mcr, columns=columns)
+
+    car_l = pd.Series({e: inputs[e].get('car_l') or 0. for e in with_mcr}, dtype=float)
+    tp_l = frame('tp_l', list(TP_LIFE_FACTORS)) if any('tp_l' in inputs[e] for e in with_mcr) else None
+    mcr = mcr_batch(frame('nwp'), frame('tp_nl_net'), tp_l, car_l, scr.reindex(with_mcr))
+    res.loc[with_mcr] = mcr[['mcr_linear', 'mcr']].to_numpy()
+    return res
+
+
+def write_results(res: pd.DataFrame, path):
+    """ Writes the results to a .parquet file (requires pyarrow) or else csv """
+    if str(path).endswith(('.parquet', '.pq')):
+        from .columnar import _pyarrow
+        pa = _pyarrow()
+        pa.parquet.write_table(pa.Table.from_pandas(res), path)
+    else:
+        res.to_csv(path)
@@ -0,0 +1,123 @@
+"""
+Columnar inputs
+
+Readers for exposure data held in Parquet / Arrow, feeding the calculation functions without going through
+object or copied float64 frames:
+- column projection: only the columns the calculation needs are read
+- predicate pushdown: entities (or any other filters) are selected while reading, row groups of other entities
+  are skipped
+- numeric columns without nulls become numpy views of the Arrow buffers (zero-copy when in a single chunk)
+- label columns (exposure_type, country_isocode, hazard, s2model...) are read dictionary encoded and become
+  pd.Categorical: the calculations look up the few categories rather than every row (see category_codes)
+
+pyarrow is only needed for the readers: pip install pyarrow
+
+Inputs (see INPUTS for the columns read):
+- assets: spread, concentration & equity
+- type1: scr_def_t1
+- sumsinsured: cresta_volumes
+- liab_vol: liab, indexed by grp_liab & country
+- volume_measures: scr_nl_premres_batch, indexed by entity, s2region & s2model
+
+Test data:
+import pandas as pd
+import pyarrow as pa, pyarrow.parquet as pq
+from s2sf_tests.benchmark import assets
+df = assets(10000).assign(entity=[f'E{i % 3}' for i in range(10000)])
+pq.write_table(pa.Table.from_pandas(df), 'assets.parquet', row_group_size=1000)
+from solvency2sf.mkt import spread
+spread(read_input('assets', 'assets.parquet', entities=['E1']))
+"""
+import numpy as np
+import pandas as pd
+
+# For each input: columns read, optional columns read if in the file, dictionary encoded columns & index columns
+INPUTS = {
+    'assets': dict(columns=['mv', 'cc_step', 'duration', 'exposure_type'], optional=['counterparty'],
+                   categorical=['exposure_type'], index=[]),
+    'type1': dict(columns=['balance', 'rating', 'category', 'mitigation'], optional=['counterparty'],
+                  categorical=[], index=['counterparty']),
+    'sumsinsured': dict(columns=['hazard', 'risk', 'country_isocode', 'riskregion', 'suminsured'], optional=[],
+                        categorical=['hazard', 'risk', 'country_isocode'], index=[]),
+    'liab_vol': dict(columns=['grp_liab', 'country', 'gep', 'limit_indem'], optional=[],
+                     categorical=['country'], index=['grp_liab', 'country']),
+    'volume_measures': dict(columns=['entity', 's2region', 's2model', 'vol_p', 'vol_r'], optional=[],
+                            categorical=['s2region', 's2model'], index=['entity', 's2region', 's2model']),
+}
+
+
+def category_codes(labels: pd.Index, values) -> np.array:
+    """
+    Position of each value in labels, -1 if not found
+    Categorical values are looked up by their categories, then mapped through the codes.
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        cat = values.array if isinstance(values, (pd.Series, pd.Index)) else values
+        # Missing values (code -1) pick the -1 appended at the end:
+        lookup = np.append(labels.get_indexer(cat.categories), -1)
+        return lookup[cat.codes]
+    return labels.get_indexer(np.asarray(values, dtype=object))
+
+
+def level_codes(index: pd.Index, name, labels: pd.Index) -> np.array:
+    """ Position in labels of each value of an index level, -1 if not found, looked up once per distinct value """
+    if isinstance(index, pd.MultiIndex):
+        i = index.names.index(name)
+        return np.append(labels.get_indexer(index.levels[i]), -1)[index.codes[i]]
+    return category_codes(labels, index)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('pyarrow is required to read parquet / arrow inputs: pip install pyarrow')
+    return pyarrow
+
+
+def read_parquet(path, columns=None, filters=None, categorical=(), index=()) -> pd.DataFrame:
+    """
+    Reads the columns of a parquet file (or dataset directory) into a frame of numpy views
+    filters: pyarrow filters e.g. [('entity', 'in', ['E1', 'E2'])], applied while reading
+    categorical: columns read dictionary encoded, as pd.Categorical
+    index: columns to set as the index
+    """
+    pa = _pyarrow()
+    table = pa.parquet.read_table(path, columns=columns, filters=filters, read_dictionary=list(categorical))
+    return table_to_frame(table, categorical, index)
+
+
+def table_to_frame(table, categorical=(), index=()) -> pd.DataFrame:
+    """
+    pyarrow.Table to pd.DataFrame, numeric columns without nulls as views of the Arrow buffers
+    categorical: columns to dictionary encode if not already, as pd.Categorical
+    """
+    pa = _pyarrow()
+    for name in categorical:
+        i = table.schema.get_field_index(name)
+        if i >= 0 and not pa.types.is_dictionary(table.schema.field(i).type):
+            table = table.set_column(i, name, table.column(i).dictionary_encode())
+    # One chunk per column so numeric columns can be viewed rather than concatenated, one dictionary per column:
+    table = table.unify_dictionaries().combine_chunks()
+    df = table.to_pandas(split_blocks=True, self_destruct=False)
+    return df.set_index(list(index)) if index else df
+
+
+def read_input(name, path, entities=None, entity_column='entity', columns=None, filters=None) -> pd.DataFrame:
+    """
+    Reads one of the INPUTS from parquet, in the layout the calculation functions expect
+    entities: only read the rows of these entities (entity_column must be in the file)
+    columns: extra columns to read e.g. the entity column to keep it
+    filters: further pyarrow filters, combined with the entities
+    """
+    spec = INPUTS[name]
+    names = set(_pyarrow().dataset.dataset(path, format='parquet').schema.names)
+    optional = [c for c in spec['optional'] if c in names]
+    columns = list(dict.fromkeys(spec['columns'] + optional + list(columns or [])))
+    filters = list(filters or [])
+    if entities is not None:
+        filters.append((entity_column, 'in', list(entities)))
+    index = [c for c in spec['index'] if c in columns]
+    return read_parquet(path, columns, filters or None, spec['categorical'], index)
@@ -0,0 +1,130 @@
+"""
+Counterparty groups
+
+Single name exposures (Article 201) are exposures to a group of counterparties, identified by the ultimate parent.
+CounterpartyGroups resolves the parent links of the counterparty master (e.g. by LEI) once into:
+- ultimate: ultimate parent of each counterparty
+- codes(): integer single name code for any list of counterparties, counterparties not in the master are their own
+  single name
+The resolved index can be saved & loaded between runs, and updated incrementally when only a few parent links change.
+
+Test data:
+import pandas as pd
+parents = pd.Series({'Bank A': None, 'Bank A Sub': 'Bank A', 'Bank A SubSub': 'Bank A Sub', 'Bank B': None})
+groups = CounterpartyGroups(parents)
+groups.ultimate
+groups.update(pd.Series({'Bank A Sub': 'Bank B'}))
+groups.codes(['Bank A SubSub', 'Bank B', 'Bank C'])
+"""
+import numpy as np
+import pandas as pd
+
+
+class CounterpartyGroups:
+    """
+    Counterparty parent-child index
+    parents: pd.Series indexed by counterparty, value the direct parent (NaN/None if top of the group)
+    """
+
+    def __init__(self, parents: pd.Series):
+        self.counterparties = pd.Index(parents.index, name='counterparty')
+        if not self.counterparties.is_unique:
+            raise ValueError('Counterparties in the parent index must be unique')
+        self.parent_code = self._parent_codes(parents)
+        self.ultimate_code = _resolve(self.parent_code)
+
+    def _parent_codes(self, parents: pd.Series) -> np.array:
+        """ Position of the direct parent, self if no parent or parent unknown """
+        code = self.counterparties.get_indexer(parents.reindex(self.counterparties))
+        own = np.arange(len(code))
+        return np.where(code < 0, own, code)
+
+    @property
+    def parents(self) -> pd.Series:
+        parent = self.counterparties[self.parent_code].to_numpy(dtype=object)
+        parent[self.parent_code == np.arange(len(self.parent_code))] = None
+        return pd.Series(parent, index=self.counterparties, name='parent')
+
+    @property
+    def ultimate(self) -> pd.Series:
+        return pd.Series(self.counterparties[self.ultimate_code], index=self.counterparties, name='ultimate')
+
+    def codes(self, counterparties) -> tuple:
+        """
+        Single name code for each counterparty
+        Returns (codes, single_names): codes index into single_names (the ultimate parents)
+        """
+        ultimate = self.ultimate.reindex(pd.Index(counterparties))
+        ultimate = ultimate.fillna(pd.Series(ultimate.index, index=ultimate.index))
+        codes, single_names = pd.factorize(ultimate.to_numpy(), sort=True)
+        return codes, pd.Index(single_names, name='single_name')
+
+    def update(self, parents: pd.Series):
+        """
+        Change the parent of some counterparties (new counterparties are appended)
+        Only the changed counterparties and their descendants are resolved again.
+        If the new links contain a cycle, ValueError is raised and the groups are left unchanged.
+        """
+        state = self.counterparties, self.parent_code.copy(), self.ultimate_code.copy()
+        new = parents.index.difference(self.counterparties)
+        if len(new):
+            n = len(self.counterparties)
+            self.counterparties = self.counterparties.append(pd.Index(new)).rename('counterparty')
+            self.parent_code = np.concatenate((self.parent_code, np.arange(n, n + len(new))))
+            self.ultimate_code = np.concatenate((self.ultimate_code, np.arange(n, n + len(new))))
+
+        changed = self.counterparties.get_indexer(parents.index)
+        new_parent = self.counterparties.get_indexer(parents.to_numpy())
+        self.parent_code[changed] = np.where(new_parent < 0, changed, new_parent)
+
+        # Descendants of the changed counterparties:
+        affected = np.zeros(len(self.parent_code), bool)
+        affected[changed] = True
+        while True:
+            grown = affected | affected[self.parent_code]
+            if (grown == affected).all():
+                break
+            affected = grown
+
+        # Walk up from each affected counterparty until reaching one whose ultimate parent is still valid:
+        rows = np.flatnonzero(affected)
+        cur = rows.copy()
+        for _ in range(len(rows) + 1):
+            up = affected[cur] & (self.parent_code[cur] != cur)
+            if not up.any():
+                break
+            cur[up] = self.parent_code[cur[up]]
+        else:
+            self.counterparties, self.parent_code, self.ultimate_code = state
+            raise ValueError('Counterparty parent links contain a cycle')
+        self.ultimate_code[rows] = np.where(affected[cur], cur, self.ultimate_code[cur])
+        return self
+
+    def to_csv(self, path):
+        """ Saves the resolved index, reload with CounterpartyGroups.read_csv """
+        pd.DataFrame({'parent': self.parents, 'ultimate': self.ultimate}).to_csv(path)
+
+    @classmethod
+    def read_csv(cls, path):
+        df = pd.read_csv(path, index_col=0)
+        groups = cls.__new__(cls)
+        groups.counterparties = pd.Index(df.index, name='counterparty')
+        groups.parent_code = groups._parent_codes(df.parent)
+        groups.ultimate_code = groups.counterparties.get_indexer(df.ultimate)
+        if (groups.ultimate_code < 0).any():
+            raise ValueError(f'{path} is not a resolved counterparty index')
+        return groups
+
+
+def _resolve(parent_code: np.array) -> np.array:
+    """ Ultimate parent by pointer jumping, log2(depth) passes """
+    ultimate = parent_code.copy()
+    for _ in range(int(np.log2(max(len(ultimate), 1))) + 2):
+        jumped = ultimate[ultimate]
+        if (jumped == ultimate).all():
+            break
+        ultimate = jumped
+    # Every ultimate parent must be the top of its group, otherwise the links loop:
+    if (parent_code[ultimate] != ultimate).any():
+        raise ValueError('Counterparty parent links contain a cycle')
+    return ultimate
@@ -12,6 +12,15 @@ scr_default_t1
 # comparison with expected
 scr_default_t1 == dd.scr_def_t1_expected
 
+## type 1 for a stack of entities / scenarios
+stacked = pd.concat({s: dd.type_1.assign(balance=dd.type_1.balance * (1 + s)) for s in range(3)}, names=['scenario'])
+scr_def_t1_batch(stacked, 'scenario')
+
+## type 1 with exposures aggregated to single names, Bank B is part of the Bank A group
+from solvency2sf.counterparty import CounterpartyGroups
+groups = CounterpartyGroups(pd.Series({'Bank A': None, 'Bank B': 'Bank A'}))
+scr_def_t1(dd.type_1, groups)
+
 ## test type 2 default SCR
 type_2 = dd.type_2.copy()
 scr_default_t2 = scr_def_t2(type_2)
@@ -28,78 +37,178 @@ scr_def == dd.scr_def_expected
 
 """
 
+import numpy as np
 import pandas as pd
+from .instrumentation import instrumented
+from .reporting import record
 
 
-def scr_def(type1, type2):
+@instrumented
+def scr_def(type1, type2, groups=None, qrt_output=True):
     # Directive 2015/35
 
     # Article 200 & 201
-    scr_default_t1, type1_details = scr_def_t1(type1)
+    scr_default_t1, type1_details = scr_def_t1(type1, groups, qrt_output)
     # Article 202
     scr_default_t2 = scr_def_t2(type2)
     # Article 189.1
     scr_default = scr_def_agg(scr_default_t1, scr_default_t2)
+    record('s26_02_01', type1=scr_default_t1, type2=scr_default_t2, default=scr_default)
 
     return scr_default, scr_default_t1, scr_default_t2, type1_details
 
 
-def scr_def_t1(type1):
-    # Directive 2015/35
-    # Floor the values at 0 i.e. no negative balances:
-    type1.balance = type1.balance.apply(lambda x: max(x, 0))
+# Article 199 probability of default for each rating 0-6
+DEFAULT_PROBS = np.array([0.00002, 0.0001, 0.0005, 0.0024, 0.012, 0.042, 0.042])
+# Loss rate by category
+# TODO: merge loss rates from a table
+LOSS_RATES = {3: 1., 1: 0.5}
+
+
+def _variance_terms(probs):
+    """ Article 201 inter & intra variance factors, only depend on the default probabilities """
+    u = probs * (1 - probs)
+    v_inter = np.outer(u, u) / (1.25 * np.add.outer(probs, probs) - np.outer(probs, probs))
+    v_intra = 1.5 * u / (2.5 - probs)
+    return v_inter, v_intra
 
-    # TODO: merge loss rates from a table
-    type1.loc[type1.category == 3, 'loss_rate'] = 1
-    # rec.loc[pd.IndexSlice[1, :, 2], 'loss_rate'] = 0.9
-    type1.loc[type1.category == 1, 'loss_rate'] = 0.5
 
+_V_INTER, _V_INTRA = _variance_terms(DEFAULT_PROBS)
+
+
+@instrumented
+def scr_def_t1(type1, groups=None, qrt_output=True):
+    """
+    Type 1 default SCR
+    groups: CounterpartyGroups, if given exposures are first aggregated to single names (see single_names)
+    Returns (scr type 1, details), details None if qrt_output is False. type1 is not modified.
+    """
+    # Directive 2015/35
     # Article 192 Loss given default:
-    type1['lgd'] = type1.loss_rate * (type1.balance + 0.5 * type1.mitigation)
-    type1.lgd = type1.lgd.astype(float)
-    type1['lgd2'] = type1.lgd ** 2
+    balance, loss_rate, lgd = type1_lgd(type1.balance, type1.category, type1.mitigation)
+    rating = _rating_codes(type1.rating.to_numpy())
+    if groups is not None:
+        exposures = pd.DataFrame({'lgd': lgd, 'prob_def': DEFAULT_PROBS[rating]}, index=type1.index)
+        if 'counterparty' in type1:
+            exposures['counterparty'] = type1.counterparty.to_numpy()
+        single = single_names(exposures, groups)
+        # Article 201 on the distinct default probabilities of the single names:
+        probs, prob_code = np.unique(single.prob_def.to_numpy(), return_inverse=True)
+        lgd_by_prob = np.bincount(prob_code, weights=single.lgd.to_numpy(), minlength=len(probs))
+        lgd2_by_prob = np.bincount(prob_code, weights=single.lgd2.to_numpy(), minlength=len(probs))
+        t1 = float(scr_def_t1_from_lgd(lgd_by_prob, lgd2_by_prob, probs))
+        record('s26_02_01_type1', lgd=lgd_by_prob, lgd2=lgd2_by_prob, prob_def=probs)
+        return t1, single if qrt_output else None
 
     # Article 201
-    type1g = type1.groupby(by='rating').sum()[['lgd', 'lgd2']]
-
-    # Article 199
-    default_probs = pd.DataFrame([0.00002, 0.0001, 0.0005, 0.0024, 0.012, 0.042, 0.042], index=range(7),
-                                 columns=['prob_def'])
-    type1g = type1g.merge(default_probs, how='left', left_index=True, right_index=True)
-    type1 = type1.merge(default_probs, how='left', left_on='rating', right_index=True)
-
-    v_inter = 0
-    lgd = type1g.lgd.array
-    dp = type1g.prob_def.array
-    for j in range(len(type1g)):
-        for k in range(len(type1g)):
-            v_inter += dp[j] * (1 - dp[j]) * dp[k] * (1 - dp[k]) / (1.25 * (dp[j] + dp[k]) - dp[j] * dp[k]) * lgd[j] * \
-                       lgd[k]
-
-    v_intra = 0
-    lgd2 = type1g.lgd2.array
-    for j in range(len(type1g)):
-        v_intra += 1.5 * dp[j] * (1 - dp[j]) / (2.5 - dp[j]) * lgd2[j]
-
+    lgd_by_rating, lgd2_by_rating = _sum_by_rating(lgd, rating, np.zeros(len(type1), int), 1)
+    t1 = float(scr_def_t1_from_lgd(lgd_by_rating[0], lgd2_by_rating[0]))
+    record('s26_02_01_type1', lgd=lgd_by_rating[0], lgd2=lgd2_by_rating[0], prob_def=DEFAULT_PROBS)
+    if not qrt_output:
+        return t1, None
+    type1_details = type1.assign(balance=balance, loss_rate=loss_rate, lgd=lgd, lgd2=lgd ** 2,
+                                 prob_def=DEFAULT_PROBS[rating])
+    return t1, type1_details
+
+
+def type1_lgd(balance, category, mitigation) -> tuple:
+    """
+    Article 192 loss given default of each exposure, from column arrays
+    Returns (balance floored at 0, loss rate, lgd), NaN where the category has no loss rate
+    """
+    # Floor the values at 0 i.e. no negative balances:
+    balance = np.maximum(np.asarray(balance, dtype=float), 0.)
+    # Categories without a loss rate pick the NaN at the end:
+    rates = np.append(np.array(list(LOSS_RATES.values()), dtype=float), np.nan)
+    loss_rate = rates[pd.Index(list(LOSS_RATES)).get_indexer(np.asarray(category))]
+    lgd = loss_rate * (balance + 0.5 * np.asarray(mitigation, dtype=float))
+    return balance, loss_rate, lgd
+
+
+def _rating_codes(rating) -> np.array:
+    rating = np.asarray(rating).astype(int)
+    if ((rating < 0) | (rating >= len(DEFAULT_PROBS))).any():
+        raise ValueError('Type 1 rating must be 0-6')
+    return rating
+
+
+@instrumented
+def single_names(type1_details: pd.DataFrame, groups) -> pd.DataFrame:
+    """
+    Aggregates the exposures to single names (Article 201)
+    type1_details: as from scr_def_t1, counterparty in the index or a counterparty column
+    groups: CounterpartyGroups
+    - lgd: sum over the counterparties of the group
+    - prob_def: average of the probabilities of default weighted by lgd
+    """
+    counterparty = type1_details['counterparty'] if 'counterparty' in type1_details else type1_details.index
+    codes, names = groups.codes(counterparty)
+    lgd = np.nan_to_num(type1_details.lgd.to_numpy(dtype=float))
+    prob_def = type1_details.prob_def.to_numpy(dtype=float)
+    if np.isnan(prob_def).any():
+        raise ValueError('Type 1 rating must be 0-6')
+    sum_lgd = np.bincount(codes, weights=lgd, minlength=len(names))
+    sum_lgd_pd = np.bincount(codes, weights=lgd * prob_def, minlength=len(names))
+    # Names with no loss given default keep the simple average:
+    mean_pd = np.bincount(codes, weights=prob_def, minlength=len(names)) / np.bincount(codes, minlength=len(names))
+    name_pd = np.divide(sum_lgd_pd, sum_lgd, out=mean_pd, where=sum_lgd != 0)
+    return pd.DataFrame({'lgd': sum_lgd, 'lgd2': sum_lgd ** 2, 'prob_def': name_pd}, index=names)
+
+
+@instrumented
+def scr_def_t1_batch(type1: pd.DataFrame, by) -> pd.Series:
+    """
+    Type 1 default SCR for a stack of entities / scenarios in one call
+    type1: columns balance, rating, category, mitigation and the columns (or index levels) in by
+    by: column name(s) identifying each calculation e.g. ['entity', 'scenario']
+    Returns pd.Series of type 1 SCR indexed by the by keys
+    """
+    lgd = type1_lgd(type1.balance, type1.category, type1.mitigation)[2]
+
+    keys = type1.groupby(by, sort=True).ngroup().to_numpy()
+    index = type1.groupby(by, sort=True).size().index
+    lgd_by_rating, lgd2_by_rating = _sum_by_rating(lgd, _rating_codes(type1.rating.to_numpy()), keys, len(index))
+    record('s26_02_01_type1', index, lgd=lgd_by_rating, lgd2=lgd2_by_rating,
+           prob_def=np.broadcast_to(DEFAULT_PROBS, lgd_by_rating.shape))
+    return pd.Series(scr_def_t1_from_lgd(lgd_by_rating, lgd2_by_rating), index=index, name='scr_def_t1')
+
+
+@instrumented
+def scr_def_t1_from_lgd(lgd, lgd2, probs=None):
+    """
+    Type 1 default SCR from the loss given default summed by probability of default
+    lgd, lgd2: arrays (..., n) of sum of LGD and sum of squared LGD for each probability of default
+    probs: the n distinct probabilities of default, if None the 7 ratings 0-6 (DEFAULT_PROBS)
+    """
+    lgd = np.asarray(lgd, dtype=float)
+    v_inter, v_intra = (_V_INTER, _V_INTRA) if probs is None else _variance_terms(np.asarray(probs, dtype=float))
     # Article 201
+    v_inter = np.einsum('...j,jk,...k->...', lgd, v_inter, lgd)
+    v_intra = np.matmul(lgd2, v_intra)
     v_type1 = v_intra + v_inter
     # Article 200.4
-    sd_type1 = (v_type1) ** 0.5
-    total_lgd = type1g.lgd.sum()
+    sd_type1 = v_type1 ** 0.5
+    total_lgd = lgd.sum(axis=-1)
 
     # Article 200
-    sd_to_lgd = sd_type1 / total_lgd
-    # Article 200.1
-    if sd_to_lgd <= 0.07:
-        t1 = 3 * sd_type1
-    # Article 200.2
-    elif 0.07 < sd_to_lgd <= 0.2:
-        t1 = 5 * sd_type1
-    # Article 200.3
-    else:
-        t1 = total_lgd
-    type1_details=type1
-    return t1,type1_details
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sd_to_lgd = sd_type1 / total_lgd
+    # Article 200.1, 200.2, 200.3
+    return np.where(sd_to_lgd <= 0.07, 3 * sd_type1,
+                    np.where(sd_to_lgd <= 0.2, 5 * sd_type1, total_lgd))
+
+
+def _sum_by_rating(lgd, rating, keys, n_keys):
+    """
+    Sum LGD & LGD squared into (n_keys, 7) arrays, LGD not defined (category without loss rate) is ignored
+    rating: codes 0-6 as from _rating_codes
+    """
+    lgd = np.nan_to_num(lgd)
+    cell = keys * len(DEFAULT_PROBS) + rating
+    size = n_keys * len(DEFAULT_PROBS)
+    lgd_by_rating = np.bincount(cell, weights=lgd, minlength=size).reshape(n_keys, -1)
+    lgd2_by_rating = np.bincount(cell, weights=lgd ** 2, minlength=size).reshape(n_keys, -1)
+    return lgd_by_rating, lgd2_by_rating
 
 
 def scr_def_t2(type2):
@@ -0,0 +1,189 @@
+"""
+Instrumentation
+
+Opt-in profiling of the calculation stages. The main calculation functions are decorated with @instrumented and the
+CSV parameter reads are recorded by the parameter cache. Inside a profiling() block each call records a span:
+- the call stack of instrumented functions, as a path e.g. ('natcat_eur.specified_loss', 'natcat_eur.cresta_volumes')
+- wall time
+- rows processed: length of the first argument (data frame, series, array) if it has one
+- with memory=True, allocations measured with tracemalloc: the net allocation & peak above the start of the call
+
+Outside a profiling() block an instrumented function makes one dictionary lookup before calling through.
+
+Profiler.summary() gives calls, total & self time, rows and allocations by function. The spans export to the folded
+stack format of flamegraph.pl / speedscope (to_collapsed), or to Chrome trace events for chrome://tracing and
+Perfetto (to_chrome_trace).
+Stacks are per thread, so functions run on the StandardFormula thread pool are top level spans of their thread.
+Calculations in other processes are not recorded. tracemalloc is process wide, the allocations of concurrent threads
+are attributed to whichever spans are open.
+
+Test data:
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf.default import scr_def
+dd = Dummy_Data()
+with profiling(memory=True) as profiler:
+    scr_def(dd.type_1, dd.type_2)
+profiler.summary()
+print(profiler.to_collapsed())
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+_active = {'profiler': None}
+_lock = threading.RLock()
+
+
+class Profiler:
+    """ Spans recorded while profiling, see module docstring """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        # (path, thread, start, time, self time, rows, alloc, self alloc, peak), seconds & bytes.
+        # start is from the creation of the profiler.
+        self.spans = []
+        self.start = time.perf_counter()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name, rows=None):
+        """ Records the block as a call of name, nested in the open spans of this thread """
+        stack = self._stack()
+        memory = self.memory and tracemalloc.is_tracing()
+        # frame: path, memory at start, peak memory seen in the children, time & allocations of the children
+        frame = [(stack[-1][0] if stack else ()) + (name,), 0, 0, 0., 0]
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][2] = max(stack[-1][2], peak)
+            tracemalloc.reset_peak()
+            frame[1] = frame[2] = current
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            alloc = peak = 0
+            if memory:
+                current, top = tracemalloc.get_traced_memory()
+                top = max(top, frame[2])
+                alloc, peak = current - frame[1], top - frame[1]
+                tracemalloc.reset_peak()
+            if stack:
+                parent = stack[-1]
+                parent[2] = max(parent[2], frame[1] + peak)
+                parent[3] += elapsed
+                parent[4] += alloc
+            with _lock:
+                self.spans.append((frame[0], threading.get_ident(), start - self.start, elapsed,
+                                   elapsed - frame[3], rows, alloc, alloc - frame[4], peak))
+
+    def call(self, name, func, args, kwargs):
+        with self.span(name, _rows(args)):
+            return func(*args, **kwargs)
+
+    def frame(self) -> pd.DataFrame:
+        """ A row per span, self_time & self_alloc exclude the instrumented callees """
+        df = pd.DataFrame(self.spans, columns=['path', 'thread', 'start', 'time', 'self_time', 'rows', 'alloc',
+                                               'self_alloc', 'peak'])
+        df.insert(0, 'name', [path[-1] for path in df.path])
+        return df
+
+    def summary(self) -> pd.DataFrame:
+        """ By function: calls, total & self time, rows and allocations (MB) """
+        df = self.frame()
+        res = df.groupby('name').agg(calls=('time', 'size'), time=('time', 'sum'), self_time=('self_time', 'sum'),
+                                     rows=('rows', 'sum'), alloc_mb=('alloc', 'sum'), peak_mb=('peak', 'max'))
+        res[['alloc_mb', 'peak_mb']] /= 2 ** 20
+        return res.sort_values('time', ascending=False)
+
+    def to_collapsed(self, path=None, measure='time') -> str:
+        """
+        Folded stacks "a;b;c value", one line per call path, for flamegraph.pl or speedscope
+        measure: 'time' (self time in microseconds) or 'alloc' (net bytes allocated by the function itself)
+        """
+        df = self.frame()
+        value = (df.self_time * 1e6).round() if measure == 'time' else df.self_alloc
+        folded = value.groupby(df.path.map(';'.join).to_numpy(), sort=True).sum()
+        text = ''.join(f'{stack} {int(v)}\n' for stack, v in folded.items() if v > 0)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path=None) -> dict:
+        """ Chrome trace events (complete events, microseconds), for chrome://tracing or Perfetto """
+        events = [{'name': p[-1], 'ph': 'X', 'ts': start * 1e6, 'dur': elapsed * 1e6, 'pid': 0, 'tid': thread,
+                   'args': {'rows': rows, 'alloc': alloc, 'peak': peak}}
+                  for p, thread, start, elapsed, _, rows, alloc, _, peak in self.spans]
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+
+def _rows(args):
+    if args:
+        try:
+            return len(args[0])
+        except TypeError:
+            return None
+    return None
+
+
+@contextlib.contextmanager
+def profiling(profiler: Profiler = None, memory=False):
+    """ Profiles the instrumented functions called in the block, memory: also trace allocations """
+    profiler = Profiler(memory) if profiler is None else profiler
+    started = profiler.memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    with _lock:
+        previous = _active['profiler']
+        _active['profiler'] = profiler
+    try:
+        yield profiler
+    finally:
+        with _lock:
+            _active['profiler'] = previous
+        if started:
+            tracemalloc.stop()
+
+
+def active() -> bool:
+    return _active['profiler'] is not None
+
+
+def instrumented(func=None, name=None):
+    """ Decorator recording the calls of func while profiling, name defaults to module.function e.g. mkt.spread """
+    if func is None:
+        return functools.partial(instrumented, name=name)
+    name = name or func.__module__.rsplit('.', 1)[-1] + '.' + func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active['profiler']
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(name, func, args, kwargs)
+
+    return wrapper
+
+
+def span(name, rows=None):
+    """ Records a block inside a function as its own stage, e.g. with span('premres.volumes'): ... """
+    profiler = _active['profiler']
+    return contextlib.nullcontext() if profiler is None else profiler.span(name, rows)
@@ -47,14 +47,36 @@ tp_l = pd.Series(
  4: 800}, name='tp_l')
 car_l = 10000
 scr = 22785.9
+mcr(nwp, tp_nl_net, tp_l, car_l, scr)
+
+# Many entities: a row per entity
+nwp_e = pd.DataFrame([nwp, 2 * nwp], index=['E1', 'E2'])
+tp_nl_e = pd.DataFrame([tp_nl_net, tp_nl_net], index=['E1', 'E2'])
+tp_l_e = pd.DataFrame([tp_l, tp_l], index=['E1', 'E2'])
+mcr_batch(nwp_e, tp_nl_e, tp_l_e, pd.Series({'E1': car_l, 'E2': car_l}), pd.Series({'E1': scr, 'E2': 2e7}))
 """
 
 import os
 import pathlib
 import pandas as pd
 import numpy as np
+from ..instrumentation import instrumented
+from ..parameters import parameter
+from ..reporting import active, current_entity, record
+
+# Basic MCR parameters:
+AMCR = 4000000
+EWI_L = 3
+EWI_NL = 1.75
+BOUND_FLOOR = 0.25
+BOUND_CAP = 0.45
+# Life technical provision factors by MCR life group 1-4:
+TP_LIFE_FACTORS = {1: 0.037, 2: -0.052, 3: 0.007, 4: 0.021}
+# Rows of the MCR calculation in S.28.01.01.05
+S28_01_01_05 = ['mcr_linear', 'scr', 'mcr_cap', 'mcr_floor', 'mcr_combined', 'amcr', 'mcr']
 
 
+@parameter
 def get_factors():
     """
     Reads the factors used in the MCR calculation
@@ -74,58 +96,125 @@ def mcr(
         tp_l: pd.Series,
         car_l: float,
         scr: float,
-        debug_output={}
+        debug_output=None,
+        qrt_output=True
 ):
     """
     This function calculate:
      - MCR
      - MCR NL Linear
      - MCR L Linear
+    qrt_output: if False the S.28 tables are not added to debug_output
      """
+    debug_output = {} if debug_output is None else debug_output
+    lobs = tp_nl_net.index.union(nwp.index, sort=False)
+    # The row is keyed by the reporting entity, if recording:
+    key = current_entity()
+    res = mcr_batch(_row(nwp.reindex(lobs), key), _row(tp_nl_net.reindex(lobs), key), _row(tp_l, key), car_l, scr,
+                    qrt_output=qrt_output)
+    if not qrt_output:
+        return res['mcr'].iloc[0], debug_output
+    res, qrt = res
+    s28_01_01_02 = qrt['s28_01_01_02'].droplevel(0)
+    debug_output['mcr'] = {
+        's28_01_01_02': s28_01_01_02.rename(columns={'tp_nl_net': tp_nl_net.name, 'nwp': nwp.name}),
+        's28_01_01_05': qrt['s28_01_01_05'].T.set_axis(['C0070'], axis=1),
+    }
+    return res['mcr'].iloc[0], debug_output
+
 
-    # Basic MCR parameters:
-    amcr = 4000000
-    ewi_l = 3
-    ewi_nl = 1.75
-    bound_floor = 0.25
-    bound_cap = 0.45
+def _row(series: pd.Series, key) -> pd.DataFrame:
+    return pd.DataFrame([series.to_numpy()], columns=series.index, index=[key])
 
+
+@instrumented
+def mcr_batch(
+        nwp: pd.DataFrame,
+        tp_nl_net: pd.DataFrame,
+        tp_l: pd.DataFrame = None,
+        car_l=0.,
+        scr=0.,
+        qrt_output=False
+):
+    """
+    MCR for many entities and/or periods at once
+    - nwp, tp_nl_net: a row per entity (any index e.g. entity & period), a column per s2model
+    - tp_l: column per life MCR group 1-4
+    - car_l, scr: pd.Series with the same index, or scalars. car_l missing for an entity is 0, scr must be given
+    Returns a pd.DataFrame with a row per entity: linear NL & L, cap, floor, combined, MCR and early warning
+    qrt_output: returns (results, {'s28_01_01_02': detail by entity & s2model, 's28_01_01_05': by entity})
+    """
+    index = nwp.index
+    lobs = nwp.columns.union(tp_nl_net.columns, sort=False)
+    nwp = nwp.reindex(index=index, columns=lobs).fillna(0.)
     # MCR NL: TP should be input as positive liabilities. Floor to 0
-    tp_nl_net = tp_nl_net.apply(lambda x: np.maximum(x, 0))
-    df = pd.concat((tp_nl_net, nwp), axis=1)
-    factors = get_factors()
-    df = df.merge(factors, how='left', left_index=True, right_index=True)
-
-    mcr_tp_nl = (df.tp_net * df.tp_alpha).sum()
-    mcr_prem_nl = (df.nwp * df.premium_beta).sum()
-    mcr_linear_nl = mcr_tp_nl + mcr_prem_nl
-
-    # MCR Life: TP life grouped accoring to MCR definitions:
-    # Floor the TP to zero
-    tp_l = tp_l.apply(lambda x: np.maximum(x, 0))
-    tp_life_factors = pd.Series({1: 0.037, 2: -0.052, 3: 0.007, 4: 0.021}, name='factor_l')
-    df_life = pd.concat((tp_l, tp_life_factors), axis=1)
-    mcr_linear_l = df_life.product(axis=1).sum() + 0.0007 * car_l
+    tp_nl_net = tp_nl_net.reindex(index=index, columns=lobs).fillna(0.).clip(lower=0.)
+    factors = get_factors().reindex(lobs)
+    if tp_l is None:
+        tp_l = pd.DataFrame(index=index, columns=list(TP_LIFE_FACTORS), dtype=float)
+    tp_l = tp_l.reindex(index=index, columns=list(TP_LIFE_FACTORS)).fillna(0.)
+
+    mcr_linear_nl = linear_nl(nwp.to_numpy(dtype=float), tp_nl_net.to_numpy(dtype=float), factors)
+    mcr_linear_l = linear_l(tp_l.to_numpy(dtype=float), _values(car_l, index, 'car_l', fill=0.))
 
     # MCR Combined:
-    mcr_linear = mcr_linear_l + mcr_linear_nl
-    mcr_cap = scr * bound_cap
-    mcr_floor = scr * bound_floor
-    mcr_combined = np.minimum(np.maximum(mcr_linear, mcr_floor), mcr_cap)
-    mcr = np.maximum(mcr_combined, amcr)
-    early_warning = ewi_l * mcr_linear_l + ewi_nl * mcr_linear_nl
-
-    mcr_debug = {
-            's28_01_01_02': df,
-            's28_01_01_05': pd.DataFrame.from_dict({
-                'mcr_linear': mcr_linear,
-                'scr': scr,
-                'mcr_cap': mcr_cap,
-                'mcr_floor': mcr_floor,
-                'mcr_combined': mcr_combined,
-                'amcr': amcr,
-                'mcr': mcr
-            }, orient='index', columns=['C0070'])
-        }
-    debug_output['mcr'] = mcr_debug
-    return mcr, debug_output
+    scr = _values(scr, index, 'scr')
+    res = pd.DataFrame({
+        'mcr_linear_nl': mcr_linear_nl,
+        'mcr_linear_l': mcr_linear_l,
+        'mcr_linear': mcr_linear_nl + mcr_linear_l,
+        'scr': scr,
+        'mcr_cap': scr * BOUND_CAP,
+        'mcr_floor': scr * BOUND_FLOOR,
+    }, index=index)
+    res['mcr_combined'] = np.minimum(np.maximum(res.mcr_linear, res.mcr_floor), res.mcr_cap)
+    res['amcr'] = AMCR
+    res['mcr'] = np.maximum(res.mcr_combined, AMCR)
+    res['early_warning'] = EWI_L * mcr_linear_l + EWI_NL * mcr_linear_nl
+    if active():
+        shape = (len(index), len(lobs))
+        record('s28_01_01_02', index, lobs=lobs, tp_nl_net=tp_nl_net.to_numpy(dtype=float), nwp=nwp.to_numpy(dtype=float),
+               premium_beta=np.broadcast_to(factors.premium_beta.to_numpy(), shape),
+               tp_alpha=np.broadcast_to(factors.tp_alpha.to_numpy(), shape))
+        record('s28_01_01_05', index, **{c: res[c].to_numpy() for c in S28_01_01_05})
+    if not qrt_output:
+        return res
+
+    detail = pd.concat({'tp_nl_net': tp_nl_net.stack(), 'nwp': nwp.stack()}, axis=1)
+    lob = detail.index.get_level_values(-1)
+    detail['premium_beta'] = factors.premium_beta.reindex(lob).to_numpy()
+    detail['tp_alpha'] = factors.tp_alpha.reindex(lob).to_numpy()
+    qrt = {
+        's28_01_01_02': detail,
+        's28_01_01_05': res[S28_01_01_05],
+    }
+    return res, qrt
+
+
+def linear_nl(nwp, tp_nl_net, factors: pd.DataFrame):
+    """ Linear NL MCR, nwp & tp_nl_net: arrays (..., lob) ordered as factors, tp floored at 0 """
+    alpha = factors.tp_alpha.fillna(0.).to_numpy()
+    beta = factors.premium_beta.fillna(0.).to_numpy()
+    return np.matmul(np.maximum(tp_nl_net, 0.), alpha) + np.matmul(nwp, beta)
+
+
+def linear_l(tp_l, car_l):
+    """ Linear life MCR, tp_l: array (..., 4) by life group 1-4 floored at 0, car_l: capital at risk """
+    return np.matmul(np.maximum(tp_l, 0.), np.array(list(TP_LIFE_FACTORS.values()))) + 0.0007 * car_l
+
+
+def combined(mcr_linear, scr):
+    """ MCR from the linear MCR: bounded by the floor & cap on the SCR, then the absolute floor """
+    return np.maximum(np.minimum(np.maximum(mcr_linear, BOUND_FLOOR * scr), BOUND_CAP * scr), AMCR)
+
+
+def _values(x, index, name, fill=None) -> np.array:
+    """ Scalar or pd.Series aligned to index, missing values are fill or an error if fill is None """
+    if isinstance(x, pd.Series):
+        x = x.reindex(index)
+        if fill is not None:
+            return x.fillna(fill).to_numpy(dtype=float)
+        if x.isna().any():
+            raise ValueError(f'{name} missing for {list(index[x.isna().to_numpy()])}')
+        return x.to_numpy(dtype=float)
+    return np.full(len(index), float(x))
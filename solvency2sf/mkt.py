@@ -22,39 +22,105 @@ exposure_types:
 import numpy as np
 import pandas as pd
 
+from .columnar import category_codes
+from .instrumentation import instrumented
 
-def equity(equities: pd.DataFrame, symmetric_adjustment: float) -> pd.DataFrame:
+
+# exposure_type: (alpha, beta), shock = alpha + beta * symmetric_adjustment
+EQUITY_SHOCK_PARAMS = {
+    'strategic_long_term': (0.22, 0.),
+    'type1': (0.39, 1.),
+    'type2': (0.49, 1.),
+    'infra_corp': (0.36, 0.92),
+    'infra_other': (0.3, 0.77),
+}
+
+
+_EQUITY_TYPES = pd.Index(list(EQUITY_SHOCK_PARAMS))
+# (alpha, beta) by exposure type code:
+_EQUITY_SHOCKS = np.array(list(EQUITY_SHOCK_PARAMS.values()))
+# Type 1 equities are one shock group, all the other types the other group
+_EQUITY_TYPE1 = np.asarray(_EQUITY_TYPES == 'type1')
+
+
+@instrumented
+def equity(equities: pd.DataFrame, symmetric_adjustment: float) -> pd.Series:
     """
     Shock = alpha + beta * symmetric_adjustment
 
-    :param equities:: data frame with columns mv, exposure_type
+    :param equities:: data frame with columns mv, exposure_type. Not modified.
     :param symmetric_adjustment:
-    :return:
+    :return: pd.Series of the losses of the shock groups (other, type1) & the scr
     """
-    shock_params = {
-        'strategic_long_term': (0.22, 0.),
-        'type1': (0.39, 1.),
-        'type2': (0.49, 1.),
-        'infra_corp': (0.36, 0.92),
-        'infra_other': (0.3, 0.77),
-    }
-    equities['shock_params'] = equities.exposure_type.map(shock_params)
-    equities['shock'] = equities.shock_params.apply(lambda param: param[0] + param[1] * symmetric_adjustment)
-    equities['loss'] = equities.mv * equities.shock
-    equities['shock_group'] = equities.exposure_type.map({'type1': 'type1'}).fillna('other')
-    eq = equities.groupby('shock_group').sum()['loss']
-    eq['scr'] = (eq.type1 ** 2 +
-                 2 * 0.75 * eq.type1 * eq.other +
-                 eq.other ** 2) ** 0.5
-    return eq
+    type1, other, scr = equity_arrays(equities.mv, equities.exposure_type, symmetric_adjustment)
+    return pd.Series({'other': float(other), 'type1': float(type1), 'scr': float(scr)}, name='loss')
 
 
+@instrumented
+def equity_batch(equities: pd.DataFrame, symmetric_adjustment) -> pd.DataFrame:
+    """
+    Equity risk for a vector of symmetric adjustments at once, e.g. each month's or a +/-5pp sensitivity ladder
+    :param equities: data frame with columns mv, exposure_type. Not modified.
+    :param symmetric_adjustment: list / array of symmetric adjustments
+    :return: pd.DataFrame indexed by symmetric_adjustment, columns type1 & other (losses), scr
+    """
+    sa = np.atleast_1d(np.asarray(symmetric_adjustment, dtype=float))
+    type1, other, scr = equity_arrays(equities.mv, equities.exposure_type, sa)
+    return pd.DataFrame({'type1': type1, 'other': other, 'scr': scr},
+                        index=pd.Index(sa, name='symmetric_adjustment'))
+
+
+def equity_codes(exposure_type) -> np.array:
+    """ Integer codes into EQUITY_SHOCK_PARAMS, categoricals are mapped by their categories """
+    code = category_codes(_EQUITY_TYPES, exposure_type)
+    if (code < 0).any():
+        unknown = set(np.asarray(exposure_type, dtype=object)[code < 0])
+        raise ValueError(f"Unknown equity exposure_type: {unknown}")
+    return code
+
+
+def equity_arrays(mv, exposure_type, symmetric_adjustment) -> tuple:
+    """
+    Equity losses & scr for any number of symmetric adjustments
+    :param mv: market values (..., n)
+    :param exposure_type: (n,) labels, or codes from equity_codes
+    :param symmetric_adjustment: scalar or array broadcasting against the leading axes of mv
+    :return: (type1 loss, other loss, scr)
+
+    The losses are linear in the symmetric adjustment: the market values are summed by exposure type once,
+    then each adjustment is a few operations on the shock group totals.
+    """
+    dtype = getattr(exposure_type, 'dtype', None)
+    if isinstance(dtype, np.dtype) and np.issubdtype(dtype, np.integer):
+        code = np.asarray(exposure_type)
+    else:
+        code = equity_codes(exposure_type)
+    mv = np.nan_to_num(np.asarray(mv, dtype=float))
+    if mv.ndim == 1:
+        mv_by_type = np.bincount(code, weights=mv, minlength=len(_EQUITY_TYPES))
+    else:
+        mv_by_type = np.stack([mv[..., code == c].sum(axis=-1) for c in range(len(_EQUITY_TYPES))], axis=-1)
+    alpha = mv_by_type * _EQUITY_SHOCKS[:, 0]
+    beta = mv_by_type * _EQUITY_SHOCKS[:, 1]
+    sa = np.asarray(symmetric_adjustment, dtype=float)
+    type1 = alpha[..., _EQUITY_TYPE1].sum(axis=-1) + beta[..., _EQUITY_TYPE1].sum(axis=-1) * sa
+    other = alpha[..., ~_EQUITY_TYPE1].sum(axis=-1) + beta[..., ~_EQUITY_TYPE1].sum(axis=-1) * sa
+    scr = (type1 ** 2 +
+           2 * 0.75 * type1 * other +
+           other ** 2) ** 0.5
+    return type1, other, scr
+
+
+@instrumented
 def concentration(asset_list: pd.DataFrame) -> float:
     """
     asset_list should be a pd.Dataframe with columns:
     - mv: market value
     - exposure_type:
     - cc_step: 0-6 & 7 is unrated
+    - counterparty: optional, single name exposure identifier.
+      If not provided each row is treated as a separate single name exposure, as is each row with a missing
+      counterparty.
 
     asset_list = pd.DataFrame([[10.   , 1   , 2],
        [20.   , 3   , 3],
@@ -63,60 +129,108 @@ def concentration(asset_list: pd.DataFrame) -> float:
     :param asset_list:
     :return:
     """
-    # Total amount of assets considered in this module:
-    assets_xl = asset_list.mv.sum()
+    conc = concentration_details(asset_list)
+    mkt_conc = np.square(conc.Conc.to_numpy()).sum() ** 0.5
+    return mkt_conc
+
 
-    asset_list['gi'] = asset_list.apply(lambda x: gi(x.cc_step, exposure_type=x.exposure_type), axis=1)
+@instrumented
+def concentration_details(asset_list: pd.DataFrame) -> pd.DataFrame:
+    """
+    Excess exposure and concentration risk charge for each single name exposure
+    - gi and the relative excess exposure threshold ct are gathered from the parameter tables
+    - rows are aggregated to single names with a single groupby on counterparty
+    - Article 184: the cc_step of a single name is the exposure weighted average, rounded up
+    - a single name holding several exposure types (e.g. deposits & bonds) has gi averaged over the types weighted
+      by market value, i.e. its excess exposure is split by type in proportion to mv
 
-    # Credit quality step 7 is unrated
-    credit_threshold = [0.03, 0.03, 0.03, 0.015, 0.015, 0.015, 0.015, 0.015]
+    Does not modify asset_list.
+    """
+    mv = asset_list.mv.fillna(0.).to_numpy(dtype=float)
+    cc_step = asset_list.cc_step.to_numpy().astype(int)
+    type_code = _conc_type_codes(asset_list.exposure_type)
+
+    # Total amount of assets considered in this module:
+    assets_xl = mv.sum()
+
+    if 'counterparty' in asset_list.columns:
+        # Single names: the excess of a name holding several exposure types is split by type in proportion to mv.
+        # A row without counterparty is a single name of its own, labelled by its row index:
+        name, index = pd.factorize(asset_list.counterparty.to_numpy())
+        missing = name < 0
+        name[missing] = len(index) + np.arange(missing.sum())
+        index = pd.Index(index).append(asset_list.index[missing])
+        n, n_types = len(index), len(_GI_TYPES)
+        mv_by_type = np.bincount(name * n_types + type_code, weights=mv, minlength=n * n_types).reshape(n, n_types)
+        row_mv, mv = mv, mv_by_type.sum(axis=1)
+        cc_mv = np.bincount(name, weights=cc_step * row_mv, minlength=n)
+        cc_step = np.ceil(np.divide(cc_mv, mv, out=np.full(n, 7.), where=mv != 0))
+        cc_step = np.minimum(cc_step, 7).astype(int)
+        # gi of each type at the cc_step of the name weighted by mv, the type of the first row if the name has no mv:
+        gi_by_type = _GI_TABLE[:, cc_step].T
+        first_type = type_code[np.unique(name, return_index=True)[1]]
+        gi_ = np.divide((mv_by_type * gi_by_type).sum(axis=1), mv, out=gi_by_type[np.arange(n), first_type],
+                        where=mv != 0)
+    else:
+        gi_ = _GI_TABLE[type_code, cc_step]
+        index = asset_list.index
 
     # Relative excess exposure threshold
-    asset_list['ct'] = asset_list.cc_step.apply(credit_threshold.__getitem__)
+    ct = _CREDIT_THRESHOLD[cc_step]
+    xs_exposure = np.maximum(0., mv / assets_xl - ct)
 
-    asset_list.mv = asset_list.mv.fillna(0.)
-    asset_list["xs_exposure"] = asset_list.apply(lambda x: max(0., x.mv / assets_xl - x.ct), axis=1)
+    return pd.DataFrame({
+        'mv': mv,
+        'gi': gi_,
+        'ct': ct,
+        'xs_exposure': xs_exposure,
+        'Conc': xs_exposure * gi_ * assets_xl
+    }, index=index)
 
-    asset_list['Conc'] = asset_list.xs_exposure * asset_list.gi * assets_xl
-    mkt_conc = np.square(asset_list.Conc).sum() ** 0.5
 
-    return mkt_conc
+# Risk factor gi for each exposure type (rows) and cc_step (columns), 7 is unrated.
+# Exposure types not listed use the standard row.
+_GI_PARAMS = {
+    'standard': [0.12, 0.12, 0.21, 0.27, 0.73, 0.73, 0.73, 0.73],
+    # cc step mapping should  translate to solvency ratios
+    'ri_mcr': [0.12, 0.21, 0.27, 0.645, 0.73, 0.73, 0.73, 0.73],
+    'unrated_credit_financial': [0.645] * 8,
+    'single_property': [0.12] * 8,
+    'gov_eea': [0.] * 8,
+    'gov_non_eea': [0., 0., 0.12, 0.21, 0.27, 0.73, 0.73, 0.73],
+}
+_GI_TYPES = pd.Index(list(_GI_PARAMS))
+_GI_TABLE = np.array(list(_GI_PARAMS.values()))
+
+# Credit quality step 7 is unrated
+_CREDIT_THRESHOLD = np.array([0.03, 0.03, 0.03, 0.015, 0.015, 0.015, 0.015, 0.015])
+
+
+def _conc_type_codes(exposure_type) -> np.array:
+    """ Integer codes into _GI_TABLE, anything not listed maps to standard (0) """
+    return np.maximum(category_codes(_GI_TYPES, exposure_type), 0)
 
 
 def gi(cc_step: int, exposure_type: str) -> float:
-    if exposure_type == 'ri_mcr':
-        # cc step mapping should  translate to solvency ratios
-        gi_table = [0.12, 0.21, 0.27, 0.645, 0.73]
-        return gi_table[min(4, cc_step)]
-    if exposure_type == 'unrated_credit_financial':
-        return 0.645
-    if exposure_type == 'single_property':
-        return 0.12
-    if exposure_type == 'gov_eea':
-        return 0.
-    if exposure_type == 'gov_non_eea':
-        gi_table = [0., 0., 0.12, 0.21, 0.27, 0.73, 0.73, 0.73]
-        return gi_table[cc_step]
-    else:
-        gi_table = [0.12, 0.12, 0.21, 0.27, 0.73, 0.73, 0.73, 0.73]
-        return gi_table[cc_step]
+    return float(_GI_TABLE[_conc_type_codes([exposure_type])[0], cc_step])
 
 
+@instrumented
 def spread(bonds=None, securities=None, credit_derivatives=None) -> float:
     """
     Each item should be a pd.DataFrame with columns: mv, cc_step, duration
+    - bonds are keyed on exposure_type, securities on type
+
+    The stress factors are looked up for all rows in one pass with spread_factors.
+    Does not modify the inputs, see spread_details for the factor & loss of each row.
     """
     if bonds is not None:
-        bonds['f_up'] = bonds.apply(lambda x: f_up(x.cc_step, x.duration, exposure_type=x.exposure_type), axis=1)
-        bonds['delta_bof'] = bonds.mv * bonds.f_up
-        mkt_spread_bonds = max(0., bonds.delta_bof.sum())
+        mkt_spread_bonds = max(0., np.nansum(spread_losses(bonds)))
     else:
         mkt_spread_bonds = 0.
 
     if securities is not None:
-        securities['f_up'] = securities.apply(lambda x: f_up(x.cc_step, x.duration, exposure_type=x.type), axis=1)
-        securities['delta_bof'] = securities.mv * securities.f_up
-        mkt_spread_sec = max(0., bonds.delta_bof.sum())
+        mkt_spread_sec = max(0., np.nansum(spread_losses(securities, 'type')))
     else:
         mkt_spread_sec = 0.
     if credit_derivatives is not None:
@@ -128,78 +242,110 @@ def spread(bonds=None, securities=None, credit_derivatives=None) -> float:
     return mkt_spread
 
 
+def spread_losses(exposures: pd.DataFrame, type_column='exposure_type') -> np.array:
+    """ Loss in basic own funds (delta_bof) of each row: mv * f_up """
+    return exposures.mv.to_numpy(dtype=float) * spread_factors(exposures.cc_step, exposures.duration,
+                                                               exposures[type_column])
+
+
+def spread_details(exposures: pd.DataFrame, type_column='exposure_type') -> pd.DataFrame:
+    """ f_up & delta_bof of each row, indexed as exposures """
+    f_up = spread_factors(exposures.cc_step, exposures.duration, exposures[type_column])
+    return pd.DataFrame({'f_up': f_up, 'delta_bof': exposures.mv.to_numpy(dtype=float) * f_up}, index=exposures.index)
+
+
+def _spread_table(table) -> np.array:
+    """ Pad a factor table to the full (duration bucket x cc_step) shape, NaN where no factor is defined """
+    table = np.atleast_2d(np.array(table, dtype=float))
+    padded = np.full((5, 8), np.nan)
+    padded[:table.shape[0], :table.shape[1]] = table
+    return padded
+
+
+# Spread risk parameters for each exposure type: (alpha, beta, max duration bucket)
+# Rows are duration buckets of 5 years, columns are cc_step.
+# f = alpha + beta * (duration - 5 * duration bucket), capped at 1
+_SPREAD_PARAMS = {
+    'bonds': (
+        [[0., 0., 0., 0., 0., 0., 0., 0.],
+         [0.045, 0.055, 0.07, 0.125, 0.225, 0.375, 0.375, 0.15],
+         [0.07, 0.084, 0.105, 0.2, 0.35, 0.585, 0.585, 0.235],
+         [0.095, 0.109, 0.13, 0.25, 0.44, 0.61, 0.61, 0.235],
+         [0.12, 0.134, 0.155, 0.3, 0.465, 0.635, 0.635, 0.355]],
+        [[0.009, 0.011, 0.014, 0.025, 0.045, 0.075, 0.075, 0.03],
+         [0.005, 0.006, 0.007, 0.015, 0.025, 0.042, 0.042, 0.017],
+         [0.005, 0.005, 0.005, 0.01, 0.018, 0.005, 0.005, 0.012],
+         [0.005, 0.005, 0.005, 0.01, 0.005, 0.005, 0.005, 0.0116],
+         [0.005, 0.005, 0.005, 0.005, 0.005, 0.005, 0.005, 0.005]],
+        4),
+    # Not dependent on cc_step:
+    'ri_no_mcr': (
+        np.repeat([[0.], [0.375], [0.585], [0.61], [0.635]], 8, axis=1),
+        np.repeat([[0.075], [0.042], [0.005], [0.005], [0.005]], 8, axis=1),
+        4),
+    'eea_covered': (
+        [[0., 0.],
+         [0.035, 0.045]],
+        [[0.007, 0.009],
+         [0.005, 0.005]],
+        1),
+    'gov_eea': (np.zeros((1, 8)), np.zeros((1, 8)), 0),
+    'gov_non_eea': (
+        [[0., 0., 0., 0., 0., 0., 0., 0.],
+         [0., 0., 0.055, 0.07, 0.125, 0.225, 0.225, 0.225],
+         [0., 0., 0.084, 0.105, 0.2, 0.35, 0.35, 0.35],
+         [0., 0., 0.109, 0.13, 0.25, 0.44, 0.44, 0.44],
+         [0., 0., 0.134, 0.155, 0.3, 0.465, 0.465, 0.465]],
+        [[0., 0., 0.011, 0.014, 0.025, 0.045, 0.045, 0.045],
+         [0., 0., 0.006, 0.007, 0.015, 0.025, 0.025, 0.025],
+         [0., 0., 0.005, 0.005, 0.01, 0.018, 0.018, 0.018],
+         [0., 0., 0.005, 0.005, 0.01, 0.005, 0.005, 0.005],
+         [0., 0., 0.005, 0.005, 0.005, 0.005, 0.005, 0.005]],
+        1),
+    # Securitisations: f = beta * duration
+    'sec_type1': (np.zeros((1, 4)), [0.021, 0.042, 0.074, 0.085], 0),
+    'sec_type2': (np.zeros((1, 7)), [0.125, 0.134, 0.166, 0.197, 0.82, 1., 1.], 0),
+    'resec': (np.zeros((1, 7)), [0.33, 0.4, 0.51, 0.91, 1., 1., 1.], 0),
+}
+_SPREAD_TYPES = pd.Index(list(_SPREAD_PARAMS))
+_SPREAD_ALPHA = np.stack([_spread_table(p[0]) for p in _SPREAD_PARAMS.values()])
+_SPREAD_BETA = np.stack([_spread_table(p[1]) for p in _SPREAD_PARAMS.values()])
+_SPREAD_MAX_BUCKET = np.array([p[2] for p in _SPREAD_PARAMS.values()])
+
+
+@instrumented
+def spread_factors(cc_step, duration, exposure_type) -> np.array:
+    """
+    Vectorised f_up: stress factors for arrays of cc_step, duration & exposure_type
+    :param cc_step: maps to rating 0-6, & 7 is unrated.
+    :param duration:
+    :param exposure_type: bonds, ri_no_mcr, eea_covered, gov_eea ,gov_non_eea, sec_type1, sec_type2, resec
+    :return: np.array of factors to apply to market value in stress
+    """
+    cc_step = np.asarray(cc_step).astype(int)
+    duration = np.asarray(duration, dtype=float)
+    type_code = category_codes(_SPREAD_TYPES, exposure_type)
+    if (type_code < 0).any():
+        unknown = set(np.asarray(exposure_type, dtype=object)[type_code < 0])
+        raise ValueError(f"Unknown spread exposure_type: {unknown}")
+
+    dur_index = np.minimum(duration // 5, _SPREAD_MAX_BUCKET[type_code]).astype(int)
+    duration_adjustment = dur_index * 5
+    f = (_SPREAD_ALPHA[type_code, dur_index, cc_step] +
+         _SPREAD_BETA[type_code, dur_index, cc_step] * (duration - duration_adjustment))
+    if np.isnan(f).any():
+        raise ValueError("No spread factor defined for some cc_step / exposure_type combinations")
+    return np.minimum(1., f)
+
+
 def f_up(cc_step: int, duration: int, exposure_type: str = 'bonds') -> float:
     """
     Factor to apply to market value in stress
     :param cc_step: maps to rating 0-6, & 7 is unrated.
     :param duration:
-    :param type: bonds, ri_no_mcr, eea_covered, gov_eea ,gov_non_eea, sec_type1, sec_type2, resec
+    :param exposure_type: bonds, ri_no_mcr, eea_covered, gov_eea ,gov_non_eea, sec_type1, sec_type2, resec
     :return:
 
     f = alpha + beta * (duration - duration index adjustment)
     """
-    if exposure_type == 'bonds':
-        # Duration index 0-5
-        dur_index = int(min(duration // 5, 4))
-        duration_adjustment = dur_index * 5
-        # print(dur_index)
-        # Row is duration, column is cc_step
-        alpha = np.array([
-            [0., 0., 0., 0., 0., 0., 0., 0.],
-            [0.045, 0.055, 0.07, 0.125, 0.225, 0.375, 0.375, 0.15],
-            [0.07, 0.084, 0.105, 0.2, 0.35, 0.585, 0.585, 0.235],
-            [0.095, 0.109, 0.13, 0.25, 0.44, 0.61, 0.61, 0.235],
-            [0.12, 0.134, 0.155, 0.3, 0.465, 0.635, 0.635, 0.355]])
-        beta = np.array([
-            [0.009, 0.011, 0.014, 0.025, 0.045, 0.075, 0.075, 0.03],
-            [0.005, 0.006, 0.007, 0.015, 0.025, 0.042, 0.042, 0.017],
-            [0.005, 0.005, 0.005, 0.01, 0.018, 0.005, 0.005, 0.012],
-            [0.005, 0.005, 0.005, 0.01, 0.005, 0.005, 0.005, 0.0116],
-            [0.005, 0.005, 0.005, 0.005, 0.005, 0.005, 0.005, 0.005]])
-        # print(alpha[dur_index][cc_step])
-        f = alpha[dur_index][cc_step] + beta[dur_index][cc_step] * (duration - duration_adjustment)
-    elif exposure_type == 'ri_no_mcr':
-        dur_index = int(min(duration // 5, 4))
-        duration_adjustment = dur_index * 5
-        alpha = np.array([0., 0.375, 0.585, 0.61, 0.635])
-        beta = np.array([0.075, 0.042, 0.005, 0.005, 0.005])
-        f = alpha[dur_index] + beta[dur_index] * (duration - duration_adjustment)
-    elif exposure_type == 'ri_no_mcr':
-        dur_index = int(min(duration // 5, 1))
-        duration_adjustment = dur_index * 5
-        # Row is duration, column is cc_step
-        alpha = np.array([
-            [0., 0.],
-            [0.035, 0.045]])
-        beta = np.array([
-            [0.007, 0.009],
-            [0.005, 0.005]])
-        f = alpha[dur_index][cc_step] + beta[dur_index][cc_step] * (duration - duration_adjustment)
-    elif exposure_type == 'gov_eea':
-        f = 0.
-    elif exposure_type == 'gov_non_eea':
-        dur_index = int(min(duration // 5, 1))
-        duration_adjustment = dur_index * 5
-        alpha = np.array([
-            [0., 0., 0., 0., 0., 0., 0., 0.],
-            [0., 0., 0.055, 0.07, 0.125, 0.225, 0.225, 0.225],
-            [0., 0., 0.084, 0.105, 0.2, 0.35, 0.35, 0.35],
-            [0., 0., 0.109, 0.13, 0.25, 0.44, 0.44, 0.44],
-            [0., 0., 0.134, 0.155, 0.3, 0.465, 0.465, 0.465]])
-        beta = np.array([
-            [0., 0., 0.011, 0.014, 0.025, 0.045, 0.045, 0.045],
-            [0., 0., 0.006, 0.007, 0.015, 0.025, 0.025, 0.025],
-            [0., 0., 0.005, 0.005, 0.01, 0.018, 0.018, 0.018],
-            [0., 0., 0.005, 0.005, 0.01, 0.005, 0.005, 0.005],
-            [0., 0., 0.005, 0.005, 0.005, 0.005, 0.005, 0.005]])
-        f = alpha[dur_index][cc_step] + beta[dur_index][cc_step] * (duration - duration_adjustment)
-    elif exposure_type == 'sec_type1':
-        beta = np.array([0.021, 0.042, 0.074, 0.085])
-        f = beta[cc_step] * duration
-    elif exposure_type == 'sec_type2':
-        beta = np.array([0.125, 0.134, 0.166, 0.197, 0.82, 1., 1.])
-        f = beta[cc_step] * duration
-    elif exposure_type == 'resec':
-        beta = np.array([0.33, 0.4, 0.51, 0.91, 1., 1., 1.])
-        f = beta[cc_step] * duration
-    return min(1., f)
+    return float(spread_factors([cc_step], [duration], [exposure_type])[0])
@@ -14,8 +14,10 @@ bscr = 20890.5
 op_scr(gep, gross_tp, ul_exp, bscr)
 """
 import pandas as pd
+from .instrumentation import instrumented
 
 
+@instrumented
 def op_scr(
         gep: pd.DataFrame,
         gross_tp: pd.DataFrame,
@@ -0,0 +1,159 @@
+"""
+Parameter cache
+
+All the functions which just load parameters from the CSV files are registered here with the @parameter decorator.
+- loaded lazily on first use
+- memoised for the lifetime of the process, keyed by loader & arguments (after applying the defaults)
+- numpy arrays are returned as read-only views
+- pandas objects are returned as shallow copies under copy-on-write (pandas 3, or mode.copy_on_write): neither
+  adding/dropping columns nor in-place edits of values change the cached table. Without copy-on-write they are
+  returned as deep copies.
+
+Swapping in a new calibration:
+
+from solvency2sf import parameters
+from solvency2sf.mcr.mcr import get_factors
+parameters.override(get_factors, my_factors)   # use my_factors from now on
+parameters.invalidate(get_factors)             # back to the CSV file on next call
+parameters.invalidate()                        # drop everything
+parameters.reload()                            # re-read everything already loaded, e.g. after editing the CSV's
+
+Worker processes started with fork inherit the cache of the parent. Other start methods can be given the parameters
+already read with snapshot() / restore(), see batch.py.
+
+While profiling (see instrumentation) each read of a parameter set is recorded as a call e.g. natcat_eur.get_zone_corr,
+cached parameters are not recorded.
+"""
+import functools
+import inspect
+import threading
+import numpy as np
+import pandas as pd
+from .instrumentation import span
+
+
+_registry = {}
+_cache = {}
+_lock = threading.RLock()
+
+
+def parameter(func):
+    """ Decorator registering a parameter loader with the cache """
+    name = loader_name(func)
+    signature = inspect.signature(func)
+    span_name = func.__module__.rsplit('.', 1)[-1] + '.' + func.__name__
+
+    @functools.wraps(func)
+    def loader(*args, **kwargs):
+        key = _key(loader, *args, **kwargs)
+        with _lock:
+            if key not in _cache:
+                with span(span_name):
+                    _cache[key] = _freeze(func(*args, **kwargs))
+            value = _cache[key]
+        return _view(value)
+
+    loader.uncached = func
+    loader.signature = signature
+    _registry[name] = loader
+    return loader
+
+
+def loader_name(func) -> str:
+    """ Registry name of a loader e.g. mcr.mcr.get_factors """
+    return func.__module__.replace('solvency2sf.', '', 1) + '.' + func.__name__
+
+
+def loaders() -> dict:
+    """ All registered loaders, keyed by name """
+    return dict(_registry)
+
+
+def invalidate(loader=None):
+    """
+    Drop cached parameters, they are re-read on next use
+    - loader: registered function or its name. If None the whole cache is cleared.
+    """
+    with _lock:
+        if loader is None:
+            _cache.clear()
+        else:
+            name = _resolve(loader)
+            for key in [k for k in _cache if k[0] == name]:
+                del _cache[key]
+
+
+def reload(loader=None):
+    """ Invalidate, then eagerly re-read the parameter sets which were loaded """
+    with _lock:
+        if loader is None:
+            keys = list(_cache)
+        else:
+            name = _resolve(loader)
+            keys = [k for k in _cache if k[0] == name]
+        for name, args, kwargs in keys:
+            _cache[(name, args, kwargs)] = _freeze(_registry[name].uncached(*args, **dict(kwargs)))
+
+
+def override(loader, value, *args, **kwargs):
+    """ Replace the parameters returned by loader(*args, **kwargs) with value, until invalidated """
+    with _lock:
+        _cache[_key(_registry[_resolve(loader)], *args, **kwargs)] = _freeze(value)
+
+
+def snapshot(exclude=()) -> dict:
+    """
+    The cached parameter sets, to restore in another process
+    exclude: loaders (or names) not to include, names of loaders not imported (so not cached) are ignored
+    """
+    exclude = {loader if isinstance(loader, str) else loader_name(loader) for loader in exclude}
+    with _lock:
+        return {key: value for key, value in _cache.items() if key[0] not in exclude}
+
+
+def restore(cached: dict):
+    """ Adds parameter sets from snapshot to the cache """
+    with _lock:
+        _cache.update({key: _freeze(value) for key, value in cached.items()})
+
+
+def _resolve(loader) -> str:
+    name = loader if isinstance(loader, str) else loader_name(loader)
+    if name not in _registry:
+        raise KeyError(f"{name} is not a registered parameter loader")
+    return name
+
+
+def _key(loader, *args, **kwargs) -> tuple:
+    bound = loader.signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return loader_name(loader), bound.args, tuple(sorted(bound.kwargs.items()))
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _freeze(v)
+    return value
+
+
+def _view(value):
+    if isinstance(value, np.ndarray):
+        return value.view()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not _copy_on_write())
+    if isinstance(value, dict):
+        return {k: _view(v) for k, v in value.items()}
+    return value
+
+
+def _copy_on_write() -> bool:
+    """ pandas 3 always copies on write, earlier versions only with mode.copy_on_write """
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        return False
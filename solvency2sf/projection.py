@@ -0,0 +1,172 @@
+"""
+Stochastic projection of the SCR
+
+For ORSA projections the standard formula is evaluated for every economic scenario and projection year at once.
+The inputs are arrays with leading axes (scenario, time), the formulas are numpy broadcasts over those axes:
+- market: equity & spread on (scenario, time, asset) market values, other market sub-modules as (scenario, time)
+- non-life premium & reserve on (scenario, time, region, lob) volumes
+- aggregation with scr_agg
+- MCR from (scenario, time, lob) premiums & technical provisions
+- solvency ratios against own funds
+
+Cube keys (all optional, a missing sub-module is 0):
+- equity_mv (S, T, n_eq), equity_type (n_eq,), symmetric_adjustment (S, T)
+- bond_mv (S, T, n_bond), bond_cc_step (n_bond,), bond_duration (n_bond,) or (S, T, n_bond), bond_type (n_bond,)
+- mkt_int_up, mkt_int_down, mkt_prop, mkt_conc, mkt_fx: (S, T)
+- vol_p, vol_r (S, T, region, lob), lobs (lob,): premium & reserve volumes
+- nl_cat, nl_lapse, def, life, h, op: (S, T)
+- nwp, tp_nl (S, T, lob), mcr_lobs (lob,), tp_l (S, T, 4), car_l (S, T)
+- own_funds, own_funds_mcr (S, T): eligible own funds for the SCR & MCR ratios
+
+Test data:
+import numpy as np
+rng = np.random.default_rng(0)
+S, T = 1000, 5
+cube = {
+    'equity_mv': 1000. * rng.lognormal(0, 0.2, (S, T, 2)), 'equity_type': ['type1', 'type2'],
+    'symmetric_adjustment': rng.uniform(-0.1, 0.1, (S, T)),
+    'bond_mv': np.full((S, T, 1), 5000.), 'bond_cc_step': [2], 'bond_duration': [5], 'bond_type': ['bonds'],
+    'vol_p': rng.uniform(0, 2000, (S, T, 1, 2)), 'vol_r': rng.uniform(0, 4000, (S, T, 1, 2)), 'lobs': ['mtpl', 'prop'],
+    'nwp': rng.uniform(0, 2000, (S, T, 2)), 'tp_nl': rng.uniform(0, 4000, (S, T, 2)), 'mcr_lobs': ['mtpl', 'prop'],
+    'own_funds': np.full((S, T), 10000.),
+}
+res = project_scr(cube, processes=2)
+distribution(res, 'solvency_ratio')
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .aggregation import scr_agg
+from .instrumentation import instrumented
+from .mcr.mcr import get_factors as get_mcr_factors, combined as mcr_combined, linear_l, linear_nl, TP_LIFE_FACTORS
+from .mkt import equity_arrays, spread_factors
+from .scr_nl.premres.premres import get_factors as get_premres_factors, premres_arrays
+
+RESULTS = ['mkt_eq', 'mkt_spread', 'mkt', 'nl_pr', 'nl', 'bscr', 'scr', 'mcr', 'solvency_ratio', 'mcr_ratio']
+
+
+def equity_scr(mv, exposure_type, symmetric_adjustment):
+    """
+    Equity SCR as mkt.equity
+    mv: (..., n), exposure_type: (n,), symmetric_adjustment: broadcast against (...)
+    """
+    return equity_arrays(mv, exposure_type, symmetric_adjustment)[2]
+
+
+def spread_scr(mv, cc_step, duration, exposure_type):
+    """
+    Spread SCR for bonds as mkt.spread
+    mv: (..., n), cc_step & exposure_type: (n,), duration: (n,) or (..., n)
+    """
+    mv = np.asarray(mv, dtype=float)
+    duration = np.asarray(duration, dtype=float)
+    if duration.ndim <= 1:
+        f = spread_factors(cc_step, np.broadcast_to(duration, np.shape(cc_step)), exposure_type)
+    else:
+        shape = np.broadcast_shapes(duration.shape, np.shape(cc_step))
+        f = spread_factors(np.broadcast_to(cc_step, shape).ravel(), np.broadcast_to(duration, shape).ravel(),
+                           np.broadcast_to(np.asarray(exposure_type, dtype=object), shape).ravel()).reshape(shape)
+    return np.maximum(0., (mv * f).sum(axis=-1))
+
+
+def premres_scr(vol_p, vol_r, lobs, ins_sector='NL', ri_basis='net'):
+    """
+    Premium & reserve SCR as scr_nl_premres
+    vol_p, vol_r: (..., region, lob), lobs: s2model of each lob, lobs outside ins_sector are ignored
+    """
+    factors = get_premres_factors(ins_sector, 'net')
+    code = factors.index.get_indexer(pd.Index(lobs))
+    # Map the input lobs onto the parameter lobs:
+    membership = np.zeros((len(code), len(factors)))
+    membership[np.flatnonzero(code >= 0), code[code >= 0]] = 1.
+    volumes = np.stack((np.matmul(np.asarray(vol_p, dtype=float), membership),
+                        np.matmul(np.asarray(vol_r, dtype=float), membership)), axis=-1)
+    return premres_arrays(volumes, ins_sector, ri_basis)['scr']
+
+
+def mcr_linear(nwp, tp_nl, lobs, tp_l=0., car_l=0.):
+    """
+    Linear MCR as mcr.mcr
+    nwp, tp_nl: (..., lob), lobs: s2model of each lob, tp_l: (..., 4) by life group 1-4
+    """
+    factors = get_mcr_factors().reindex(pd.Index(lobs))
+    tp_l = np.asarray(tp_l, dtype=float)
+    if not tp_l.ndim:
+        tp_l = np.zeros(len(TP_LIFE_FACTORS))
+    return (linear_nl(np.asarray(nwp, dtype=float), np.asarray(tp_nl, dtype=float), factors) +
+            linear_l(tp_l, np.asarray(car_l, dtype=float)))
+
+
+def _divide(a, b):
+    return np.divide(a, b, out=np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b))), where=b != 0)
+
+
+def _stack(*components):
+    """ (..., n_modules) from the sub-module results, missing (None) as 0 """
+    return np.stack(np.broadcast_arrays(*[0. if c is None else c for c in components]), axis=-1)
+
+
+def _agg(x, module_name):
+    """ scr_agg over any number of leading axes """
+    return scr_agg(x.reshape(-1, x.shape[-1]), module_name).reshape(x.shape[:-1])
+
+
+def _project(cube: dict) -> dict:
+    res = {}
+    get = cube.get
+    if get('equity_mv') is not None:
+        res['mkt_eq'] = equity_scr(cube['equity_mv'], cube['equity_type'], get('symmetric_adjustment', 0.))
+    if get('bond_mv') is not None:
+        res['mkt_spread'] = spread_scr(cube['bond_mv'], cube['bond_cc_step'], cube['bond_duration'],
+                                       cube['bond_type'])
+    other = [res.get('mkt_eq'), get('mkt_prop'), res.get('mkt_spread'), get('mkt_conc'), get('mkt_fx')]
+    # The more onerous of the interest rate up & down:
+    res['mkt'] = np.maximum(_agg(_stack(get('mkt_int_up'), *other), 'mkt_up'),
+                            _agg(_stack(get('mkt_int_down'), *other), 'mkt_down'))
+
+    if get('vol_p') is not None:
+        res['nl_pr'] = premres_scr(cube['vol_p'], cube['vol_r'], cube['lobs'])
+    res['nl'] = _agg(_stack(res.get('nl_pr'), get('nl_cat'), get('nl_lapse')), 'nl_uw')
+    res['bscr'] = _agg(_stack(res['mkt'], get('def'), get('life'), get('h'), res['nl']), 'bscr')
+    res['scr'] = res['bscr'] + get('op', 0.)
+
+    if get('nwp') is not None:
+        linear = mcr_linear(cube['nwp'], cube['tp_nl'], cube['mcr_lobs'], get('tp_l', 0.), get('car_l', 0.))
+        res['mcr'] = mcr_combined(linear, res['scr'])
+    if get('own_funds') is not None:
+        res['solvency_ratio'] = _divide(cube['own_funds'], res['scr'])
+    if 'mcr' in res and get('own_funds_mcr', get('own_funds')) is not None:
+        res['mcr_ratio'] = _divide(get('own_funds_mcr', get('own_funds')), res['mcr'])
+    shape = np.broadcast_shapes(*[np.shape(v) for v in res.values()])
+    return {k: np.broadcast_to(v, shape) for k, v in res.items()}
+
+
+@instrumented
+def project_scr(cube: dict, processes=None, chunksize=None) -> dict:
+    """
+    SCR, MCR & solvency ratios for every scenario & time step
+    cube: see module docstring, arrays with leading axes (scenario, time), 1d arrays are per asset / lob
+    processes: number of worker processes, the scenarios are split into chunks of chunksize
+    Returns {result: array (scenario, time)}, results as RESULTS where the inputs are given
+    """
+    # Arrays with (scenario, time, ...) axes are split, labels & per asset terms are the same for every chunk.
+    # Without a scenario axis there is nothing to split:
+    scenarios = [np.shape(v)[0] for v in cube.values() if np.ndim(v) >= 2]
+    if processes is None or processes <= 1 or not scenarios:
+        return _project(cube)
+    n = max(scenarios)
+    chunksize = chunksize or -(-n // processes)
+    chunks = [{k: v[i:i + chunksize] if np.ndim(v) >= 2 else v for k, v in cube.items()}
+              for i in range(0, n, chunksize)]
+    with ProcessPoolExecutor(processes) as pool:
+        res = list(pool.map(_project, chunks))
+    return {k: np.concatenate([r[k] for r in res]) for k in res[0]}
+
+
+def distribution(results: dict, result='scr', quantiles=(0.005, 0.05, 0.25, 0.5, 0.75, 0.95, 0.995)) -> pd.DataFrame:
+    """ Mean & quantiles over the scenarios, for each time step """
+    x = results[result]
+    df = pd.DataFrame(np.quantile(x, quantiles, axis=0).T, columns=pd.Index(quantiles, name='quantile'))
+    df.insert(0, 'mean', x.mean(axis=0))
+    return df.rename_axis('time')
@@ -0,0 +1,168 @@
+"""
+QRT reporting
+
+The calculations only record compact arrays (module results, LGD by rating, premium & reserve volumes by lob,
+MCR terms by lob...) while a recorder is active. The QRT tables are built from these on request, for the
+entities requested, so batch runs which don't report pay almost nothing.
+
+Tables:
+- s25_01_01: SCR by module
+- s26_01_01: market risk by sub-module
+- s26_02_01: counterparty default, s26_02_01_type1: type 1 LGD by rating
+- s26_05_01: non-life underwriting risk, s26_05_01_premres: premium & reserve detail by s2model
+- s28_01_01_02: linear MCR detail by s2model, s28_01_01_05: MCR calculation
+
+The active recorder & entity are held in a context variable: threads recording at the same time each record to
+their own recorder, and the StandardFormula thread executor runs its nodes in the context of the caller.
+Calculations in other processes are not recorded: use the sequential or thread executors while recording.
+
+Test data:
+from s2sf_tests.dummy_data import Dummy_Data
+from solvency2sf import StandardFormula
+dd = Dummy_Data()
+recorder = QRTRecorder()
+with recording(recorder, entity='E1'):
+    StandardFormula().run({'type1': dd.type_1, 'type2': dd.type_2, 'life': 2000.})
+recorder.table('s25_01_01', 'E1')
+recorder.tables('E1')
+"""
+import contextlib
+import contextvars
+import threading
+import numpy as np
+import pandas as pd
+
+# (recorder, entity) of the current context
+_active = contextvars.ContextVar('solvency2sf_recording', default=(None, None))
+_lock = threading.RLock()
+
+
+class QRTRecorder:
+    """ Compact arrays recorded during the calculations, by table & entity """
+
+    def __init__(self):
+        # table: list of (entity keys, {name: array with a leading axis per key})
+        self.records = {}
+
+    def add(self, table, keys, **values):
+        """ keys: the entities, values have a leading axis of len(keys) (labels excepted, see _LABELS) """
+        with _lock:
+            self.records.setdefault(table, []).append((pd.Index(keys), values))
+
+    def entities(self, table=None) -> list:
+        tables = self.records if table is None else [table]
+        return sorted({k for t in tables for keys, _ in self.records.get(t, []) for k in keys}, key=repr)
+
+    def values(self, table, entity) -> dict:
+        """ The values recorded for an entity, the latest record if recorded more than once """
+        for keys, values in reversed(self.records.get(table, [])):
+            pos = keys.get_indexer([entity])[0]
+            if pos >= 0:
+                return {k: v if k in _LABELS else v[pos] for k, v in values.items()}
+        raise KeyError(f'{table} not recorded for {entity}')
+
+    def table(self, table, entity) -> pd.DataFrame:
+        """ Builds the QRT table for the entity """
+        return BUILDERS[table](**self.values(table, entity))
+
+    def tables(self, entity) -> dict:
+        """ All the tables recorded for the entity """
+        return {table: self.table(table, entity) for table in BUILDERS
+                if any(entity in keys for keys, _ in self.records.get(table, []))}
+
+
+@contextlib.contextmanager
+def recording(recorder: QRTRecorder = None, entity=None):
+    """ Records the calculations in the block, single calculations are recorded against entity """
+    recorder = QRTRecorder() if recorder is None else recorder
+    token = _active.set((recorder, entity))
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+
+
+def active() -> bool:
+    return _active.get()[0] is not None
+
+
+def current_entity():
+    return _active.get()[1]
+
+
+def record(table, keys=None, **values):
+    """
+    Called from the calculations, does nothing unless recording
+    keys: entities of a batch calculation, values then have a leading axis per key.
+    If None the values are for a single calculation of the current entity.
+    """
+    recorder, entity = _active.get()
+    if recorder is None:
+        return
+    if keys is None:
+        keys = [entity]
+        values = {k: v if k in _LABELS else np.asarray(v)[np.newaxis] for k, v in values.items()}
+    recorder.add(table, keys, **values)
+
+
+# Values which are labels rather than one per entity
+_LABELS = {'lobs'}
+
+
+def _column(values: dict, column) -> pd.DataFrame:
+    return pd.DataFrame({column: [float(v) for v in values.values()]}, index=list(values))
+
+
+def s25_01_01(mkt=0., default=0., life=0., health=0., non_life=0., bscr=0., op=0., scr=0.):
+    modules = {'market': mkt, 'default': default, 'life': life, 'health': health, 'non_life': non_life}
+    diversification = bscr - sum(float(v) for v in modules.values())
+    return _column({**modules, 'diversification': diversification, 'bscr': bscr, 'operational': op, 'scr': scr},
+                   'C0110')
+
+
+def s26_01_01(interest=0., equity=0., property=0., spread=0., concentration=0., currency=0., mkt=0.):
+    modules = {'interest': interest, 'equity': equity, 'property': property, 'spread': spread,
+               'concentration': concentration, 'currency': currency}
+    diversification = mkt - sum(float(v) for v in modules.values())
+    return _column({**modules, 'diversification': diversification, 'mkt': mkt}, 'net_scr')
+
+
+def s26_02_01(type1=0., type2=0., default=0.):
+    return _column({'type1': type1, 'type2': type2, 'diversification': default - type1 - type2,
+                    'default': default}, 'scr')
+
+
+def s26_02_01_type1(lgd, lgd2, prob_def):
+    # A row per rating, or per distinct probability of default with single name aggregation
+    return pd.DataFrame({'lgd': lgd, 'lgd2': lgd2, 'prob_def': prob_def})
+
+
+def s26_05_01(premres=0., cat=0., lapse=0., non_life=0.):
+    return _column({'premres': premres, 'cat': cat, 'lapse': lapse,
+                    'diversification': non_life - premres - cat - lapse, 'non_life': non_life}, 'net_scr')
+
+
+def s26_05_01_premres(lobs, **columns):
+    return pd.DataFrame(columns, index=pd.Index(lobs, name='s2model'))
+
+
+def s28_01_01_02(lobs, tp_nl_net, nwp, premium_beta, tp_alpha):
+    return pd.DataFrame({'tp_nl_net': tp_nl_net, 'nwp': nwp, 'premium_beta': premium_beta, 'tp_alpha': tp_alpha},
+                        index=pd.Index(lobs))
+
+
+def s28_01_01_05(mcr_linear, scr, mcr_cap, mcr_floor, mcr_combined, amcr, mcr):
+    return _column({'mcr_linear': mcr_linear, 'scr': scr, 'mcr_cap': mcr_cap, 'mcr_floor': mcr_floor,
+                    'mcr_combined': mcr_combined, 'amcr': amcr, 'mcr': mcr}, 'C0070')
+
+
+BUILDERS = {
+    's25_01_01': s25_01_01,
+    's26_01_01': s26_01_01,
+    's26_02_01': s26_02_01,
+    's26_02_01_type1': s26_02_01_type1,
+    's26_05_01': s26_05_01,
+    's26_05_01_premres': s26_05_01_premres,
+    's28_01_01_02': s28_01_01_02,
+    's28_01_01_05': s28_01_01_05,
+}
@@ -11,10 +11,16 @@ Test data:
 from s2sf_tests.dummy_data import Dummy_Data
 dd = Dummy_Data()
 dd = Dummy_Data()
-liab_vol = dd.liab_vol.copy()
+liab_vol = dd.liab_vol
 
 from scr_nl.cat.manmade.manmade import get_liab_factors
 
+## Liability gross & net of three alternative quota shares in one call:
+from solvency2sf.scr_nl.cat.reinsurance import stack_terms
+liab_vol = dd.liab_vol.rename_axis(['grp_liab', 'country'])
+alternatives = [EXAMPLE_PROGRAMS.assign(qs=qs) for qs in [0.6, 0.3, 0.]]
+liab_batch(liab_vol, EXAMPLE_PROGRAMS, EXAMPLE_COVERS, stack_terms(alternatives))
+
 Not yet prepared:
 - credit
 - marine
@@ -27,8 +33,13 @@ import os
 import pathlib
 import numpy as np
 import pandas as pd
+from ....columnar import category_codes, level_codes
+from ....instrumentation import instrumented
+from ....parameters import parameter
+from ..reinsurance import net_losses, program_codes, program_terms, EXAMPLE_PROGRAMS, EXAMPLE_COVERS
 
 
+@parameter
 def get_liab_factors():
     # Load the risk factors:
     fldr = pathlib.Path(__file__).parent.resolve()
@@ -36,78 +47,135 @@ def get_liab_factors():
     return rf
 
 
+@parameter
+def get_liab_corr():
+    # Correlation between the liability groups:
+    fldr = pathlib.Path(__file__).parent.resolve()
+    corr = pd.read_csv(os.path.join(fldr, 'corr_liab.csv'), index_col=[0])
+    return corr
+
+
 def liab_gross_losses(liab_vol):
-    vol = liab_vol.copy()
-    rf = get_liab_factors()
-    vol = vol.merge(rf, how='inner', left_on='grp_liab', right_index=True)
-    vol['gross_loss'] = vol.gep * vol.risk_factor
-    vol['no_claims'] = (vol.gross_loss / vol.limit_indem / 1.15)
-    vol.no_claims = vol.no_claims.replace(np.inf, np.nan).fillna(1)
-    vol['claim_amount'] = vol.gross_loss / vol.no_claims
-    return vol
+    """
+    Gross loss, number of claims & claim amount of each row of liab_vol
+    liab_vol: columns gep & limit_indem, grp_liab in the index or a column. Not modified.
+    Rows whose grp_liab has no risk factor are dropped, the index and grp_liab & country columns are kept.
+    """
+    rf = get_liab_factors().risk_factor
+    code = _group_codes(liab_vol, rf.index)
+    keep = code >= 0
+    risk_factor = rf.to_numpy(dtype=float)[code[keep]]
+    gross_loss, no_claims, claim_amount = liab_claims(liab_vol.gep.to_numpy(dtype=float)[keep],
+                                                      liab_vol.limit_indem.to_numpy(dtype=float)[keep], risk_factor)
+    losses = pd.DataFrame({'risk_factor': risk_factor, 'gross_loss': gross_loss, 'no_claims': no_claims,
+                           'claim_amount': claim_amount}, index=liab_vol.index[keep])
+    # Keys given as columns are carried through:
+    for key in ['country', 'grp_liab']:
+        if key in liab_vol.columns:
+            losses.insert(0, key, np.asarray(liab_vol[key])[keep])
+    return losses
+
+
+def liab_claims(gep, limit_indem, risk_factor) -> tuple:
+    """
+    Gross loss, number of claims & claim amount of each policy, from column arrays
+    Policies without a limit of indemnity have a single claim.
+    """
+    gross_loss = np.asarray(gep, dtype=float) * risk_factor
+    with np.errstate(divide='ignore', invalid='ignore'):
+        no_claims = gross_loss / np.asarray(limit_indem, dtype=float) / 1.15
+        no_claims = np.where(np.isfinite(no_claims), no_claims, 1.)
+        claim_amount = gross_loss / no_claims
+    return gross_loss, no_claims, claim_amount
+
+
+def _group_codes(liab_vol, groups: pd.Index) -> np.array:
+    """ Position of the grp_liab of each row in groups, -1 if not found """
+    if 'grp_liab' in liab_vol.columns:
+        return category_codes(groups, liab_vol['grp_liab'])
+    return level_codes(liab_vol.index, 'grp_liab', groups)
+
+
+def _country_codes(liab_vol) -> tuple:
+    """ (codes, countries) of the country column or index level, -1 for missing countries """
+    if 'country' in liab_vol.columns:
+        codes, countries = pd.factorize(liab_vol['country'])
+        return codes, pd.Index(countries)
+    if isinstance(liab_vol.index, pd.MultiIndex):
+        i = liab_vol.index.names.index('country')
+        return liab_vol.index.codes[i], liab_vol.index.levels[i]
+    codes, countries = pd.factorize(liab_vol.index)
+    return codes, pd.Index(countries)
+
+
+def liab_group_losses(liab_vol) -> tuple:
+    """
+    Gross losses summed by liability group & country with integer codes
+    Returns (array (group, country), countries), groups as get_liab_factors, rows of other groups are ignored.
+    Rows without a country are in a final extra column.
+    """
+    rf = get_liab_factors().risk_factor
+    group = _group_codes(liab_vol, rf.index)
+    country, countries = _country_codes(liab_vol)
+    n = len(countries) + 1
+    country = np.where(country < 0, n - 1, country)
+    keep = group >= 0
+    gross_loss = liab_vol.gep.to_numpy(dtype=float)[keep] * rf.to_numpy(dtype=float)[group[keep]]
+    losses = np.bincount(group[keep] * n + country[keep], weights=gross_loss, minlength=len(rf) * n)
+    return losses.reshape(len(rf), n), countries
 
 
 def liab_div_loss(losses: np.array):
-    """ Diversify within grp_liab """
-    fldr = pathlib.Path(__file__).parent.resolve()
-    corr = pd.read_csv(os.path.join(fldr, 'corr_liab.csv'), index_col=[0])
-    div_loss = np.matmul(losses.T, np.matmul(corr,losses))**0.5
-    return div_loss
-
+    """ Diversify between the liability groups, losses: (..., group) ordered as get_liab_corr """
+    corr = get_liab_corr().to_numpy(dtype=float)
+    losses = np.asarray(losses, dtype=float)
+    return np.einsum('...i,ij,...j->...', losses, corr, losses) ** 0.5
 
-def liab(liab_vol, programs, covers):
-    """ Main mam-made liability SCR function """
-    gross_losses = liab_gross_losses(liab_vol)
 
-    # Need full index for each group to apply correlation:
-    gl = np.array(gross_losses['gross_loss'].groupby(by=['grp_liab']).sum().reindex(range(1, 6)).rename('loss').fillna(0))
+@instrumented
+def liab_batch(liab_vol, programs, covers, terms=None) -> tuple:
+    """
+    Man-made liability SCR gross, and net of any number of alternative reinsurance structures in one call
+    liab_vol: columns gep & limit_indem, grp_liab & country in the index or columns
+    terms: (xol_xs, xol_limit, reinstatement, qs) arrays (..., n_programs) ordered as programs.index, e.g. from
+    stack_terms. Defaults to the terms of programs.
+    Returns (gross diversified loss, net diversified losses with the leading shape of the terms)
+    """
+    losses, countries = liab_group_losses(liab_vol)
+    prog_code = np.append(program_codes(countries, programs, covers), -1)
+    terms = program_terms(programs) if terms is None else terms
+    # Each group & country cell is a loss to the program of the country:
+    net = net_losses(losses.ravel(), np.tile(prog_code, len(losses)), *terms)
+    net = net.reshape(net.shape[:-1] + losses.shape).sum(axis=-1)
+    return float(liab_div_loss(losses.sum(axis=1))), liab_div_loss(net)
 
-    div_gross = liab_div_loss(gl)
 
-    net_losses = manmade_liab_reinsurance(gross_losses, programs, covers)
-    nl = np.array(net_losses.groupby(by='grp_liab').sum().reindex(range(1, 6)).rename('loss').fillna(0))
-    div_net = liab_div_loss(nl)
-    return pd.DataFrame.from_dict({'gross_loss': div_gross, 'net_loss': div_net}, orient='index', columns=['manmade_liab']).T
+@instrumented
+def liab(liab_vol, programs, covers):
+    """ Main mam-made liability SCR function """
+    div_gross, div_net = liab_batch(liab_vol, programs, covers)
+    return pd.DataFrame.from_dict({'gross_loss': div_gross, 'net_loss': float(div_net)}, orient='index',
+                                  columns=['manmade_liab']).T
 
 
+@instrumented
 def manmade_liab_reinsurance(
         gross_losses,
-        programs=pd.DataFrame.from_dict({'p1': {'xol_xs': 10, 'xol_limit': 20, 'reinstatement': 0.5, 'qs': 0.6},
-                                         'p2': {'xol_xs': 5, 'xol_limit': 10, 'reinstatement': 0.25, 'qs': 0.8}},
-                                        'index'),
-        covers=pd.DataFrame.from_dict({'DE': 'p1', 'CH': 'p1', 'PL': 'p2'}, 'index', columns=['prog_id'])
+        programs=EXAMPLE_PROGRAMS,
+        covers=EXAMPLE_COVERS
 ):
     """
     Simplified example to produce net losses for each county allowing for multi-country reinsurance programs
+    gross_losses: gross_loss by grp_liab & country, see reinsurance.py for the program structure
     """
-
     gross = gross_losses.reset_index()
-    gross = gross.merge(covers, how='left', left_on='country', right_index=True)
-    prog_loss = gross.groupby(['prog_id']).sum()
-    prog_loss = prog_loss.merge(programs, how='left', left_on='prog_id', right_index=True)
-
-    # Max 0 as can't have a negative recovery -> required in case strange parameters input
-    prog_loss['xol_rec'] = prog_loss.apply(lambda x:
-                                           -min(max(0, x.xol_limit - x.xol_xs),
-                                                max(0, x.gross_loss - x.xol_xs)),
-                                           axis=1)
-    # TODO: verify logic for reinstatement premiums on liability claims
-    prog_loss['reins'] = - prog_loss.xol_rec / (prog_loss.xol_limit - prog_loss.xol_xs) * prog_loss.reinstatement
-    prog_loss['net_xol'] = prog_loss[['gross_loss', 'xol_rec', 'reins']].sum(axis=1)
-    prog_loss['qs_rec'] = -prog_loss.net_xol * prog_loss.qs
-    prog_loss['net_loss'] = prog_loss['net_xol'] + prog_loss['qs_rec']
-    prog_loss = prog_loss[['net_loss']]
-
-    gross['prog_tot'] = gross[['gross_loss', 'prog_id']].groupby(by=['prog_id']).transform(sum)
-    gross['pc_of_prog'] = gross.gross_loss/gross.prog_tot
-    gross = gross.reset_index().merge(prog_loss, how='left', on=['prog_id'])
-    gross.net_loss = gross.net_loss * gross.pc_of_prog
-    # Filling for countries without a reinsurance program:
-    gross.net_loss = gross.net_loss.fillna(gross.gross_loss)
-    gross = gross.set_index(['country', 'grp_liab'])[['gross_loss', 'net_loss']].sort_index()
-    return gross['net_loss']
+    prog_code = program_codes(gross.country, programs, covers)
+    net = net_losses(gross.gross_loss.to_numpy(dtype=float), prog_code, *program_terms(programs))
+    index = pd.MultiIndex.from_frame(gross[['country', 'grp_liab']])
+    return pd.Series(net, index=index, name='net_loss').sort_index()
 
 
+@instrumented
 def fire(max_prop_sum_ins: pd.Series, programs, covers):
     """
     Man-made Fire
@@ -119,6 +187,7 @@ def fire(max_prop_sum_ins: pd.Series, programs, covers):
     return pd.DataFrame.from_dict({'gross_loss': gross, 'net_loss': net}, orient='index', columns=['manmade_fire']).T
 
 
+@instrumented
 def motor(vehicles_insured: pd.DataFrame, programs, covers):
     """
     Man-made motor
@@ -145,39 +214,16 @@ def motor(vehicles_insured: pd.DataFrame, programs, covers):
     net = manmade_re(gross, programs, covers)
     return pd.DataFrame.from_dict({'gross_loss': gross.sum(), 'net_loss': net.sum()}, orient='index', columns=['manmade_motor']).T
 
+@instrumented
 def manmade_re(
         gross_losses,
-        programs=pd.DataFrame.from_dict({'p1': {'xol_xs': 10, 'xol_limit': 20, 'reinstatement': 0.5, 'qs': 0.6},
-                                         'p2': {'xol_xs': 5, 'xol_limit': 10, 'reinstatement': 0.25, 'qs': 0.8}},
-                                        'index'),
-        covers=pd.DataFrame.from_dict({'DE': 'p1', 'CH': 'p1', 'PL': 'p2'}, 'index', columns=['prog_id'])
+        programs=EXAMPLE_PROGRAMS,
+        covers=EXAMPLE_COVERS
 ):
     """
     Simplified example to produce net losses for each county allowing for multi-country reinsurance programs
+    gross_losses: pd.Series of gross loss by country, see reinsurance.py for the program structure
     """
-
-    gross = gross_losses.reset_index()
-    gross = gross.merge(covers, how='left', left_on='country', right_index=True)
-    prog_loss = gross.groupby(['prog_id']).sum()
-    prog_loss = prog_loss.merge(programs, how='left', left_on='prog_id', right_index=True)
-
-    # Max 0 as can't have a negative recovery -> required in case strange parameters input
-    prog_loss['xol_rec'] = prog_loss.apply(lambda x:
-                                           -min(max(0, x.xol_limit - x.xol_xs),
-                                                max(0, x.gross_loss - x.xol_xs)),
-                                           axis=1)
-    # TODO: verify logic for reinstatement premiums on manmade claims
-    prog_loss['reins'] = - prog_loss.xol_rec / (prog_loss.xol_limit - prog_loss.xol_xs) * prog_loss.reinstatement
-    prog_loss['net_xol'] = prog_loss[['gross_loss', 'xol_rec', 'reins']].sum(axis=1)
-    prog_loss['qs_rec'] = -prog_loss.net_xol * prog_loss.qs
-    prog_loss['net_loss'] = prog_loss['net_xol'] + prog_loss['qs_rec']
-    prog_loss = prog_loss[['net_loss']]
-
-    gross['prog_tot'] = gross[['gross_loss', 'prog_id']].groupby(by=['prog_id']).transform(sum)
-    gross['pc_of_prog'] = gross.gross_loss/gross.prog_tot
-    gross = gross.reset_index().merge(prog_loss, how='left', on=['prog_id'])
-    gross.net_loss = gross.net_loss * gross.pc_of_prog
-    # Filling for countries without a reinsurance program:
-    gross.net_loss = gross.net_loss.fillna(gross.gross_loss)
-    gross = gross.set_index(['country'])[['gross_loss', 'net_loss']].sort_index()
-    return gross['net_loss']
+    prog_code = program_codes(gross_losses.index, programs, covers)
+    net = net_losses(gross_losses.to_numpy(dtype=float), prog_code, *program_terms(programs))
+    return pd.Series(net, index=gross_losses.index.rename('country'), name='net_loss').sort_index()
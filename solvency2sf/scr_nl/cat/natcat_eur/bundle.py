@@ -0,0 +1,126 @@
+"""
+Compiled natcat parameter store
+
+All the natcat parameter tables (risk weights, correlation matrices between countries and between cresta zones,
+scenarios, specified loss & risk factors) compiled into:
+- natcat_params.npy: one flat float64 buffer, memory mapped on load
+- natcat_params.json: index giving offset, shape and labels of each table
+
+Tables are only read from the buffer when requested, so a calculation only touches the countries in its sums insured.
+The loaders in natcat_eur use the bundle when it exists and fall back to the CSV files otherwise.
+
+Build (re-run after changing any of the CSV files):
+python -m solvency2sf.scr_nl.cat.natcat_eur.bundle
+"""
+import json
+import os
+import pathlib
+import numpy as np
+import pandas as pd
+
+BUNDLE_PATH = os.path.join(pathlib.Path(__file__).parent.resolve(), 'natcat_params')
+BUNDLE_VERSION = 1
+
+
+class NatcatBundle:
+    """ Lazy reader for a compiled bundle """
+
+    def __init__(self, path=BUNDLE_PATH):
+        with open(path + '.json', 'r') as f:
+            index = json.load(f)
+        if index.get('version') != BUNDLE_VERSION:
+            raise ValueError(f"Natcat bundle {path} has version {index.get('version')}, expected {BUNDLE_VERSION}")
+        self.path = path
+        self.tables = index['tables']
+        self.buffer = np.load(path + '.npy', mmap_mode='r')
+
+    def __contains__(self, key):
+        return key in self.tables
+
+    def keys(self, prefix=''):
+        return [k for k in self.tables if k.startswith(prefix)]
+
+    def get(self, key):
+        """ Returns the table as a pd.DataFrame, None if not in the bundle """
+        entry = self.tables.get(key)
+        if entry is None:
+            return None
+        size = int(np.prod(entry['shape']))
+        values = np.array(self.buffer[entry['offset']:entry['offset'] + size]).reshape(entry['shape'])
+        return pd.DataFrame(values,
+                            index=_labels(entry['index'], entry['index_names']),
+                            columns=_labels(entry['columns'], [entry['columns_name']]))
+
+
+def _labels(labels, names):
+    if len(names) > 1:
+        return pd.MultiIndex.from_tuples([tuple(label) for label in labels], names=names)
+    return pd.Index(labels, name=names[0])
+
+
+def _pack(df: pd.DataFrame, offset: int) -> dict:
+    return {
+        'offset': offset,
+        'shape': list(df.shape),
+        'index': df.index.tolist(),
+        'index_names': list(df.index.names),
+        'columns': df.columns.tolist(),
+        'columns_name': df.columns.name,
+    }
+
+
+def load_bundle(path=BUNDLE_PATH):
+    """ Returns the compiled bundle, None if it has not been built """
+    if not (os.path.exists(path + '.npy') and os.path.exists(path + '.json')):
+        return None
+    return NatcatBundle(path)
+
+
+def build_bundle(path=BUNDLE_PATH):
+    """ Compiles every natcat parameter CSV into the bundle at path """
+    from ....parameters import invalidate, loader_name, override, restore, snapshot
+    from . import natcat_eur as nc
+
+    # The bundle & countries cached (or overridden) before the build, reinstated afterwards:
+    names = {loader_name(nc.get_bundle), loader_name(nc.cresta_countries)}
+    previous = {key: value for key, value in snapshot().items() if key[0] in names}
+    # Make sure the loaders read the CSV's rather than any existing bundle:
+    override(nc.get_bundle, None)
+    try:
+        tables = {
+            'risk_weights': nc.get_risk_weights.uncached(),
+            'scenarios': nc.get_scenarios.uncached(),
+            'specified_loss': nc.get_sl_factors.uncached(),
+            'factors': nc.get_risk_factors.uncached(),
+        }
+        for risk, corr in nc.get_risks_corr_mat.uncached().items():
+            tables['corr/' + risk] = corr
+        for risk in nc.NATCAT_RISKS:
+            for country in nc.cresta_countries(risk):
+                tables['corr_cresta/' + risk + '/' + country] = nc.get_cresta_corr.uncached(risk, country)
+    finally:
+        # Only the loaders used here: other cached parameters & overrides are kept. A bundle read from the path
+        # being rebuilt is dropped, it is reopened on next use:
+        invalidate(nc.get_bundle)
+        invalidate(nc.cresta_countries)
+        rebuilt = [bundle for key, bundle in previous.items() if key[0] == loader_name(nc.get_bundle)
+                   and os.path.abspath(getattr(bundle, 'path', '')) == os.path.abspath(path)]
+        if not rebuilt:
+            restore(previous)
+
+    index = {}
+    buffers = []
+    offset = 0
+    for key, df in tables.items():
+        index[key] = _pack(df, offset)
+        buffers.append(df.to_numpy(dtype=float).ravel())
+        offset += df.size
+
+    np.save(path + '.npy', np.concatenate(buffers))
+    with open(path + '.json', 'w') as f:
+        json.dump({'version': BUNDLE_VERSION, 'tables': index}, f)
+    return path
+
+
+if __name__ == '__main__':
+    print('Natcat parameter bundle written to', build_bundle())
@@ -52,14 +52,13 @@ sumsinsured.loc[pd.IndexSlice['flood',:, 'PL'], 'suminsured']=100
 sumsinsured = sumsinsured.dropna()
 
 from scr_nl.cat.natcat_eur.natcat_eur import cresta_volumes, div_within_region, specified_loss, scenario_losses
-from scr_nl.cat.natcat_eur.natcat_eur import get_scenarios, example_reinsurance
+from scr_nl.cat.natcat_eur.natcat_eur import get_scenarios, natcat_reinsurance
 sl = specified_loss(sumsinsured)
 gross = scenario_losses(sl)
-net = example_reinsurance(gross)
+net = natcat_reinsurance(gross)
 
 from scr_nl.cat.natcat_eur.natcat_eur import diversify_between_countries, natcat_agg
-gross_x = diversify_between_countries(gross)
-net_x = diversify_between_countries(net)
+gross_x, net_x = diversify_between_countries(gross, net)
 natcat = natcat_agg(gross_x, net_x)
 
 """
@@ -71,24 +70,45 @@ import math
 import os
 import glob
 import importlib.resources
+from ....columnar import category_codes
+from ....instrumentation import instrumented
+from ....parameters import parameter
+from .bundle import load_bundle
+from ..reinsurance import reinsure, EXAMPLE_PROGRAMS, EXAMPLE_COVERS
 
 
 ### Functions which just load parameters ###
 
+NATCAT_RISKS = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
+SUMSINSURED_COLUMNS = ['hazard', 'risk', 'country_isocode', 'riskregion', 'suminsured']
+# Some cresta zone correlation files use a different country code to the other parameters:
+CRESTA_FILE_CODES = {'UK': 'GB', 'HE': 'GR', 'CR': 'HR'}
+
+
+@parameter
+def get_bundle():
+    """ The compiled parameter bundle (see bundle.py), None if not built: parameters are then read from CSV """
+    return load_bundle()
+
+
+@parameter
 def get_risk_weights():
     """ Reads the risk_weights csv's into a dataframe """
-    natcat_risks = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.get('risk_weights')
     # Load natcat cresta risk weights:
     with importlib.resources.path(__package__, 'risk_weights') as p:
         rw_path = p
     rw = []
-    for risk in natcat_risks:
+    for risk in NATCAT_RISKS:
         rw_file = os.path.join(rw_path, risk + '.csv')
         rw.append(pd.read_csv(rw_file, index_col=0).unstack().dropna().rename(risk))
     risk_weights = pd.concat(rw, axis=1).rename_axis(['country_isocode', 'riskregion'])
     return risk_weights
 
 
+@parameter
 def get_risks_corr_mat():
     """
     Returns a dictionary of correlation matrices (between countries)
@@ -96,53 +116,162 @@ def get_risks_corr_mat():
     - risk
     :return:
     """
-    natcat_risks = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
+    bundle = get_bundle()
+    if bundle is not None:
+        return {risk: bundle.get('corr/' + risk) for risk in NATCAT_RISKS}
     corr = {}
     with importlib.resources.path(__package__, 'corr') as p:
         corr_path = p
-    for risk in natcat_risks:
+    for risk in NATCAT_RISKS:
          file = os.path.join(corr_path, risk + '.csv')
          corr[risk] = pd.read_csv(file, index_col=0)
     return corr
 
 
-def get_cresta_corr_mat():
+@parameter
+def cresta_countries(risk):
+    """ Countries with a cresta zone correlation matrix for the risk """
+    bundle = get_bundle()
+    if bundle is not None:
+        return [key.split('/')[-1] for key in bundle.keys('corr_cresta/' + risk + '/')]
+    with importlib.resources.path(__package__, 'corr_cresta') as p:
+        corr_mat_fldr = p
+    return sorted(os.path.splitext(file)[0].split('_')[-1]
+                  for file in glob.glob(os.path.join(corr_mat_fldr, risk + '_*.csv')))
+
+
+@parameter
+def get_cresta_corr(risk, country):
+    """ Correlation matrix between the cresta zones of one country, None if not defined """
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.get('corr_cresta/' + risk + '/' + country)
+    with importlib.resources.path(__package__, 'corr_cresta') as p:
+        file = os.path.join(p, risk + '_' + country + '.csv')
+    if not os.path.exists(file):
+        return None
+    return pd.read_csv(file, index_col=0)
+
+
+def get_cresta_corr_mat(countries=None):
     """
-    Returns a nested dictionary of every correlation matrix
+    Returns a nested dictionary of correlation matrices
     Keys:
      - hazard
      - country
-     Loads every corrmat for every country - this could be optimised.
+     Only the countries requested are loaded, every country if None.
     """
-    natcat_risks = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
-
-    with importlib.resources.path(__package__, 'corr_cresta') as p:
-        corr_mat_fldr = p
+    countries = None if countries is None else set(countries)
     corr_cresta = {}
-    for risk in natcat_risks:
-        corr_cresta[risk] = {}
-        for file in glob.glob(os.path.join(corr_mat_fldr, risk + '*.csv')):
-            country = os.path.splitext(file)[0].split('_')[-1]
-            corr_cresta[risk][country] = pd.read_csv(file, index_col=0)
+    for risk in NATCAT_RISKS:
+        available = cresta_countries(risk)
+        if countries is not None:
+            available = [country for country in available if country in countries]
+        corr_cresta[risk] = {country: get_cresta_corr(risk, country) for country in available}
     return corr_cresta
 
 
+@parameter
+def get_zone_corr(risk, country) -> np.array:
+    """
+    Cresta zone correlation matrix of a country aligned with the zones of the risk weights
+    - the risk weights number the zones 1..n, the correlation files use the cresta codes: zones are matched in order
+    - zones not covered by a correlation matrix (e.g. single zone countries) are independent
+    """
+    risk_weights = get_risk_weights()[risk]
+    n = int(risk_weights.loc[country].notna().sum()) if country in risk_weights.index else 0
+    corr = np.eye(n)
+    zone_corr = get_cresta_corr(risk, country)
+    if zone_corr is None and country in CRESTA_FILE_CODES:
+        zone_corr = get_cresta_corr(risk, CRESTA_FILE_CODES[country])
+    if zone_corr is not None:
+        k = min(n, len(zone_corr))
+        corr[:k, :k] = zone_corr.to_numpy(dtype=float)[:k, :k]
+    return corr
+
+
+@parameter
+def get_zone_positions() -> np.array:
+    """ Position of each zone of the risk weights within its country: the zone axis of get_zone_corr_stack """
+    index = get_risk_weights().index
+    return pd.Series(0, index=index).groupby(level='country_isocode', sort=False).cumcount().to_numpy()
+
+
+@parameter
+def get_zone_corr_stack(countries: tuple) -> np.array:
+    """
+    Cresta zone correlation matrices of the countries for every hazard, stacked & padded to the largest country
+    Returns an array (hazard, country, zone, zone), zones ordered as the risk weights (see get_zone_positions).
+    Zones without a risk weight for the hazard have no correlation.
+    """
+    risk_weights = get_risk_weights()[NATCAT_RISKS]
+    country = risk_weights.index.get_level_values('country_isocode')
+    zone_pos = get_zone_positions()
+    n_zones = max((int((country == name).sum()) for name in countries), default=0)
+    corr = np.zeros((len(NATCAT_RISKS), len(countries), n_zones, n_zones))
+    for h, risk in enumerate(NATCAT_RISKS):
+        defined = risk_weights[risk].notna().to_numpy()
+        for c, name in enumerate(countries):
+            pos = zone_pos[(country == name) & defined]
+            corr[h, c][np.ix_(pos, pos)] = get_zone_corr(risk, name)
+    return corr
+
+
+@parameter
+def get_country_corr(risk, countries: tuple) -> np.array:
+    """ Correlation matrix between countries for the risk, aligned to countries. Countries not in the matrix are independent """
+    countries = list(countries)
+    corr = get_risks_corr_mat()[risk].reindex(index=countries, columns=countries).to_numpy(dtype=float)
+    corr = np.nan_to_num(corr)
+    np.fill_diagonal(corr, 1.)
+    return corr
+
+
+@parameter
+def get_country_corr_factor(risk, countries: tuple):
+    """ Cholesky factor L of get_country_corr (corr = L @ L.T), None if the matrix is not positive definite """
+    try:
+        return np.linalg.cholesky(get_country_corr(risk, countries))
+    except np.linalg.LinAlgError:
+        return None
+
+
+@parameter
 def get_scenarios():
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.get('scenarios')
     with importlib.resources.open_text(__package__, 'scenarios.csv') as f:
         scenarios = pd.read_csv(f, index_col=[0, 1])
     return scenarios
 
 
+@parameter
 def get_sl_factors():
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.get('specified_loss')
     # Load the specified loss factors:
     with importlib.resources.open_text(__package__, 'specified_loss.csv') as f:
         sl = pd.read_csv(f, index_col=[0]).drop(columns='country')
     return sl
 
 
+@parameter
+def get_risk_factors():
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.get('factors')
+    # Load the factors for each risk type (fire, mat, motor) by hazard:
+    with importlib.resources.open_text(__package__, 'factors.csv') as f:
+        factors = pd.read_csv(f, index_col=[0])
+    return factors
+
+
 ### Functions carrying out calculations ###
 
 
+@instrumented
 def cresta_volumes(sumsinsured):
     """
     inputs:
@@ -152,18 +281,74 @@ def cresta_volumes(sumsinsured):
     - country_isocode
     - cresta riskregion
     """
-    si = sumsinsured.copy()
-
-    # add the risk factors:
-    with importlib.resources.open_text(__package__, 'factors.csv') as f:
-        factors = pd.read_csv(f, index_col=[0])
+    return _risk_weighted(_weighted_volumes(sumsinsured))
 
-    si = si.merge(factors.stack().rename('risk_weights'), how='left', left_on=['hazard', 'risk'], right_index=True)
 
-    # Apply the risk risk_weights using numpy matrix multiplication:
-    si['weight'] = si.suminsured * si.risk_weights
-    si = si['weight'].groupby(by=['country_isocode', 'riskregion', 'hazard']).sum()
-    si = si.unstack()
+@instrumented
+def cresta_volumes_chunked(source, chunksize=1000000):
+    """
+    cresta_volumes for sums insured too large to hold in memory
+    source:
+    - path to a csv or parquet file, or
+    - an iterable of pd.DataFrames
+    with columns hazard, risk, country_isocode, riskregion, suminsured.
+    Each chunk is reduced to weighted volumes by country, zone & hazard as it is read,
+    so memory is bounded by the number of cresta zones rather than the number of policies.
+    """
+    chunks = _read_chunks(source, chunksize) if isinstance(source, (str, os.PathLike)) else source
+    weight = None
+    for chunk in chunks:
+        w = _weighted_volumes(chunk)
+        weight = w if weight is None else weight.add(w, fill_value=0.)
+    if weight is None:
+        # No chunks: no volumes, as cresta_volumes of an empty frame
+        weight = _weighted_volumes(pd.DataFrame({c: [] for c in SUMSINSURED_COLUMNS}))
+    return _risk_weighted(weight)
+
+
+def _read_chunks(path, chunksize):
+    columns = SUMSINSURED_COLUMNS
+    if str(path).endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow is required to read parquet files')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            yield chunk
+
+
+def _weighted_volumes(sumsinsured) -> pd.Series:
+    """ Sums insured times the risk factor (fire, mat, motor), summed by country_isocode, riskregion & hazard """
+    def column(name):
+        # Categorical columns stay categorical, their labels are looked up once per category
+        if name in sumsinsured.columns:
+            return sumsinsured[name]
+        return sumsinsured.index.get_level_values(name)
+
+    # add the risk factors, padded with NaN so that code -1 (not found) picks NaN:
+    factors = get_risk_factors()
+    table = np.full((factors.shape[0] + 1, factors.shape[1] + 1), np.nan)
+    table[:-1, :-1] = factors.to_numpy(dtype=float)
+    risk_factor = table[category_codes(factors.index, column('hazard')),
+                        category_codes(factors.columns, column('risk'))]
+    weight = pd.Series(sumsinsured['suminsured'].to_numpy(dtype=float) * risk_factor, name='weight')
+
+    # Sum on integer codes, then label the (few) groups. Rows with a missing key (code -1) are dropped:
+    names = ['country_isocode', 'riskregion', 'hazard']
+    codes, labels = zip(*[pd.factorize(column(name)) for name in names])
+    keep = np.logical_and.reduce([code >= 0 for code in codes])
+    weight = weight[keep].groupby([code[keep] for code in codes]).sum()
+    index = pd.MultiIndex.from_arrays([np.asarray(labels[i])[weight.index.get_level_values(i)]
+                                       for i in range(len(names))], names=names)
+    return weight.set_axis(index).sort_index()
+
+
+def _risk_weighted(weight: pd.Series) -> pd.DataFrame:
+    """ Apply the cresta zone risk weights to the weighted volumes """
+    si = weight.unstack()
 
     # Apply risk weights:
     risk_weights = get_risk_weights()
@@ -177,28 +362,32 @@ def cresta_volumes(sumsinsured):
     return res
 
 
-def diversify_with_corrmat(x, corr=None):
-    if corr is None:
-        return 0
-    else:
-        corr_arr = np.array(corr)
-        # This is a bodge: zones not consistently defined between risk weights, correlation matrices
-        v = np.array(x.loc[:len(corr.index)].fillna(0))
-        # v = np.array(x.loc[corr.index].fillna(0))
-        return math.sqrt(np.matmul(v.T, np.matmul(corr_arr, v)))
+@instrumented
+def div_within_region(cv):
+    """
+    Diversified volume for each country & hazard using the cresta zone correlation matrices
+    - cv: cresta volumes, indexed by country_isocode & riskregion, column per hazard
+    The zone correlation matrices of the exposed countries are stacked once per set of countries (see
+    get_zone_corr_stack), each call places the volumes & evaluates every country & hazard in one quadratic form.
+    """
+    countries = cv.index.get_level_values('country_isocode').unique()
+    country = cv.index.get_level_values('country_isocode')
+    exposed = tuple(sorted(country[(cv[NATCAT_RISKS] != 0).any(axis=1).to_numpy()].unique()))
 
+    # Zones without a risk weight have no correlation matrix, so no diversified volume:
+    row = get_risk_weights().index.get_indexer(cv.index)
+    country_code = pd.Index(exposed, dtype=object).get_indexer(country)
+    keep = (row >= 0) & (country_code >= 0)
+    corr = get_zone_corr_stack(exposed)
+    vols = np.zeros(corr.shape[:3])
+    vols[:, country_code[keep], get_zone_positions()[row[keep]]] = cv[NATCAT_RISKS].to_numpy(dtype=float)[keep].T
 
-def div_within_region(cv):
-    natcat_risks = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
-    correlations = get_cresta_corr_mat()
-    # TODO: Hate this loop, must be a better way...
-    df = pd.DataFrame()
-    for country in cv.index.get_level_values('country_isocode').drop_duplicates():
-        for risk in natcat_risks:
-            df.loc[country, risk] = diversify_with_corrmat(cv.loc[country, risk], correlations[risk].get(country))
-    return df
+    div = np.sqrt(np.einsum('hcz,hczk,hck->ch', vols, corr, vols))
+    df = pd.DataFrame(div, index=pd.Index(exposed, dtype=object), columns=NATCAT_RISKS)
+    return df.reindex(countries).fillna(0.)
 
 
+@instrumented
 def specified_loss(sumsinsured: pd.DataFrame):
     """
     Returns gross specified loss for each country and hazard
@@ -213,6 +402,7 @@ def specified_loss(sumsinsured: pd.DataFrame):
     return spec_loss
 
 
+@instrumented
 def scenario_losses(spec_loss):
     # Calculate the losses in each scenario:
     sl = spec_loss.stack()
@@ -223,71 +413,92 @@ def scenario_losses(spec_loss):
     return losses.rename('gross_loss')
 
 
+@instrumented
+def loss_cube(scen_loss, countries=None):
+    """
+    Scenario losses as an array (hazard, scenario & loss event, country)
+    - hazards ordered as NATCAT_RISKS, scenario & loss events as get_scenarios()
+    - countries: defaults to every country in scen_loss, sorted
+    Returns the cube, the scenario & loss event index and the countries
+    """
+    levels = ['hazard', 'scenario', 'loss_event', 'country_isocode']
+    losses = scen_loss.reorder_levels(levels)
+    if countries is None:
+        countries = losses.index.get_level_values('country_isocode').unique().sort_values()
+    events = get_scenarios().index
+    index = pd.MultiIndex.from_tuples([(haz, scenario, loss_event, country)
+                                       for haz in NATCAT_RISKS
+                                       for scenario, loss_event in events
+                                       for country in countries], names=levels)
+    cube = losses.reindex(index).fillna(0.).to_numpy(dtype=float)
+    return cube.reshape(len(NATCAT_RISKS), len(events), len(countries)), events, pd.Index(countries)
+
+
+@instrumented
 def natcat_reinsurance(
         scen_loss,
-        programs=pd.DataFrame.from_dict({'p1': {'xol_xs': 10, 'xol_limit': 20, 'reinstatement': 0.5, 'qs': 0.6},
-                                         'p2': {'xol_xs': 5, 'xol_limit': 10, 'reinstatement': 0.25, 'qs': 0.8}},
-                                        'index'),
-        covers=pd.DataFrame.from_dict({'DE': 'p1', 'CH': 'p1', 'PL': 'p2'}, 'index', columns=['prog_id'])
+        programs=EXAMPLE_PROGRAMS,
+        covers=EXAMPLE_COVERS
 ):
     """
     Simplified example to produce net losses for each county allowing for multi-country reinsurance programs
+    See reinsurance.py: each hazard/scenario/loss event is a loss vector across countries
     """
+    events = ['hazard', 'scenario', 'loss_event']
+    gross = scen_loss.unstack('country_isocode').fillna(0.)
+    net = reinsure(gross, programs, covers).stack()
+    net = net.reorder_levels(events + ['country_isocode'])
+    net = net.reindex(scen_loss.index.reorder_levels(events + ['country_isocode'])).sort_index()
+    return net.rename('net_loss')
 
-    gross = scen_loss.to_frame()
-    gross = gross.merge(covers,how='left', left_on='country_isocode', right_index=True)
-    prog_loss = gross.groupby(['hazard', 'scenario', 'loss_event', 'prog_id']).sum()
-    prog_loss = prog_loss.merge(programs, how='left', left_on='prog_id', right_index=True)
-
-    # Expected recoveries on the program under each scenario
-    # Max 0 as can't have a negative recovery -> required in case strange parameters input
-    prog_loss['xol_rec'] = prog_loss.apply(lambda x:
-                                           -min(max(0, x.xol_limit - x.xol_xs),
-                                                max(0, x.gross_loss - x.xol_xs)),
-                                           axis=1)
-    prog_loss['reins'] = - prog_loss.xol_rec / (prog_loss.xol_limit - prog_loss.xol_xs) * prog_loss.reinstatement
-    prog_loss['net_xol'] = prog_loss[['gross_loss', 'xol_rec', 'reins']].sum(axis=1)
-    prog_loss['qs_rec'] = -prog_loss.net_xol * prog_loss.qs
-    prog_loss['net_loss'] = prog_loss['net_xol'] + prog_loss['qs_rec']
-    prog_loss = prog_loss[['net_loss']]
-
-    gross['prog_tot'] = gross.groupby(by=['hazard', 'scenario', 'loss_event', 'prog_id']).transform(sum)
-    gross['pc_of_prog'] = gross.gross_loss/gross.prog_tot
-    gross = gross.reset_index().merge(prog_loss, how='left', on=['hazard', 'scenario', 'loss_event', 'prog_id'])
-    gross.net_loss = gross.net_loss * gross.pc_of_prog
-    # Filling for countries without a reinsurance program:
-    gross.net_loss = gross.net_loss.fillna(gross.gross_loss)
-    gross = gross.groupby(['hazard', 'scenario', 'loss_event', 'country_isocode']).sum()[['gross_loss', 'net_loss']].sort_index()
-    return gross['net_loss']
-
-
-def diversify_between_countries(scen_loss):
+
+@instrumented
+def diversify_cube(cube, countries):
+    """
+    Diversified loss between countries
+    - cube: losses (..., hazard, scenario & loss event, country) as from loss_cube
+    Returns (..., hazard, scenario & loss event)
+    Row norms of cube @ L using the cached Cholesky factor, or the quadratic form if the matrix has no factor
+    """
+    div = np.empty(cube.shape[:-1])
+    for h, haz in enumerate(NATCAT_RISKS):
+        x = cube[..., h, :, :]
+        factor = get_country_corr_factor(haz, tuple(countries))
+        if factor is not None:
+            div[..., h, :] = np.linalg.norm(np.matmul(x, factor), axis=-1)
+        else:
+            corr = get_country_corr(haz, tuple(countries))
+            div[..., h, :] = np.sqrt(np.einsum('...c,cd,...d->...', x, corr, x))
+    return div
+
+
+@instrumented
+def diversify_between_countries(scen_loss, net_loss=None):
     """
     scen_loss is indexed by:
     - hazard
     - scenario
     - loss event
+    - country_isocode
     Returns:
         - loss for each scenario & loss event (a/b, 1/2)
         - for each hazard
         - diversified within countries
+    If net_loss is given, the gross & net are diversified together and returned as a tuple (gross_x, net_x)
     """
-    correlations = get_risks_corr_mat()
-    hazards = ['windstorm', 'earthquake', 'flood', 'hail', 'subsidence']
-    sc = []
-    for haz in hazards:
-        #haz = 'windstorm'
-        # build a series for each hazard, makes easier for matmul (series not equal lengths)
-        sx = scen_loss.loc[haz]
-        sx = sx.unstack('country_isocode')
-        # Sort the index alphabetically in corr mat:
-        corr = correlations[haz].sort_index()
-        corr = corr[corr.index]
-        sc.append(sx.apply(lambda x: math.sqrt(np.matmul(x, np.matmul(corr, x.T))), axis=1).rename(haz))
-    sc = pd.concat(sc, axis=1)
-    return sc
-
-
+    losses = [scen_loss] if net_loss is None else [scen_loss, net_loss]
+    countries = pd.Index([]).append([loss.index.get_level_values('country_isocode') for loss in losses])
+    countries = countries.unique().sort_values()
+    cubes = []
+    for loss in losses:
+        cube, events, _ = loss_cube(loss, countries)
+        cubes.append(cube)
+    div = diversify_cube(np.stack(cubes), countries)
+    sc = [pd.DataFrame(d.T, index=events, columns=NATCAT_RISKS) for d in div]
+    return sc[0] if net_loss is None else tuple(sc)
+
+
+@instrumented
 def natcat_agg(gross_x, net_x):
     """ Select the biting scenario for each loss event """
     net_loss = net_x.groupby('scenario').sum()
@@ -0,0 +1,122 @@
+"""
+Reinsurance program optimiser for the natcat SCR
+
+The gross scenario losses, the correlation matrices between countries and the gross diversified losses
+are calculated once. Each candidate reinsurance structure then only needs the net loss stage:
+- net losses for every hazard/scenario/loss event/country (reinsurance.net_losses)
+- diversification between countries
+- biting scenario & aggregation over hazards, as natcat_agg
+
+Candidates are a frame with a row per structure and columns (prog_id, term), see program_grid.
+Large searches can be spread over a process pool.
+
+Test data (sumsinsured as in natcat_eur):
+from scr_nl.cat.natcat_eur.optimiser import NatcatOptimiser, program_grid
+from scr_nl.cat.reinsurance import EXAMPLE_PROGRAMS, EXAMPLE_COVERS
+opt = NatcatOptimiser(sumsinsured=sumsinsured, covers=EXAMPLE_COVERS)
+candidates = program_grid(EXAMPLE_PROGRAMS, xol_xs={'p1': range(0, 20), 'p2': range(0, 10)}, qs={'p1': [0., 0.3, 0.6]})
+res = opt.evaluate(candidates, processes=4)
+best = opt.search(candidates, premium=lambda c: 0.05 * (c[('p1', 'xol_limit')] - c[('p1', 'xol_xs')]))
+"""
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from ..reinsurance import TERMS, EXAMPLE_COVERS, net_losses, program_codes
+from .natcat_eur import NATCAT_RISKS, diversify_cube, loss_cube, scenario_losses, specified_loss
+
+
+def program_grid(programs: pd.DataFrame, **ranges) -> pd.DataFrame:
+    """
+    Candidate structures from every combination of the ranges, other terms as in programs
+    ranges: term={prog_id: values} e.g. xol_xs={'p1': [5, 10, 20]}, qs={'p2': [0.5, 0.8]}
+    Returns a frame with a row per candidate and columns (prog_id, term)
+    """
+    base = programs[TERMS].stack()
+    axes = [(prog_id, term) for term, by_prog in ranges.items() for prog_id in by_prog]
+    values = [list(ranges[term][prog_id]) for prog_id, term in axes]
+    candidates = pd.DataFrame([base.to_numpy()] * int(np.prod([len(v) for v in values])), columns=base.index)
+    for column, combination in zip(axes, zip(*itertools.product(*values))):
+        candidates[column] = combination
+    return candidates.rename_axis('candidate')
+
+
+class NatcatOptimiser:
+    """
+    Evaluates the natcat SCR for many reinsurance structures with the gross stage cached
+    - sumsinsured: as for specified_loss, or
+    - scen_loss: gross scenario losses from scenario_losses
+    - covers: program covering each country
+    """
+
+    def __init__(self, sumsinsured=None, scen_loss=None, covers=EXAMPLE_COVERS):
+        if scen_loss is None:
+            scen_loss = scenario_losses(specified_loss(sumsinsured))
+        self.gross, self.events, self.countries = loss_cube(scen_loss)
+        self.covers = covers
+        scenario_code, self.scenarios = pd.factorize(self.events.get_level_values('scenario'), sort=True)
+        # Sums the loss events of each scenario:
+        self.scenario_sum = np.zeros((len(self.events), len(self.scenarios)))
+        self.scenario_sum[np.arange(len(self.events)), scenario_code] = 1.
+        self.gross_div = self._diversify(self.gross)
+
+    def _diversify(self, losses):
+        """ Diversified loss between countries for each scenario (..., hazard, scenario) """
+        div = diversify_cube(losses, self.countries)
+        return np.matmul(div, self.scenario_sum)
+
+    def _evaluate(self, prog_ids, terms):
+        """ terms: (n_candidates, n_terms, n_programs) -> (n_candidates, 2) gross & net scr """
+        prog_code = program_codes(self.countries, pd.DataFrame(index=prog_ids), self.covers)
+        xol_xs, xol_limit, reinstatement, qs = (terms[:, i, np.newaxis, np.newaxis, :] for i in range(len(TERMS)))
+        net = net_losses(self.gross, prog_code, xol_xs, xol_limit, reinstatement, qs)
+        net_div = self._diversify(net)
+        # Biting scenario for each candidate & hazard:
+        biting = net_div.argmax(axis=-1)
+        net_loss = np.take_along_axis(net_div, biting[..., np.newaxis], axis=-1)[..., 0]
+        gross_loss = self.gross_div[np.arange(len(NATCAT_RISKS)), biting]
+        return np.stack((np.sqrt((gross_loss ** 2).sum(axis=-1)), np.sqrt((net_loss ** 2).sum(axis=-1))), axis=-1)
+
+    def evaluate(self, candidates: pd.DataFrame, processes=None, chunksize=1000) -> pd.DataFrame:
+        """
+        Gross & net natcat SCR for each candidate structure
+        processes: number of worker processes, None to evaluate in this process
+        """
+        prog_ids = candidates.columns.get_level_values(0).unique()
+        terms = np.stack([candidates[[(prog_id, term) for prog_id in prog_ids]].to_numpy(dtype=float)
+                          for term in TERMS], axis=1)
+        chunks = [terms[i:i + chunksize] for i in range(0, len(terms), chunksize)]
+        if processes is None or processes <= 1:
+            res = [self._evaluate(prog_ids, chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(self, prog_ids)) as pool:
+                res = list(pool.map(_evaluate_chunk, chunks))
+        res = pd.DataFrame(np.concatenate(res) if res else np.empty((0, 2)),
+                           index=candidates.index, columns=['gross_scr', 'net_scr'])
+        res['scr_reduction'] = res.gross_scr - res.net_scr
+        return res
+
+    def search(self, candidates: pd.DataFrame, premium=None, processes=None, chunksize=1000) -> pd.DataFrame:
+        """
+        Candidates ranked by net SCR, or if premium (function of the candidates frame) is given,
+        by reinsurance premium per unit of SCR reduction
+        """
+        res = self.evaluate(candidates, processes, chunksize)
+        if premium is None:
+            return res.sort_values('net_scr')
+        res['premium'] = premium(candidates)
+        res['premium_per_reduction'] = res.premium / res.scr_reduction.where(res.scr_reduction > 0)
+        return res.sort_values('premium_per_reduction')
+
+
+_worker = {}
+
+
+def _init_worker(optimiser, prog_ids):
+    _worker['optimiser'] = optimiser
+    _worker['prog_ids'] = prog_ids
+
+
+def _evaluate_chunk(terms):
+    return _worker['optimiser']._evaluate(_worker['prog_ids'], terms)
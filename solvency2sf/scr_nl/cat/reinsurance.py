@@ -0,0 +1,121 @@
+"""
+Reinsurance mitigation shared by the natcat and man-made modules
+
+Each program is a XoL layer from xol_xs up to xol_limit, with a reinstatement premium, and a quota share on the net:
+- xol recovery = min(max(0, xol_limit - xol_xs), max(0, gross - xol_xs))
+- reinstatement premium = recovery / (xol_limit - xol_xs) * reinstatement
+- net = (gross - recovery + reinstatement premium) * (1 - qs)
+Programs cover multiple countries (covers), the program net loss is allocated back pro-rata to the gross loss.
+Countries without a program keep their gross loss.
+
+The calculations are on numpy arrays and broadcast:
+- gross losses (..., n_countries): any number of loss vectors e.g. scenario & loss event
+- program terms (..., n_programs): add leading axes to evaluate alternative reinsurance structures in one call
+
+Test data:
+import numpy as np
+gross = np.array([[10., 5., 2.], [30., 0., 12.]])
+prog_code = program_codes(['DE', 'CH', 'PL'], EXAMPLE_PROGRAMS, EXAMPLE_COVERS)
+net_losses(gross, prog_code, *program_terms(EXAMPLE_PROGRAMS))
+# Three alternative retentions (current, +5, +10) evaluated at once -> shape (3, 2, 3):
+xol_xs, xol_limit, reinstatement, qs = program_terms(EXAMPLE_PROGRAMS)
+net_losses(gross, prog_code, xol_xs + np.array([0., 5., 10.])[:, None, None], xol_limit, reinstatement, qs)
+# The same from a list of program frames:
+alternatives = [EXAMPLE_PROGRAMS.assign(xol_xs=EXAMPLE_PROGRAMS.xol_xs + d) for d in [0., 5., 10.]]
+net_losses(gross[np.newaxis], prog_code, *[t[:, np.newaxis] for t in stack_terms(alternatives)])
+"""
+import numpy as np
+import pandas as pd
+from ...instrumentation import instrumented
+
+TERMS = ['xol_xs', 'xol_limit', 'reinstatement', 'qs']
+
+EXAMPLE_PROGRAMS = pd.DataFrame.from_dict({'p1': {'xol_xs': 10, 'xol_limit': 20, 'reinstatement': 0.5, 'qs': 0.6},
+                                           'p2': {'xol_xs': 5, 'xol_limit': 10, 'reinstatement': 0.25, 'qs': 0.8}},
+                                          'index')
+EXAMPLE_COVERS = pd.DataFrame.from_dict({'DE': 'p1', 'CH': 'p1', 'PL': 'p2'}, 'index', columns=['prog_id'])
+
+
+def program_terms(programs: pd.DataFrame) -> tuple:
+    """ Program terms as arrays (xol_xs, xol_limit, reinstatement, qs), ordered as programs.index """
+    return tuple(programs[term].to_numpy(dtype=float) for term in TERMS)
+
+
+def stack_terms(alternatives: list) -> tuple:
+    """
+    Terms of alternative reinsurance structures stacked on a leading axis, arrays (n_alternatives, n_programs)
+    alternatives: program frames, aligned to the programs of the first. A program missing from an alternative gives
+    no cover.
+    """
+    index = alternatives[0].index
+    return tuple(np.stack([alt[term].reindex(index).fillna(0.).to_numpy(dtype=float) for alt in alternatives])
+                 for term in TERMS)
+
+
+def program_codes(keys, programs: pd.DataFrame, covers: pd.DataFrame) -> np.array:
+    """ Position in programs of the program covering each key (country), -1 if not covered """
+    prog_id = covers.prog_id.reindex(pd.Index(keys))
+    return programs.index.get_indexer(prog_id)
+
+
+def xol_recovery(gross, xol_xs, xol_limit):
+    # Max 0 as can't have a negative recovery -> required in case strange parameters input
+    return np.minimum(np.maximum(0., xol_limit - xol_xs), np.maximum(0., gross - xol_xs))
+
+
+def reinstatement_premium(recovery, xol_xs, xol_limit, reinstatement):
+    # TODO: verify logic for reinstatement premiums on man-made & liability claims
+    layer = np.asarray(xol_limit - xol_xs, dtype=float)
+    rate = np.divide(reinstatement, layer, out=np.zeros(np.broadcast(reinstatement, layer).shape), where=layer != 0)
+    return recovery * rate
+
+
+def program_net_loss(gross, xol_xs, xol_limit, reinstatement, qs):
+    """ Net loss of a program for the gross loss to the program """
+    recovery = xol_recovery(gross, xol_xs, xol_limit)
+    net_xol = gross - recovery + reinstatement_premium(recovery, xol_xs, xol_limit, reinstatement)
+    return net_xol * (1. - qs)
+
+
+def aggregate(gross, prog_code, n_programs: int):
+    """ Sum the gross losses (..., n_countries) to each program (..., n_programs) """
+    covered = np.flatnonzero(prog_code >= 0)
+    membership = np.zeros((len(prog_code), n_programs))
+    membership[covered, prog_code[covered]] = 1.
+    return np.matmul(gross, membership)
+
+
+def allocate(gross, prog_code, prog_gross, prog_net):
+    """ Pro-rata allocation of the program net losses back to the countries, gross where not covered """
+    ratio = np.divide(prog_net, prog_gross, out=np.ones(np.broadcast(prog_net, prog_gross).shape),
+                      where=prog_gross != 0)
+    ratio = np.concatenate((ratio, np.ones(ratio.shape[:-1] + (1,))), axis=-1)
+    # -1 picks the final column of ones for countries without a program:
+    return gross * ratio[..., prog_code]
+
+
+@instrumented
+def net_losses(gross, prog_code, xol_xs, xol_limit, reinstatement, qs):
+    """
+    Net losses for each country
+    - gross: (..., n_countries)
+    - prog_code: (n_countries,) from program_codes
+    - program terms: (..., n_programs), broadcast against the loss vectors
+    """
+    gross = np.asarray(gross, dtype=float)
+    prog_code = np.asarray(prog_code)
+    prog_gross = aggregate(gross, prog_code, np.shape(xol_xs)[-1])
+    prog_net = program_net_loss(prog_gross, xol_xs, xol_limit, reinstatement, qs)
+    return allocate(gross, prog_code, prog_gross, prog_net)
+
+
+@instrumented
+def reinsure(gross: pd.DataFrame, programs=EXAMPLE_PROGRAMS, covers=EXAMPLE_COVERS) -> pd.DataFrame:
+    """
+    Net losses for a frame of gross losses
+    - rows: loss vectors e.g. hazard/scenario/loss event
+    - columns: countries, matched to programs via covers
+    """
+    prog_code = program_codes(gross.columns, programs, covers)
+    net = net_losses(gross.to_numpy(dtype=float), prog_code, *program_terms(programs))
+    return pd.DataFrame(net, index=gross.index, columns=gross.columns)
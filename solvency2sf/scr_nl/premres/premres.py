@@ -52,6 +52,11 @@ dict_data = {
   ('SE', 'mtpl'): 0.0}}
 volume_measures = pd.DataFrame(dict_data)
 volume_measures.index.names=['s2region', 's2model']
+scr_nl_premres(volume_measures)
+
+# Batch: two entities, net & gross together
+batch = pd.concat({'E1': volume_measures, 'E2': 2 * volume_measures}, names=['entity'])
+scr_nl_premres_batch(batch, 'entity', ri_basis=['net', 'gross'])
 
 """
 
@@ -60,8 +65,13 @@ import os
 import pathlib
 import pandas as pd
 import numpy as np
+from ...columnar import level_codes
+from ...instrumentation import instrumented
+from ...parameters import parameter
+from ...reporting import active, record
 
 
+@parameter
 def get_factors(ins_sector='NL', ri_basis='net'):
     """
     Reads the standard deviation parameters for PR risk
@@ -81,6 +91,7 @@ def get_factors(ins_sector='NL', ri_basis='net'):
     return factors
 
 
+@parameter
 def get_corr(ins_sector='NL'):
     """
     Reads the correlation matrix for PR risk
@@ -107,38 +118,157 @@ def scr_nl_premres(
     - s2 region: WE, EE, SE etc...
     - s2 lob aligned with the s2model definition for premium and reserve risk
     """
-    vm = volume_measures.copy()
-    vm['tot'] = vm.sum(axis=1)
-    vm['tot2'] = vm.tot**2
-    
+    if qrt_output:
+        scr, pr, sd = scr_nl_premres_batch(volume_measures, [], ins_sector, ri_basis, qrt_output=True)
+        return float(scr), pr, float(sd)
+    return float(scr_nl_premres_batch(volume_measures, [], ins_sector, ri_basis))
+
+
+@instrumented
+def scr_nl_premres_batch(
+        volume_measures: pd.DataFrame,
+        by='entity',
+        ins_sector='NL',
+        ri_basis='net',
+        qrt_output=False
+):
+    """
+    Premium & reserve risk for a stack of volume measures e.g. by legal entity and/or sensitivity
+    volume_measures: columns vol_p & vol_r, index levels by, s2model and the region(s)
+    by: index level(s) identifying each calculation, [] for a single calculation
+    ri_basis: 'net', 'gross' or ['net', 'gross'] to evaluate both in the same pass
+    Returns the scr: pd.Series indexed by the by keys, with a column per ri_basis if a list
+    qrt_output: returns (scr, pr, sd) with pr the detail by s2model as scr_nl_premres and sd the overall sd
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    factors = get_factors(ins_sector, 'net')
+    volumes, keys = _volume_stack(volume_measures, by, factors.index)
+    res = premres_arrays(volumes, ins_sector, ri_basis)
+
+    basis = None if isinstance(ri_basis, str) else pd.Index(ri_basis, name='ri_basis')
+    if active():
+        _record(res, keys, factors.index, basis)
+    if by:
+        scr = pd.DataFrame(res['scr'], index=keys, columns=basis) if basis is not None else \
+            pd.Series(res['scr'], index=keys, name='scr')
+    else:
+        scr = pd.Series(res['scr'][0], index=basis, name='scr') if basis is not None else res['scr'][0]
+    if not qrt_output:
+        return scr
+    vol = res['vol'].reshape((-1,) + (1,) * (res['scr'].ndim - 1))
+    sd = scr / (3 * vol[0] if not by else 3 * vol)
+    if by:
+        sd = sd.rename('sd') if basis is None else sd
+    return scr, _pr_table(res, keys, factors.index, basis), sd
+
+
+@instrumented
+def premres_arrays(volumes, ins_sector='NL', ri_basis='net') -> dict:
+    """
+    Premium & reserve risk on arrays of volume measures
+    volumes: (..., region, lob, 2) premium & reserve volumes, lobs ordered as get_factors(ins_sector).index
+    ri_basis: 'net', 'gross' or a list -> an extra (..., basis) axis before lob on the results using the factors
+    Returns dict of arrays:
+    - vol_p, vol_r, tot, div_regions, voldiv: (..., lob)
+    - sd_pr, sd_resv, sd: (..., [basis,] lob)
+    - vol: (...) & scr: (..., [basis])
+    """
+    volumes = np.nan_to_num(np.asarray(volumes, dtype=float))
+    bases = [ri_basis] if isinstance(ri_basis, str) else list(ri_basis)
+    factors = [get_factors(ins_sector, b) for b in bases]
+    sd_pr = np.stack([f.sd_pr.to_numpy() for f in factors])
+    sd_resv = np.stack([f.sd_resv.to_numpy() for f in factors])
+    corr = get_corr(ins_sector).loc[factors[0].index, factors[0].index].to_numpy(dtype=float)
+
     # Regional diversification:
-    pr = vm.groupby('s2model').sum()
-    pr['div_regions'] = pr.apply(lambda x: x.tot2/x.tot**2, axis=1)
-    pr = pr.drop(columns=['tot2'])
-    pr['voldiv'] = pr['tot'] * (0.75 + 0.25 * pr['div_regions'])
-
-    # Bring in the premium & reserve standard deviation parameters:
-    factors = get_factors(ins_sector, ri_basis)
-    
-    # Create a full index here for consistency with correlation matrix:
-    pr = pr.merge(factors, how='right', on='s2model')
-
-    # Weight the standard deviation:
-    pr['sd'] = pr.apply(lambda x: 
-                        (((x.vol_p*x.sd_pr)**2 + (x.vol_r*x.sd_resv)**2 +
-                                    (x.vol_p*x.sd_pr*x.vol_r*x.sd_resv))**0.5)/x.tot, 
-                        axis=1)
-    pr = pr.fillna(0)
-    vol = pr.voldiv.sum()
-    corr = get_corr(ins_sector)
+    tot_region = volumes.sum(axis=-1)
+    vol_p, vol_r = volumes[..., 0].sum(axis=-2), volumes[..., 1].sum(axis=-2)
+    tot = tot_region.sum(axis=-2)
+    div_regions = _divide((tot_region ** 2).sum(axis=-2), tot ** 2)
+    voldiv = tot * (0.75 + 0.25 * div_regions)
+
+    # Weight the standard deviation, for each basis:
+    p = vol_p[..., np.newaxis, :] * sd_pr
+    r = vol_r[..., np.newaxis, :] * sd_resv
+    sd = _divide((p ** 2 + r ** 2 + p * r) ** 0.5, tot[..., np.newaxis, :])
 
     # Apply correlation matrix across the lob's:
-    sd = np.matmul((pr.sd*pr.voldiv).T, np.matmul(corr,(pr.sd*pr.voldiv)))**0.5 / vol
+    x = sd * voldiv[..., np.newaxis, :]
+    scr = 3 * np.sqrt(np.einsum('...i,ij,...j->...', x, corr, x))
+    if isinstance(ri_basis, str):
+        sd, scr = sd[..., 0, :], scr[..., 0]
+        sd_pr, sd_resv = sd_pr[0], sd_resv[0]
+    return {'vol_p': vol_p, 'vol_r': vol_r, 'tot': tot, 'div_regions': div_regions, 'voldiv': voldiv,
+            'sd_pr': sd_pr, 'sd_resv': sd_resv, 'sd': sd, 'vol': voldiv.sum(axis=-1), 'scr': scr}
 
-    scr = 3 * vol * sd
 
-    if qrt_output:
-        # TODO: Add qrt output
-        return (scr, pr, sd)
+def _record(res: dict, keys, lobs: pd.Index, basis):
+    """ Records the detail by s2model for reporting, for the first ri_basis if several """
+    detail = {c: res[c] for c in ['vol_p', 'vol_r', 'tot', 'div_regions', 'voldiv']}
+    shape = res['tot'].shape
+    for c in ['sd_pr', 'sd_resv', 'sd']:
+        value = res[c] if basis is None else res[c][..., 0, :]
+        detail[c] = np.broadcast_to(value, shape)
+    if keys is None:
+        record('s26_05_01_premres', lobs=lobs, **{c: v[0] for c, v in detail.items()})
     else:
-        return scr
+        record('s26_05_01_premres', keys, lobs=lobs, **detail)
+
+
+def _divide(a, b):
+    return np.divide(a, b, out=np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b))), where=b != 0)
+
+
+def _volume_stack(volume_measures: pd.DataFrame, by: list, lobs: pd.Index):
+    """
+    (n_keys, region, lob, 2) array of the volumes, lobs not in the parameters are dropped
+    The regions are the index levels other than by & s2model.
+    """
+    index = volume_measures.index
+    if by:
+        groups = volume_measures.groupby(level=by, sort=True)
+        key, keys = groups.ngroup().to_numpy(), groups.size().index
+    else:
+        key, keys = np.zeros(len(index), int), None
+    n_keys = 1 if keys is None else len(keys)
+    other = [n for n in index.names if n not in by and n != 's2model']
+    if other:
+        region, regions = pd.MultiIndex.from_arrays([index.get_level_values(n) for n in other]).factorize()
+        n_regions = len(regions)
+    else:
+        region, n_regions = np.zeros(len(index), int), 1
+    lob = level_codes(index, 's2model', lobs)
+    keep = lob >= 0
+
+    cell = ((key * n_regions + region) * len(lobs) + lob)[keep]
+    size = n_keys * n_regions * len(lobs)
+    volumes = np.stack([np.bincount(cell, weights=np.nan_to_num(volume_measures[c].to_numpy(dtype=float))[keep],
+                                    minlength=size) for c in ['vol_p', 'vol_r']], axis=-1)
+    return volumes.reshape(n_keys, n_regions, len(lobs), 2), keys
+
+
+def _pr_table(res: dict, keys, lobs: pd.Index, basis) -> pd.DataFrame:
+    """ Detail by s2model as in the qrt output: vol_p, vol_r, tot, div_regions, voldiv, sd_pr, sd_resv, sd """
+    n_basis = 1 if basis is None else len(basis)
+    cols = {}
+    for c in ['vol_p', 'vol_r', 'tot', 'div_regions', 'voldiv']:
+        cols[c] = np.repeat(res[c][:, np.newaxis, :], n_basis, axis=1).ravel()
+    for c in ['sd_pr', 'sd_resv']:
+        cols[c] = np.broadcast_to(np.reshape(res[c], (1, n_basis, len(lobs))), (len(res['tot']), n_basis, len(lobs))).ravel()
+    cols['sd'] = np.reshape(res['sd'], (len(res['tot']), n_basis, len(lobs))).ravel()
+
+    levels = [] if keys is None else [keys]
+    if basis is not None:
+        levels.append(basis)
+    levels.append(lobs)
+    index = levels[0] if len(levels) == 1 else _product(levels)
+    return pd.DataFrame(cols, index=index)
+
+
+def _product(levels) -> pd.MultiIndex:
+    """ Cartesian product of indexes, which may themselves be MultiIndexes """
+    frames = [level.to_frame(index=False) for level in levels]
+    df = frames[0]
+    for f in frames[1:]:
+        df = df.merge(f, how='cross')
+    return pd.MultiIndex.from_frame(df)
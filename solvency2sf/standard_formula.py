@@ -0,0 +1,368 @@
+"""
+Standard formula engine
+
+Builds the full SCR from the sub-modules as a dependency graph:
+- market: equity, spread, concentration (interest, property & fx as inputs) -> scr_agg mkt_up / mkt_down
+- default: scr_def
+- non-life: premium & reserve, natcat & man-made liability cat, lapse (input) -> scr_agg nl_uw
+- health: NSLT premium & reserve, SLT & cat (inputs) -> scr_agg h_uw
+- life: input
+-> scr_agg bscr -> op_scr -> scr_total
+
+Each node is a function of the results of other nodes and/or of the inputs, named in its dependencies.
+Nodes whose dependencies are complete run concurrently on a thread or process pool, and the time spent in each
+node is recorded in StandardFormula.timings.
+Missing inputs are None, and a module without its inputs gives 0. A node given in the inputs is not calculated,
+e.g. inputs={'nl_cat': 1000.} uses a cat SCR calculated elsewhere.
+
+Incremental recalculation: after run, update(changes) only recalculates the nodes downstream of the inputs whose
+content changed (see content_hash). Intermediate results such as the cresta volumes, natcat scenario losses and
+the premium & reserve table are nodes, so are kept from the previous run, and a node whose result is unchanged
+does not trigger its dependents.
+
+While recording (see reporting) run & update record the S.25 / S.26 module tables, and the sub-modules their detail
+tables. The sub-module detail is only recorded by the nodes which run: record with the sequential or thread executors.
+
+Test data:
+from s2sf_tests.dummy_data import Dummy_Data
+dd = Dummy_Data()
+import pandas as pd
+equities = pd.DataFrame({'mv': [1000., 500.], 'exposure_type': ['type1', 'type2']})
+sf = StandardFormula()
+res = sf.run({'equities': equities, 'symmetric_adjustment': 0.05, 'type1': dd.type_1, 'type2': dd.type_2,
+              'life': 2000.}, executor='thread')
+res['scr']
+sf.timings
+res = sf.update({'symmetric_adjustment': 0.1})
+sf.timings  # only mkt_eq, mkt, bscr, op & scr
+"""
+import contextvars
+import hashlib
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+
+from .aggregation import scr_agg, scr_total
+from .default import scr_def
+from .mkt import concentration, equity, spread
+from .operational import op_scr
+from .reporting import active, record
+from .scr_nl.cat.reinsurance import TERMS
+from .scr_nl.premres.premres import scr_nl_premres
+
+
+# No reinsurance: every country keeps its gross loss
+NO_PROGRAMS = pd.DataFrame(columns=TERMS, dtype=float)
+NO_COVERS = pd.DataFrame(columns=['prog_id'], dtype=object)
+
+
+def _equity(equities, symmetric_adjustment):
+    if equities is None:
+        return 0.
+    return equity(equities, symmetric_adjustment or 0.)['scr']
+
+
+def _spread(bonds, securities):
+    return spread(bonds, securities)
+
+
+def _concentration(asset_list):
+    return 0. if asset_list is None else concentration(asset_list)
+
+
+def _mkt(mkt_int_up, mkt_int_down, mkt_eq, mkt_prop, mkt_spread, mkt_conc, mkt_fx):
+    """ Market SCR under the interest rate up & down correlations, the more onerous applies """
+    other = [mkt_eq or 0., mkt_prop or 0., mkt_spread or 0., mkt_conc or 0., mkt_fx or 0.]
+    return max(scr_agg(np.array([mkt_int_up or 0.] + other), 'mkt_up'),
+               scr_agg(np.array([mkt_int_down or 0.] + other), 'mkt_down'))
+
+
+def _default(type1, type2, counterparty_groups):
+    if type1 is None and type2 is None:
+        return 0.
+    if type1 is None:
+        type1 = pd.DataFrame(columns=['balance', 'rating', 'category', 'mitigation'], dtype=float)
+    if type2 is None:
+        type2 = pd.DataFrame({'balance': [0., 0.]}, index=['overdue_more3m', 'other'])
+    return scr_def(type1, type2, counterparty_groups, qrt_output=False)[0]
+
+
+def _premres_table(volume_measures, ins_sector='NL'):
+    """ (scr, pr table, sd) """
+    if volume_measures is None:
+        return 0., None, 0.
+    return scr_nl_premres(volume_measures, ins_sector, qrt_output=True)
+
+
+def _health_premres_table(health_volume_measures):
+    return _premres_table(health_volume_measures, 'H_NSLT')
+
+
+def _premres(premres_table):
+    return premres_table[0]
+
+
+def _cresta_volumes(sumsinsured):
+    if sumsinsured is None:
+        return None
+    from .scr_nl.cat.natcat_eur.natcat_eur import cresta_volumes
+    return cresta_volumes(sumsinsured)
+
+
+def _natcat_gross(cresta_volumes):
+    """ Gross scenario losses, as specified_loss & scenario_losses from the cresta volumes """
+    if cresta_volumes is None:
+        return None
+    from .scr_nl.cat.natcat_eur.natcat_eur import div_within_region, get_sl_factors, scenario_losses
+    return scenario_losses(div_within_region(cresta_volumes) * get_sl_factors())
+
+
+def _natcat_net(natcat_gross, programs, covers):
+    if natcat_gross is None:
+        return None
+    from .scr_nl.cat.natcat_eur.natcat_eur import natcat_reinsurance
+    return natcat_reinsurance(natcat_gross, NO_PROGRAMS if programs is None else programs,
+                              NO_COVERS if covers is None else covers)
+
+
+def _natcat(natcat_gross, natcat_net):
+    if natcat_gross is None:
+        return 0.
+    from .scr_nl.cat.natcat_eur.natcat_eur import diversify_between_countries, natcat_agg
+    return natcat_agg(*diversify_between_countries(natcat_gross, natcat_net))['net_loss']
+
+
+def _manmade_liab(liab_vol, programs, covers):
+    if liab_vol is None:
+        return 0.
+    from .scr_nl.cat.manmade.manmade import liab_batch
+    return float(liab_batch(liab_vol, NO_PROGRAMS if programs is None else programs,
+                            NO_COVERS if covers is None else covers)[1])
+
+
+def _cat(natcat, manmade_liab):
+    # Article 119: natcat & man-made are independent
+    return ((natcat or 0.) ** 2 + (manmade_liab or 0.) ** 2) ** 0.5
+
+
+def _nl(nl_pr, nl_cat, nl_lapse):
+    return scr_agg(np.array([nl_pr or 0., nl_cat or 0., nl_lapse or 0.]), 'nl_uw')
+
+
+def _health(h_nslt_pr, h_slt, h_cat):
+    return scr_agg(np.array([h_nslt_pr or 0., h_slt or 0., h_cat or 0.]), 'h_uw')
+
+
+def _bscr(mkt, default, life, h, nl):
+    return scr_agg(np.array([mkt or 0., default or 0., life or 0., h or 0., nl or 0.]), 'bscr')
+
+
+def _op(gep, gross_tp, ul_exp, bscr):
+    if gep is None:
+        return 0.
+    return op_scr(gep, gross_tp, ul_exp or 0., bscr)[0]
+
+
+# node: (function, dependencies in the order of the function arguments)
+DEFAULT_NODES = {
+    'mkt_eq': (_equity, ('equities', 'symmetric_adjustment')),
+    'mkt_spread': (_spread, ('bonds', 'securities')),
+    'mkt_conc': (_concentration, ('asset_list',)),
+    'mkt': (_mkt, ('mkt_int_up', 'mkt_int_down', 'mkt_eq', 'mkt_prop', 'mkt_spread', 'mkt_conc', 'mkt_fx')),
+    'def': (_default, ('type1', 'type2', 'counterparty_groups')),
+    'nl_pr_table': (_premres_table, ('volume_measures',)),
+    'nl_pr': (_premres, ('nl_pr_table',)),
+    'cresta_volumes': (_cresta_volumes, ('sumsinsured',)),
+    'natcat_gross': (_natcat_gross, ('cresta_volumes',)),
+    'natcat_net': (_natcat_net, ('natcat_gross', 'programs', 'covers')),
+    'natcat': (_natcat, ('natcat_gross', 'natcat_net')),
+    'manmade_liab': (_manmade_liab, ('liab_vol', 'programs', 'covers')),
+    'nl_cat': (_cat, ('natcat', 'manmade_liab')),
+    'nl': (_nl, ('nl_pr', 'nl_cat', 'nl_lapse')),
+    'h_nslt_pr_table': (_health_premres_table, ('health_volume_measures',)),
+    'h_nslt_pr': (_premres, ('h_nslt_pr_table',)),
+    'h': (_health, ('h_nslt_pr', 'h_slt', 'h_cat')),
+    'bscr': (_bscr, ('mkt', 'def', 'life', 'h', 'nl')),
+    'op': (_op, ('gep', 'gross_tp', 'ul_exp', 'bscr')),
+    'scr': (scr_total, ('bscr', 'op')),
+}
+
+
+def _timed(func, args):
+    start = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - start
+
+
+class StandardFormula:
+    """
+    Dependency graph of the standard formula modules
+    nodes: {name: (function, dependencies)}, defaults to DEFAULT_NODES
+    """
+
+    def __init__(self, nodes=None):
+        self.nodes = dict(DEFAULT_NODES if nodes is None else nodes)
+        self.timings = {}
+        self.inputs, self.results, self.hashes = {}, None, {}
+        self.order()
+
+    def add_node(self, name, func, dependencies=()):
+        """ Add or replace a node, func is called with the values of the dependencies """
+        previous = self.nodes.get(name)
+        self.nodes[name] = (func, tuple(dependencies))
+        try:
+            self.order()
+        except ValueError:
+            if previous is None:
+                del self.nodes[name]
+            else:
+                self.nodes[name] = previous
+            raise
+        return self
+
+    def order(self) -> list:
+        """ Nodes in levels, each level only depends on the previous ones """
+        remaining = {name: {d for d in deps if d in self.nodes} for name, (func, deps) in self.nodes.items()}
+        levels = []
+        while remaining:
+            level = sorted(name for name, deps in remaining.items() if not deps)
+            if not level:
+                raise ValueError(f'Circular dependency between nodes {sorted(remaining)}')
+            levels.append(level)
+            remaining = {name: deps.difference(level) for name, deps in remaining.items() if name not in level}
+        return levels
+
+    def run(self, inputs: dict = None, executor=None, max_workers=None) -> dict:
+        """
+        Calculates every node
+        inputs: {name: value} for the inputs, and any node results to use instead of calculating them
+        executor: None to run in this thread, 'thread' or 'process' for a pool, or a concurrent.futures.Executor
+        Returns {name: value} of the inputs and all the node results
+        """
+        self.inputs = dict(inputs or {})
+        self.hashes = {name: content_hash(value) for name, value in self.inputs.items()}
+        self.results = dict(self.inputs)
+        self._execute(None, executor, max_workers)
+        self._record()
+        return self.results
+
+    def update(self, changes: dict, executor=None, max_workers=None) -> dict:
+        """
+        Recalculates after changing some inputs, only the nodes depending on inputs whose content changed.
+        A node whose new result is the same as before does not trigger its dependents.
+        Returns {name: value} of the inputs and all the node results
+        """
+        if self.results is None:
+            raise ValueError('StandardFormula.run must be called before update')
+        dirty = set()
+        for name, value in changes.items():
+            h = content_hash(value)
+            if h != self.hashes.get(name):
+                dirty.add(name)
+                self.hashes[name] = h
+            self.inputs[name] = value
+            self.results[name] = value
+        self._execute(dirty, executor, max_workers)
+        self._record()
+        return self.results
+
+    def _record(self):
+        """ Records the module results for the QRT tables, if recording (see reporting) """
+        if not active():
+            return
+        res = {name: 0. if value is None else value for name, value in self.results.items()}
+        get = res.get
+        record('s25_01_01', mkt=get('mkt', 0.), default=get('def', 0.), life=get('life', 0.), health=get('h', 0.),
+               non_life=get('nl', 0.), bscr=get('bscr', 0.), op=get('op', 0.), scr=get('scr', 0.))
+        record('s26_01_01', interest=max(get('mkt_int_up', 0.), get('mkt_int_down', 0.)), equity=get('mkt_eq', 0.),
+               property=get('mkt_prop', 0.), spread=get('mkt_spread', 0.), concentration=get('mkt_conc', 0.),
+               currency=get('mkt_fx', 0.), mkt=get('mkt', 0.))
+        record('s26_05_01', premres=get('nl_pr', 0.), cat=get('nl_cat', 0.), lapse=get('nl_lapse', 0.),
+               non_life=get('nl', 0.))
+
+    def _execute(self, dirty, executor, max_workers):
+        """ Runs the nodes not given as inputs, dirty: changed inputs & nodes or None to calculate everything """
+        results = self.results
+        todo = {name: node for name, node in self.nodes.items() if name not in self.inputs}
+        self.timings = {}
+
+        def args(name):
+            return tuple(results.get(d) for d in todo[name][1])
+
+        def ready():
+            # Ready when no dependency is waiting, nodes with nothing changed upstream keep their previous result:
+            names = [name for name, (func, deps) in todo.items() if all(d not in todo for d in deps)]
+            needed = [name for name in names
+                      if dirty is None or name not in results or any(d in dirty for d in todo[name][1])]
+            for name in set(names).difference(needed):
+                del todo[name]
+            return needed
+
+        def done(name, value, elapsed):
+            results[name], self.timings[name] = value, elapsed
+            h = content_hash(value)
+            if dirty is not None and h != self.hashes.get(name):
+                dirty.add(name)
+            self.hashes[name] = h
+            del todo[name]
+
+        if executor is None:
+            while todo:
+                for name in ready():
+                    done(name, *_timed(todo[name][0], args(name)))
+            return
+
+        pool = executor
+        if executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers)
+        elif executor == 'process':
+            pool = ProcessPoolExecutor(max_workers)
+        # Threads run the nodes in a copy of this context, so they record to the active recorder (see reporting):
+        threads = isinstance(pool, ThreadPoolExecutor)
+        try:
+            running = {}
+            while todo or running:
+                for name in ready():
+                    if name not in running.values():
+                        call = (contextvars.copy_context().run, _timed) if threads else (_timed,)
+                        running[pool.submit(*call, todo[name][0], args(name))] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done(running.pop(future), *future.result())
+        finally:
+            if pool is not executor:
+                pool.shutdown()
+
+
+def content_hash(value) -> str:
+    """ Hash of the content of an input or result: frames, series, arrays, scalars and containers of these """
+    h = hashlib.blake2b(digest_size=16)
+    _update_hash(h, value)
+    return h.hexdigest()
+
+
+def _update_hash(h, value):
+    h.update(type(value).__name__.encode())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        labels = value.columns.tolist() if isinstance(value, pd.DataFrame) else value.name
+        h.update(repr((labels, value.index.names, value.dtypes if isinstance(value, pd.Series) else
+                       value.dtypes.tolist())).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            _update_hash(h, value[k])
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _update_hash(h, v)
+    elif value is None or isinstance(value, (str, bytes, int, float, np.generic)):
+        h.update(repr(value).encode())
+    else:
+        h.update(pickle.dumps(value))